@@ -0,0 +1,165 @@
+import numpy as np
+
+from form_answers import DONATION_DEFAULT_SELECTIONS, DONATION_FIXED_QUESTION, FARMER_FIXED_ANSWERS, FARMER_OPTIONS
+
+
+class AnswerTable:
+    """
+    The questions of a form as parallel lists of entry ids and option labels.
+    Answers are stored as option indices (codes) into these lists.
+    """
+
+    def __init__(self, entries, labels, names=None):
+        self.entries = list(entries)
+        self.labels = [list(options) for options in labels]
+        self.names = list(names) if names is not None else list(self.entries)
+        if any(len(options) > 255 for options in self.labels):
+            raise ValueError("Questions with more than 255 options are not supported")
+
+    @property
+    def option_counts(self):
+        return [len(options) for options in self.labels]
+
+    def decode(self, row):
+        """
+        Turn one row of codes into a dict of entry.XXXXXXX -> answer label
+        """
+        return {entry: options[code] for entry, options, code in zip(self.entries, self.labels, row)}
+
+
+def farmer_answer_table(entry):
+    """
+    AnswerTable of the farmer survey for the given field name -> entry mapping
+    """
+    return AnswerTable(
+        [entry[field] for field in FARMER_OPTIONS],
+        FARMER_OPTIONS.values(),
+        names=FARMER_OPTIONS.keys(),
+    )
+
+
+def donation_answer_table(questions):
+    """
+    AnswerTable of the donation survey built from the schema questions
+    """
+    questions = [question for question in questions if question["options"]]
+    return AnswerTable(
+        [question["entry"] for question in questions],
+        [question["options"] for question in questions],
+        names=[question["title"] or question["entry"] for question in questions],
+    )
+
+
+def farmer_fixed_codes(table):
+    """
+    Option index of every question in the non-randomized farmer response.
+    Some fixed answers aren't among the options drawn from when randomizing,
+    those are added to the table's options.
+    """
+    fixed = {}
+    for q, name in enumerate(table.names):
+        answer = FARMER_FIXED_ANSWERS[name]
+        if answer not in table.labels[q]:
+            table.labels[q].append(answer)
+        fixed[q] = table.labels[q].index(answer)
+    return fixed
+
+
+def donation_fixed_codes(questions, randomize):
+    """
+    Option indices the donation survey always answers with: the ninth
+    question, and every question when not randomizing (same rules as
+    build_donation_answers)
+    """
+    kept = [q for q, question in enumerate(questions) if question["options"]]
+    defaults = list(DONATION_DEFAULT_SELECTIONS.values())
+    fixed = {}
+    for column, q in enumerate(kept):
+        if q == DONATION_FIXED_QUESTION:
+            fixed[column] = 0
+        elif not randomize:
+            option_index = defaults[q] if q < len(defaults) else 0
+            fixed[column] = option_index if option_index < len(questions[q]["options"]) else 0
+    return fixed
+
+
+def _normalized_weights(table, q, weights):
+    if not weights:
+        return None
+    weight = weights.get(table.names[q], weights.get(table.entries[q]))
+    if weight is None:
+        return None
+    weight = np.asarray(weight, dtype=np.float64)
+    if weight.shape != (table.option_counts[q],) or (weight < 0).any() or weight.sum() <= 0:
+        raise ValueError(f"Bad weights for {table.names[q]}: expected {table.option_counts[q]} non-negative values")
+    return weight / weight.sum()
+
+
+def generate_answer_codes(table, num_responses, weights=None, seed=None, fixed=None):
+    """
+    Draw the answers of num_responses responses in one vectorized pass
+
+    Args:
+        table: AnswerTable of the form
+        num_responses: Number of responses to generate
+        weights: Optional dict of question name (or entry id) -> list of option
+            weights. Questions without weights pick their options uniformly.
+        seed: Seed for a reproducible dataset
+        fixed: Optional dict of question index -> option index always answered
+
+    Returns:
+        uint8 array of shape (num_responses, number of questions) holding the
+        option index chosen for every question of every response
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.empty((num_responses, len(table.entries)), dtype=np.uint8)
+    fixed = fixed or {}
+
+    for q, count in enumerate(table.option_counts):
+        if q in fixed:
+            codes[:, q] = fixed[q]
+            continue
+        p = _normalized_weights(table, q, weights)
+        if p is None:
+            codes[:, q] = rng.integers(0, count, size=num_responses, dtype=np.uint8)
+        else:
+            # Inverse CDF sampling: one uniform draw per response
+            cdf = np.cumsum(p)
+            cdf[-1] = 1.0
+            codes[:, q] = np.searchsorted(cdf, rng.random(num_responses), side="right")
+    return codes
+
+
+class AnswerBatch:
+    """
+    Pre-generated answers for a whole run. batch[i] returns the answers of
+    response i as a dict of entry.XXXXXXX -> label, so it can be shared by
+    concurrent workers.
+    """
+
+    def __init__(self, table, codes):
+        self.table = table
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.table.decode(self.codes[i].tolist())
+
+    def __iter__(self):
+        for row in self.codes:
+            yield self.table.decode(row.tolist())
+
+
+def farmer_answer_batch(entry, num_responses, weights=None, seed=None):
+    table = farmer_answer_table(entry)
+    return AnswerBatch(table, generate_answer_codes(table, num_responses, weights, seed))
+
+
+def donation_answer_batch(questions, num_responses, weights=None, seed=None):
+    table = donation_answer_table(questions)
+    # Same rule as the browser version: the ninth question is always answered
+    # with its first option
+    fixed = donation_fixed_codes(questions, randomize=True)
+    return AnswerBatch(table, generate_answer_codes(table, num_responses, weights, seed, fixed))
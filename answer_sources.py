@@ -0,0 +1,210 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from form_metrics import write_run_metrics
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="", encoding="utf-8")
+    return open(path, "r", newline="", encoding="utf-8")
+
+
+def iter_rows(path):
+    """
+    Read the rows of a CSV or JSONL file (optionally gzipped) one at a time
+
+    Yields:
+        One dict of column -> value per row
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as f:
+        if name.endswith(".csv"):
+            yield from csv.DictReader(f)
+        elif name.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"Unsupported answer file {path}, expected .csv or .jsonl")
+
+
+def build_column_map(entry=None, column_map=None):
+    """
+    Column name -> entry.XXXXXXX mapping. Columns named after the form fields
+    (see entry_mapping.json) are mapped through `entry`; columns already named
+    entry.XXXXXXX are used as they are.
+    """
+    mapping = dict(entry or {})
+    mapping.update(column_map or {})
+    return mapping
+
+
+def map_row(row, column_map):
+    """
+    Turn one input row into a dict of entry.XXXXXXX -> answer label, dropping
+    empty cells and columns that are not form questions
+    """
+    answers = {}
+    for column, value in row.items():
+        if value is None or value == "":
+            continue
+        entry_id = column_map.get(column, column if column.startswith("entry.") else None)
+        if entry_id:
+            answers[entry_id] = str(value)
+    return answers
+
+
+def stream_answers(path, entry=None, column_map=None, limit=None):
+    """
+    Lazily read the answers of every response stored in a CSV/JSONL file
+
+    Args:
+        path: Path of the .csv/.jsonl file (may be gzipped)
+        entry: Field name -> entry.XXXXXXX mapping of the form
+        column_map: Extra column name -> entry.XXXXXXX mappings
+        limit: Stop after this many rows
+
+    Yields:
+        One dict of entry.XXXXXXX -> answer label per row
+    """
+    mapping = build_column_map(entry, column_map)
+    for count, row in enumerate(iter_rows(path)):
+        if limit is not None and count >= limit:
+            return
+        yield map_row(row, mapping)
+
+
+def prefetch(iterable, maxsize=1000):
+    """
+    Read `iterable` on a background thread into a bounded queue. Reading stops
+    while the queue is full, so the producer never runs more than `maxsize`
+    items ahead of the submissions (backpressure).
+    """
+    items = queue.Queue(maxsize=maxsize)
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            items.put(_END)
+
+    threading.Thread(target=produce, name="answer-prefetch", daemon=True).start()
+    while True:
+        item = items.get()
+        if item is _END:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+
+def run_stream(answers, submit_one, concurrency=1):
+    """
+    Submit every item of an answer stream, with at most `concurrency`
+    submissions in flight. A new item is only taken from the stream when a
+    slot frees up, so memory use stays constant however long the stream is.
+
+    Args:
+        answers: Iterable of answer dicts
+        submit_one: Callable (index, answers) -> bool, True if confirmed
+        concurrency: Maximum number of submissions in flight
+
+    Returns:
+        Tuple of (successful submissions, attempted submissions)
+    """
+    successful_submissions = 0
+    attempted = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        for i, row in enumerate(answers):
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                successful_submissions += sum(1 for future in done if _succeeded(future))
+            in_flight.add(executor.submit(submit_one, i, row))
+            attempted += 1
+        done, _ = wait(in_flight)
+        successful_submissions += sum(1 for future in done if _succeeded(future))
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"All submissions completed! Successful: {successful_submissions}/{attempted} in {elapsed:.2f}s")
+    write_run_metrics()
+    return successful_submissions, attempted
+
+
+def _succeeded(future):
+    try:
+        return bool(future.result())
+    except Exception as e:
+        logger.error(f"Submission failed: {e}")
+        return False
+
+
+def submit_file_http(path, form_url=None, entry=None, column_map=None, concurrency=4, limit=None):
+    """
+    Replay the answer sets stored in a CSV/JSONL file against a form over HTTP
+
+    Args:
+        path: Path of the .csv/.jsonl file (may be gzipped)
+        form_url: Form URL, defaults to GOOGLE_FORM_BASE_PREFILL_URL
+        entry: Field name -> entry.XXXXXXX mapping, defaults to entry_mapping.json
+            if it exists
+        column_map: Extra column name -> entry.XXXXXXX mappings
+        concurrency: Maximum number of submissions in flight
+        limit: Stop after this many rows
+
+    Returns:
+        Number of confirmed submissions
+    """
+    from form_answers import load_entry_mapping
+    from http_submission import FormHTTPClient, form_page_count, submit_answers_once
+
+    form_url = form_url or os.getenv("GOOGLE_FORM_BASE_PREFILL_URL")
+    if entry is None and os.path.exists("entry_mapping.json"):
+        entry = load_entry_mapping()
+    page_count = form_page_count(form_url)
+    client = FormHTTPClient(pool_size=concurrency)
+
+    def submit_one(i, answers):
+        confirmed, status = submit_answers_once(client, form_url, answers, page_count)
+        if not confirmed:
+            logger.warning(f"Could not confirm if submission {i+1} was successful (HTTP {status})")
+        return confirmed
+
+    try:
+        successful_submissions, _ = run_stream(
+            prefetch(stream_answers(path, entry, column_map, limit), maxsize=concurrency * 4),
+            submit_one,
+            concurrency,
+        )
+    finally:
+        client.close()
+    return successful_submissions
+
+
+if __name__ == "__main__":
+    import sys
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    submit_file_http(sys.argv[1])
@@ -0,0 +1,80 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+RADIOGROUP_SELECTOR = 'div[role="radiogroup"]'
+LISTITEM_SELECTOR = 'div[role="listitem"]'
+
+# Selects the options of every question of the current page in one go.
+# arguments: question selector, {question index: option index or label},
+# what to pick for questions not in the map ("first", "random" or null to
+# leave them alone). Returns one result per question that was filled.
+BATCH_FILL_SCRIPT = """
+var questions = document.querySelectorAll(arguments[0]);
+var selections = arguments[1] || {};
+var rest = arguments[2];
+var results = [];
+
+function label(radio) {
+  return radio.getAttribute('data-value') || radio.getAttribute('aria-label') || radio.textContent.trim();
+}
+
+for (var q = 0; q < questions.length; q++) {
+  var explicit = selections.hasOwnProperty(q);
+  var wanted = explicit ? selections[q] : rest;
+  if (wanted === null || wanted === undefined) continue;
+  var radios = questions[q].querySelectorAll('div[role="radio"]');
+  // Questions without options (text, section headers) only matter if asked for
+  if (!radios.length && !explicit) continue;
+  var result = {question: q, ok: false, label: null, error: null};
+  results.push(result);
+  if (!radios.length) { result.error = 'no options'; continue; }
+
+  var radio = null;
+  if (wanted === 'first') radio = radios[0];
+  else if (wanted === 'random') radio = radios[Math.floor(Math.random() * radios.length)];
+  else if (typeof wanted === 'number') radio = radios[wanted] || null;
+  else {
+    for (var r = 0; r < radios.length; r++) {
+      if (label(radios[r]) === wanted) { radio = radios[r]; break; }
+    }
+  }
+  if (!radio) { result.error = 'option ' + wanted + ' not found'; continue; }
+
+  radio.scrollIntoView({block: 'center'});
+  radio.click();
+  result.label = label(radio);
+  result.ok = radio.getAttribute('aria-checked') === 'true';
+  if (!result.ok) result.error = 'not checked after click';
+}
+
+for (var key in selections) {
+  if (+key >= questions.length) results.push({question: +key, ok: false, label: null, error: 'no such question'});
+}
+return results;
+"""
+
+
+def fill_page(driver, selections=None, rest="first", question_selector=RADIOGROUP_SELECTOR):
+    """
+    Select the answers of a whole page with a single execute_script call
+    instead of several WebDriver round trips per question
+
+    Args:
+        driver: WebDriver showing the page
+        selections: Optional dict of question index (on this page) -> option
+            index or option label
+        rest: "first", "random" or None, what to select for the questions not
+            in `selections`
+        question_selector: CSS selector matching one element per question
+
+    Returns:
+        List of result dicts {question, ok, label, error}, one per question filled
+    """
+    # JSON object keys are strings, the script looks them up by index
+    selections = {str(question): option for question, option in (selections or {}).items()}
+    return driver.execute_script(BATCH_FILL_SCRIPT, question_selector, selections, rest)
+
+
+def failed_questions(results):
+    return [result for result in results if not result["ok"]]
@@ -0,0 +1,284 @@
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from form_answers import FARMER_OPTIONS
+from form_metrics import METRICS, percentile
+from mock_form_server import DONATION_FORM_ID, FARMER_FORM_ID, MockFormServer
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = "benchmark_results"
+
+BROWSER_PROCESS_NAMES = ("chrome", "chromedriver", "headless_shell")
+
+
+def _farmer_entry(server):
+    from form_schema import entry_mapping_from_schema, load_schema
+
+    return entry_mapping_from_schema(load_schema(server.form_url(FARMER_FORM_ID), refresh=True), list(FARMER_OPTIONS))
+
+
+def _run_http(server, n, args):
+    from http_submission import submit_form_http
+
+    return submit_form_http(n, randomize=True, base_url=server.form_url(FARMER_FORM_ID), entry=_farmer_entry(server))
+
+
+def _run_http_concurrent(server, n, args):
+    from concurrent_submission import submit_form_concurrent
+
+    return submit_form_concurrent(n, randomize=True, concurrency=args.concurrency,
+                                  base_url=server.form_url(FARMER_FORM_ID), entry=_farmer_entry(server))
+
+
+def _run_selenium(server, n, args):
+    from google_form_submission import submit_form
+
+    return submit_form(n, randomize=True, base_url=server.form_url(FARMER_FORM_ID), browser_profile=args.profile)
+
+
+def _run_selenium_manual(server, n, args):
+    from google_form_submission import submit_form_with_manual_fill
+
+    return submit_form_with_manual_fill(n, randomize=True, base_url=server.form_url(FARMER_FORM_ID),
+                                        browser_profile=args.profile, batch=args.batch)
+
+
+def _run_selenium_pool(server, n, args):
+    from driver_pool import submit_form_with_manual_fill_pool
+
+    report = submit_form_with_manual_fill_pool(n, randomize=True, workers=args.concurrency,
+                                               base_url=server.form_url(FARMER_FORM_ID), browser_profile=args.profile,
+                                               batch=args.batch)
+    return report["successful"]
+
+
+def _run_donation_selenium(server, n, args):
+    from single_page_form import submit_donation_survey
+
+    return submit_donation_survey(n, randomize=True, form_url=server.form_url(DONATION_FORM_ID),
+                                  browser_profile=args.profile, batch=args.batch)
+
+
+def _run_donation_http(server, n, args):
+    from http_submission import submit_donation_survey_http
+
+    return submit_donation_survey_http(n, randomize=True, form_url=server.form_url(DONATION_FORM_ID))
+
+
+def _run_donation_pool(server, n, args):
+    from driver_pool import submit_donation_survey_pool
+
+    report = submit_donation_survey_pool(n, randomize=True, workers=args.concurrency,
+                                         form_url=server.form_url(DONATION_FORM_ID), browser_profile=args.profile,
+                                         batch=args.batch)
+    return report["successful"]
+
+
+# Engine name -> (form it submits to, runner)
+ENGINES = {
+    "http": (FARMER_FORM_ID, _run_http),
+    "http-concurrent": (FARMER_FORM_ID, _run_http_concurrent),
+    "selenium": (FARMER_FORM_ID, _run_selenium),
+    "selenium-manual": (FARMER_FORM_ID, _run_selenium_manual),
+    "selenium-pool": (FARMER_FORM_ID, _run_selenium_pool),
+    "donation-selenium": (DONATION_FORM_ID, _run_donation_selenium),
+    "donation-http": (DONATION_FORM_ID, _run_donation_http),
+    "donation-pool": (DONATION_FORM_ID, _run_donation_pool),
+}
+
+
+class BrowserRSSSampler:
+    """
+    Samples the total resident memory of all Chrome/chromedriver processes
+    (read from /proc, so only on Linux) while a benchmark runs
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @staticmethod
+    def browser_rss_bytes():
+        total = 0
+        for status_path in glob.glob("/proc/[0-9]*/status"):
+            try:
+                with open(status_path) as f:
+                    status = f.read()
+            except OSError:
+                continue
+            name = status.split("\n", 1)[0].partition(":")[2].strip()
+            if not name.startswith(BROWSER_PROCESS_NAMES):
+                continue
+            for line in status.splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append(self.browser_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return {"rss_peak_mb": None, "rss_mean_mb": None}
+        return {
+            "rss_peak_mb": round(max(self.samples) / 2**20, 1),
+            "rss_mean_mb": round(sum(self.samples) / len(self.samples) / 2**20, 1),
+        }
+
+
+def run_benchmark(engine, num_submissions, args):
+    """
+    Run one engine against a fresh mock server
+
+    Returns:
+        Result dict: throughput, p50/p95/p99 latency, browser page load /
+        startup times and browser RSS
+    """
+    form_id, runner = ENGINES[engine]
+    METRICS.reset()
+    server = MockFormServer(latency=args.latency).start()
+    try:
+        with BrowserRSSSampler() as sampler:
+            start = time.perf_counter()
+            try:
+                reported = runner(server, num_submissions, args)
+                error = ""
+            except Exception as e:
+                logger.exception(f"Benchmark of {engine} failed: {e}")
+                reported, error = None, f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+        stats = server.state.snapshot()
+    finally:
+        server.stop()
+
+    latencies = stats["latencies"][form_id]
+    recorded = stats["responses"][form_id]
+    page_loads = METRICS.phase_samples("page_load")
+    startups = METRICS.phase_samples("driver_startup")
+    return {
+        "engine": engine,
+        "profile": args.profile,
+        "batch_fill": args.batch,
+        "submissions": num_submissions,
+        "recorded_responses": recorded,
+        "reported_successful": reported,
+        "error": error,
+        "elapsed_seconds": round(elapsed, 3),
+        "submissions_per_second": round(recorded / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_seconds": round(percentile(latencies, 0.50), 4),
+        "latency_p95_seconds": round(percentile(latencies, 0.95), 4),
+        "latency_p99_seconds": round(percentile(latencies, 0.99), 4),
+        "page_load_p50_seconds": round(percentile(page_loads, 0.50), 4) if page_loads else None,
+        "driver_startup_seconds": round(sum(startups) / len(startups), 3) if startups else None,
+        **sampler.summary(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def save_results(results, args, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(results_dir, f"{timestamp}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "timestamp": timestamp,
+            "revision": git_revision(),
+            "settings": {
+                "latency": args.latency, "concurrency": args.concurrency, "profile": args.profile, "batch_fill": args.batch
+            },
+            "results": results,
+        }, f, indent=2)
+    return path
+
+
+def print_results(results, baseline=None):
+    baseline = {result["engine"]: result for result in (baseline or [])}
+    print(f"{'engine':<18} {'ok':>6} {'sub/s':>9} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'load s':>8} {'rss MB':>8}")
+    for result in results:
+        page_load = result.get("page_load_p50_seconds")
+        line = (
+            f"{result['engine']:<18} {result['recorded_responses']:>6} {result['submissions_per_second']:>9.2f} "
+            f"{result['latency_p50_seconds']:>8.3f} {result['latency_p95_seconds']:>8.3f} "
+            f"{result['latency_p99_seconds']:>8.3f} {page_load if page_load is not None else '-':>8} "
+            f"{result['rss_peak_mb'] if result['rss_peak_mb'] is not None else '-':>8}"
+        )
+        previous = baseline.get(result["engine"])
+        if previous and previous["submissions_per_second"]:
+            change = result["submissions_per_second"] / previous["submissions_per_second"] - 1
+            line += f"  ({change:+.0%} sub/s vs baseline)"
+        if previous and previous.get("page_load_p50_seconds") and page_load is not None:
+            change = page_load / previous["page_load_p50_seconds"] - 1
+            line += f"  ({change:+.0%} page load)"
+        if previous and previous.get("rss_peak_mb") and result["rss_peak_mb"] is not None:
+            change = result["rss_peak_mb"] / previous["rss_peak_mb"] - 1
+            line += f"  ({change:+.0%} rss)"
+        if result["error"]:
+            line += f"  ERROR {result['error']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the submission engines against the local mock form server")
+    parser.add_argument("engines", nargs="*", default=["http", "http-concurrent", "donation-http"],
+                        help=f"Engines to run: {', '.join(ENGINES)}")
+    parser.add_argument("-n", "--submissions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated server latency per request")
+    parser.add_argument("--profile", choices=["standard", "lean"], default="standard",
+                        help="Browser profile of the selenium engines")
+    parser.add_argument("--batch", action="store_true",
+                        help="Fill each page with one injected script in the click-through selenium engines")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="Don't write the results file")
+    args = parser.parse_args(argv)
+
+    unknown = [engine for engine in args.engines if engine not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engine(s) {', '.join(unknown)}")
+
+    results = [run_benchmark(engine, args.submissions, args) for engine in args.engines]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+    if not args.no_save:
+        print(f"Results saved to {save_results(results, args)}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+FORMS = ("farmer", "donation")
+ENGINES = ("http", "selenium")
+
+# What each kind of job imports, for `cli.py startup`. Only the selenium
+# engines import selenium, the CLI itself imports nothing but the stdlib.
+STARTUP_IMPORTS = {
+    "python": "",
+    "cli": "import cli",
+    "http": "import http_submission, concurrent_submission",
+    "dry-run": "import dry_run",
+    "selenium": "import google_form_submission, single_page_form, driver_pool",
+}
+
+
+def _form_url(args):
+    if args.form_url:
+        return args.form_url
+    if args.form == "farmer":
+        return os.getenv("GOOGLE_FORM_BASE_PREFILL_URL")
+    from form_answers import DONATION_FORM_URL
+
+    return DONATION_FORM_URL
+
+
+def run(args, form_url):
+    """
+    Submit with the chosen engine, importing only the modules that engine needs
+
+    Returns:
+        Number of confirmed submissions
+    """
+    randomize = not args.no_randomize
+    farmer = args.form == "farmer"
+
+    if args.answers:
+        from answer_sources import submit_file_http
+
+        return submit_file_http(args.answers, form_url, concurrency=args.concurrency, limit=args.submissions)
+
+    if args.engine == "http" and args.concurrency > 1:
+        from concurrent_submission import submit_donation_survey_concurrent, submit_form_concurrent
+
+        if farmer:
+            return submit_form_concurrent(args.submissions, randomize, args.concurrency, args.rate, base_url=form_url,
+                                          weights=args.weights, seed=args.seed, job_id=args.job_id,
+                                          adaptive=args.adaptive, plan=args.plan)
+        return submit_donation_survey_concurrent(args.submissions, randomize, args.concurrency, args.rate,
+                                                 form_url=form_url, weights=args.weights, seed=args.seed,
+                                                 job_id=args.job_id, adaptive=args.adaptive, plan=args.plan)
+
+    if args.engine == "http":
+        from http_submission import submit_donation_survey_http, submit_form_http
+
+        if farmer:
+            return submit_form_http(args.submissions, randomize, base_url=form_url, weights=args.weights,
+                                    seed=args.seed, job_id=args.job_id, plan=args.plan)
+        return submit_donation_survey_http(args.submissions, randomize, form_url=form_url, weights=args.weights,
+                                           seed=args.seed, job_id=args.job_id, plan=args.plan)
+
+    from driver_manager import RecyclePolicy
+
+    recycle_policy = RecyclePolicy(args.max_driver_submissions or None, args.max_driver_rss_mb or None)
+    if args.concurrency > 1:
+        from driver_pool import submit_donation_survey_pool, submit_form_with_manual_fill_pool
+
+        if farmer:
+            return submit_form_with_manual_fill_pool(args.submissions, randomize, args.concurrency, form_url,
+                                                     job_id=args.job_id, browser_profile=args.browser_profile,
+                                                     batch=args.batch, recycle_policy=recycle_policy)
+        return submit_donation_survey_pool(args.submissions, randomize, args.concurrency, form_url, job_id=args.job_id,
+                                           browser_profile=args.browser_profile, batch=args.batch,
+                                           recycle_policy=recycle_policy, plan=args.plan)
+
+    if farmer:
+        from google_form_submission import submit_form
+
+        return submit_form(args.submissions, randomize, weights=args.weights, seed=args.seed, job_id=args.job_id,
+                           base_url=form_url, browser_profile=args.browser_profile, recycle_policy=recycle_policy,
+                           plan=args.plan)
+    from single_page_form import submit_donation_survey
+
+    return submit_donation_survey(args.submissions, randomize, form_url, job_id=args.job_id,
+                                  browser_profile=args.browser_profile, batch=args.batch,
+                                  recycle_policy=recycle_policy, plan=args.plan)
+
+
+def check_run_arguments(parser, args):
+    """
+    Reject the option combinations the chosen engine would silently ignore
+    """
+    farmer = args.form == "farmer"
+    selenium = args.engine == "selenium"
+    if args.answers and selenium:
+        parser.error("--answers is only supported by the http engine")
+    if args.plan and farmer and selenium and args.concurrency > 1:
+        parser.error("--plan with the farmer form needs --engine http or --concurrency 1")
+    if args.weights is not None and selenium and (args.concurrency > 1 or not farmer):
+        parser.error("--weights needs --engine http, or the farmer form with --concurrency 1")
+
+
+def dry_run(args, form_url):
+    from dry_run import dry_run_donation, dry_run_farmer
+
+    output = args.output or os.path.join("dry_run", f"{args.form}_answers.npy")
+    randomize = not args.no_randomize
+    if args.form == "farmer":
+        return dry_run_farmer(args.submissions, output, randomize, args.weights, args.seed, args.plan)
+    return dry_run_donation(args.submissions, output, randomize, form_url, args.weights, args.seed, args.plan)
+
+
+def discover(args):
+    from form_schema import load_schema
+
+    schema = load_schema(args.url, refresh=args.refresh)
+    print(json.dumps(schema, indent=2))
+    return schema
+
+
+def measure_startup(repeat=5):
+    """
+    Cold start time of each kind of job: a fresh interpreter importing what
+    the job needs, the median of `repeat` runs
+
+    Returns:
+        Dict of job kind -> seconds
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [repo_dir, os.getenv("PYTHONPATH")]))}
+    timing = "import time; start = time.perf_counter(); {}; print(time.perf_counter() - start)"
+    results = {}
+    # Importing the engines can create log files, keep them out of the way
+    with tempfile.TemporaryDirectory() as cwd:
+        for kind, statement in STARTUP_IMPORTS.items():
+            samples = []
+            for _ in range(repeat):
+                out = subprocess.run(
+                    [sys.executable, "-c", timing.format(statement or "pass")],
+                    capture_output=True, text=True, cwd=cwd, env=env, check=True,
+                )
+                samples.append(float(out.stdout.strip().splitlines()[-1]))
+            results[kind] = statistics.median(samples)
+    return results
+
+
+def print_startup(results):
+    baseline = results.get("python", 0.0)
+    print(f"{'job':<10} {'import s':>9} {'vs bare python':>15}")
+    for kind, seconds in results.items():
+        print(f"{kind:<10} {seconds:>9.3f} {seconds - baseline:>+15.3f}")
+
+
+def _add_job_arguments(command):
+    command.add_argument("--form", choices=FORMS, default="donation")
+    command.add_argument("--form-url", help="Defaults to the donation survey / GOOGLE_FORM_BASE_PREFILL_URL")
+    command.add_argument("-n", "--submissions", type=int,
+                         help="Defaults to 1, or with --answers to every row of the file")
+    command.add_argument("--no-randomize", action="store_true")
+    command.add_argument("--weights", type=json.loads, help='Option weights as JSON, e.g. \'{"location": [0.6, 0.4]}\'')
+    command.add_argument("--seed", type=int)
+    command.add_argument("--plan", help="JSON file of exact quotas and conditional rules (see response_planner.py)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit Google Forms")
+    parser.add_argument("--log-level", help="Defaults to LOG_LEVEL or INFO")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_command = commands.add_parser("run", help="Submit a form")
+    _add_job_arguments(run_command)
+    run_command.add_argument("--engine", choices=ENGINES, default="http")
+    run_command.add_argument("--mock", action="store_true", help="Submit to a local mock form server instead")
+    run_command.add_argument("--concurrency", type=int, default=1,
+                             help="Submissions in flight (http) or browsers (selenium)")
+    run_command.add_argument("--rate", type=float, help="Max submissions per second (http with --concurrency > 1)")
+    run_command.add_argument("--adaptive", action="store_true",
+                             help="Adapt the submissions in flight to latency and errors, up to --concurrency (http)")
+    run_command.add_argument("--job-id", help="Journal progress under this id, a re-run resumes")
+    run_command.add_argument("--answers", help="CSV/JSONL file of answer sets to replay (http)")
+    run_command.add_argument("--browser-profile", choices=["standard", "lean"], default="standard")
+    run_command.add_argument("--batch", action="store_true", help="Fill each page with one injected script (selenium)")
+    run_command.add_argument("--max-driver-submissions", type=int, default=100,
+                             help="Replace a browser after this many submissions, 0 for never (selenium)")
+    run_command.add_argument("--max-driver-rss-mb", type=float, default=1024,
+                             help="Replace a browser once it uses this much memory, 0 for no limit (selenium)")
+
+    dry_run_command = commands.add_parser("dry-run", help="Write the answers a run would send, without sending them")
+    _add_job_arguments(dry_run_command)
+    dry_run_command.add_argument("-o", "--output", help="Output .npy or .csv file, defaults to dry_run/<form>_answers.npy")
+
+    discover_command = commands.add_parser("discover", help="Fetch and cache the schema of a form")
+    discover_command.add_argument("url")
+    discover_command.add_argument("--refresh", action="store_true", help="Fetch again even if cached")
+
+    benchmark_command = commands.add_parser("benchmark", help="Run benchmark.py against the mock form",
+                                            add_help=False)
+    benchmark_command.add_argument("benchmark_args", nargs=argparse.REMAINDER)
+
+    startup_command = commands.add_parser("startup", help="Measure the cold start time of each kind of job")
+    startup_command.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        check_run_arguments(run_command, args)
+    if args.submissions is None and args.command in ("run", "dry-run") and not getattr(args, "answers", None):
+        args.submissions = 1
+
+    from dotenv import load_dotenv
+    from form_logging import setup_logging
+
+    load_dotenv()
+    setup_logging(level=args.log_level)
+
+    if args.command == "discover":
+        return discover(args)
+    if args.command == "benchmark":
+        import benchmark
+
+        return benchmark.main(args.benchmark_args)
+    if args.command == "startup":
+        results = measure_startup(args.repeat)
+        print_startup(results)
+        return results
+
+    if args.command == "run" and args.mock:
+        from mock_form_server import DONATION_FORM_ID, FARMER_FORM_ID, MockFormServer
+
+        mock_server = MockFormServer().start()
+        try:
+            return run(args, mock_server.form_url(FARMER_FORM_ID if args.form == "farmer" else DONATION_FORM_ID))
+        finally:
+            mock_server.stop()
+    form_url = _form_url(args)
+    if args.command == "dry-run":
+        return dry_run(args, form_url)
+    return run(args, form_url)
+
+
+if __name__ == "__main__":
+    main()
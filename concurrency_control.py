@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from form_metrics import METRICS, percentile
+from retry_policy import NAVIGATION_TIMEOUT, NOT_CONFIRMED, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Failure kinds that cut the limit at once
+CONGESTION_KINDS = {RATE_LIMITED: "rate_limited", NAVIGATION_TIMEOUT: "timeout"}
+
+
+class AIMDController:
+    """
+    Adapts how many submissions are in flight to what the form server takes,
+    like TCP congestion control: additive increase, multiplicative decrease.
+
+    Every attempt reports its latency and failure kind. Once a full round of
+    attempts (as many as the current limit) went through with the p95
+    latency and the error rate of the recent window within their targets,
+    the limit goes up by `increase`. A timeout, an HTTP 429 or a jump of the
+    unconfirmed rate multiplies it by `decrease` right away, at most once per
+    round so the attempts that were already in flight don't cut it again.
+
+    Workers take a slot around each submission:
+
+        with controller.slot():
+            submit(...)
+
+    Args:
+        initial: Starting limit
+        min_limit: The limit never goes below this
+        max_limit: Nor above this, usually the number of worker threads
+        target_p95: p95 latency (seconds) under which the limit may grow
+        max_error_rate: Failed attempts (0-1) in the window under which the
+            limit may grow
+        max_unconfirmed_rate: Unconfirmed attempts (0-1) in the window that
+            cut the limit
+        increase: Added to the limit per round
+        decrease: Factor the limit is multiplied by on a cut
+        window: Number of recent attempts the statistics are computed over
+        min_samples: Attempts needed in the window before it's judged
+        name: Label of the decision metrics
+        history: Number of recent decisions kept in `decisions`
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=32, target_p95=3.0, max_error_rate=0.05,
+                 max_unconfirmed_rate=0.2, increase=1.0, decrease=0.5, window=50, min_samples=5, name="http",
+                 history=1000):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.max_unconfirmed_rate = max_unconfirmed_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.min_samples = min_samples
+        self.name = name
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.kinds = deque(maxlen=window)
+        # The recent decisions, the total is in decision_count
+        self.decisions = deque(maxlen=history)
+        self.decision_count = 0
+        self._round = 0
+        self._since_cut = None
+        self._condition = threading.Condition()
+        self._publish()
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.current_limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the `current_limit` slots, waiting for one if needed
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record(self, seconds, kind=None):
+        """
+        Report one attempt
+
+        Args:
+            seconds: How long the attempt took
+            kind: Failure kind of the attempt (see retry_policy), None if it
+                was confirmed
+        """
+        with self._condition:
+            self.latencies.append(seconds)
+            self.kinds.append(kind)
+            self._round += 1
+            if self._since_cut is not None:
+                self._since_cut += 1
+
+            reason = CONGESTION_KINDS.get(kind)
+            if reason is None and kind == NOT_CONFIRMED and self._enough_samples():
+                if self.kinds.count(NOT_CONFIRMED) / len(self.kinds) > self.max_unconfirmed_rate:
+                    reason = "unconfirmed"
+            if reason:
+                self._cut(reason)
+            elif self._round >= self.current_limit and self._enough_samples():
+                self._round = 0
+                self._grow()
+            self._condition.notify_all()
+
+    def _enough_samples(self):
+        return len(self.kinds) >= self.min_samples
+
+    def stats(self):
+        """
+        Tuple of (p95 latency, error rate, unconfirmed rate) of the window
+        """
+        if not self.kinds:
+            return 0.0, 0.0, 0.0
+        errors = sum(1 for kind in self.kinds if kind is not None)
+        return (
+            percentile(list(self.latencies), 0.95),
+            errors / len(self.kinds),
+            self.kinds.count(NOT_CONFIRMED) / len(self.kinds),
+        )
+
+    def _grow(self):
+        p95, error_rate, _ = self.stats()
+        if p95 > self.target_p95:
+            self._decide("hold", "latency")
+        elif error_rate > self.max_error_rate:
+            self._decide("hold", "errors")
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + self.increase)
+            self._decide("increase", "healthy")
+
+    def _cut(self, reason):
+        # Attempts started before the last cut report afterwards, one cut per round
+        if self._since_cut is not None and self._since_cut < self.current_limit:
+            return
+        if self.limit <= self.min_limit:
+            self._decide("hold", reason)
+            return
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._since_cut = 0
+        self._round = 0
+        self._decide("decrease", reason)
+        # The window described the old limit, judge the new one on its own
+        self.kinds.clear()
+        self.latencies.clear()
+
+    def _decide(self, action, reason):
+        p95, error_rate, unconfirmed_rate = self.stats()
+        self.decisions.append((time.monotonic(), action, reason, self.current_limit))
+        self.decision_count += 1
+        METRICS.count_concurrency_decision(action, reason, controller=self.name)
+        self._publish(p95, error_rate, unconfirmed_rate)
+        if action != "hold":
+            logger.info(f"Concurrency {action}d to {self.current_limit} ({reason}, p95 {p95:.2f}s, "
+                        f"errors {error_rate:.0%}, unconfirmed {unconfirmed_rate:.0%})")
+
+    def _publish(self, p95=0.0, error_rate=0.0, unconfirmed_rate=0.0):
+        METRICS.set_gauge("concurrency_limit", self.current_limit, controller=self.name)
+        METRICS.set_gauge("concurrency_p95_seconds", round(p95, 4), controller=self.name)
+        METRICS.set_gauge("concurrency_error_rate", round(error_rate, 4), controller=self.name)
+        METRICS.set_gauge("concurrency_unconfirmed_rate", round(unconfirmed_rate, 4), controller=self.name)
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from form_answers import (
+    DONATION_FORM_URL,
+    FARMER_PAGE_COUNT,
+    build_donation_answers,
+    build_farmer_answers,
+    load_entry_mapping,
+)
+from form_metrics import METRICS, write_run_metrics
+from form_schema import load_schema, schema_page_count, schema_questions
+from http_submission import FormHTTPClient, form_page_count, submit_answers
+from job_journal import FAILED, OK, UNCONFIRMED, open_journal
+from retry_policy import NOT_CONFIRMED, CircuitBreaker, call_with_retries, classify
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SubmissionOutcome:
+    index: int
+    success: bool
+    seconds: float
+    error: str = ""
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: allows `rate` submissions per second on average
+    with bursts of up to `capacity`
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+async def run_submissions(submit_one, num_submissions, concurrency=8, rate=None, burst=None, journal=None):
+    """
+    Run submit_one(index) for every submission index keeping at most
+    `concurrency` of them in flight
+
+    Args:
+        submit_one: Blocking callable taking the submission index and returning
+            True if the submission was confirmed. It runs in a worker thread.
+        num_submissions: Number of submissions
+        concurrency: Maximum number of submissions in flight
+        rate: Optional cap on submissions started per second
+        burst: Token bucket capacity, defaults to one second worth of `rate`
+        journal: Optional JobJournal, indices it has as done are skipped and
+            every outcome is recorded in it
+
+    Returns:
+        List of SubmissionOutcome, ordered by submission index (None for the
+        submissions skipped because the journal has them as done)
+    """
+    loop = asyncio.get_running_loop()
+    bucket = TokenBucket(rate, burst) if rate else None
+    outcomes = [None] * num_submissions
+    next_index = iter(journal.pending(num_submissions) if journal else range(num_submissions))
+
+    async def worker(executor):
+        for i in next_index:
+            if bucket:
+                await bucket.acquire()
+            start = time.perf_counter()
+            try:
+                success = bool(await loop.run_in_executor(executor, submit_one, i))
+                error = ""
+            except Exception as e:
+                success, error = False, f"{type(e).__name__}: {e}"
+            outcomes[i] = SubmissionOutcome(i, success, time.perf_counter() - start, error)
+            if journal:
+                journal.record(i, OK if success else FAILED if error else UNCONFIRMED)
+            if success:
+                logger.info(f"Submission {i+1}/{num_submissions} confirmed successful")
+            else:
+                logger.warning(f"Could not confirm submission {i+1}/{num_submissions} {error}".rstrip())
+
+    workers = max(1, min(concurrency, num_submissions))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        await asyncio.gather(*(worker(executor) for _ in range(workers)))
+    return outcomes
+
+
+def run_concurrent(submit_one, num_submissions, concurrency=8, rate=None, burst=None, job_id=None):
+    """
+    Blocking wrapper around run_submissions that prints the run summary
+
+    Args:
+        job_id: Optional job id to journal progress under, a re-run with the
+            same job id resumes where the previous one stopped
+        (see run_submissions for the other arguments)
+
+    Returns:
+        Tuple of (number of successful submissions, list of SubmissionOutcome)
+    """
+    journal = open_journal(job_id)
+    start = time.perf_counter()
+    try:
+        outcomes = asyncio.run(run_submissions(submit_one, num_submissions, concurrency, rate, burst, journal))
+    finally:
+        if journal:
+            journal.close()
+    elapsed = time.perf_counter() - start
+
+    outcomes = [outcome for outcome in outcomes if outcome is not None]
+    throughput = len(outcomes) / elapsed if elapsed else 0.0
+    if journal:
+        # Read after the run, so it counts this run's confirmed submissions
+        # as well as those of the runs it resumed
+        successful_submissions = journal.confirmed_count
+    else:
+        successful_submissions = sum(1 for outcome in outcomes if outcome.success)
+    print(f"All submissions completed! Successful: {successful_submissions}/{num_submissions}")
+    print(f"Elapsed {elapsed:.2f}s, throughput {throughput:.2f} submissions/s (concurrency={concurrency}, rate={rate})")
+    for outcome in outcomes:
+        if not outcome.success:
+            print(f"  submission {outcome.index+1}: failed after {outcome.seconds:.2f}s {outcome.error}".rstrip())
+    METRICS.set_gauge("throughput_submissions_per_second", round(throughput, 3), engine="http")
+    write_run_metrics()
+    return successful_submissions, outcomes
+
+
+def submit_form_concurrent(num_submissions=1, randomize=False, concurrency=8, rate=None,
+                           base_url=None, entry=None, page_count=None, weights=None, seed=None, job_id=None,
+                           adaptive=False, plan=None):
+    """
+    Submit the farmer survey over HTTP with several submissions in flight
+
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize some of the answers
+        concurrency: Maximum number of submissions in flight
+        rate: Optional cap on submissions per second
+        base_url: Form URL, defaults to GOOGLE_FORM_BASE_PREFILL_URL
+        entry: Field name -> entry.XXXXXXX mapping, defaults to entry_mapping.json
+        page_count: Number of sections of the form, defaults to the number in
+            the form schema
+        weights: Optional dict of field name -> option weights used when randomizing
+        seed: Seed for reproducible random answers
+        job_id: Optional job id to journal progress under, a re-run with the
+            same job id resumes where the previous one stopped
+        adaptive: Adapt the number of submissions in flight to the observed
+            latency and errors (an AIMDController, or True for one with the
+            defaults), `concurrency` is then the upper bound
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly (a dict or JSON file, see response_planner.plan_codes)
+
+    Returns:
+        Number of confirmed submissions
+    """
+    base_url = base_url or os.getenv("GOOGLE_FORM_BASE_PREFILL_URL")
+    if entry is None:
+        entry = load_entry_mapping(form_url=base_url)
+    if page_count is None:
+        page_count = form_page_count(base_url, FARMER_PAGE_COUNT)
+    if plan is not None:
+        from response_planner import plan_farmer_responses
+
+        planned = plan_farmer_responses(entry, num_submissions, plan, weights, seed, randomize)
+        make_answers = planned.__getitem__
+    elif randomize:
+        # numpy is only imported when answers are generated
+        from answer_generation import farmer_answer_batch
+
+        make_answers = farmer_answer_batch(entry, num_submissions, weights, seed).__getitem__
+    else:
+        make_answers = lambda i: build_farmer_answers(entry)
+    return _run_http(base_url, make_answers, page_count, num_submissions, concurrency, rate, job_id, adaptive)
+
+
+def submit_donation_survey_concurrent(num_submissions=1, randomize=False, concurrency=8, rate=None,
+                                      form_url=DONATION_FORM_URL, weights=None, seed=None, job_id=None,
+                                      adaptive=False, plan=None):
+    """
+    Submit the donation survey over HTTP with several submissions in flight
+
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize the answers
+        concurrency: Maximum number of submissions in flight
+        rate: Optional cap on submissions per second
+        form_url: URL of the form
+        weights: Optional dict of question title (or entry id) -> option
+            weights used when randomizing
+        seed: Seed for reproducible random answers
+        job_id: Optional job id to journal progress under
+        adaptive: Adapt the number of submissions in flight, see
+            submit_form_concurrent
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly (see response_planner.plan_codes)
+
+    Returns:
+        Number of confirmed submissions, the same count submit_donation_survey prints
+    """
+    schema = load_schema(form_url)
+    questions = schema_questions(schema)
+    if plan is not None:
+        from response_planner import plan_donation_responses
+
+        planned = plan_donation_responses(questions, num_submissions, plan, weights, seed, randomize)
+        make_answers = planned.__getitem__
+    elif randomize:
+        from answer_generation import donation_answer_batch
+
+        make_answers = donation_answer_batch(questions, num_submissions, weights, seed).__getitem__
+    else:
+        make_answers = lambda i: build_donation_answers(questions)
+    return _run_http(form_url, make_answers, schema_page_count(schema), num_submissions, concurrency, rate, job_id,
+                     adaptive)
+
+
+def _run_http(form_url, make_answers, page_count, num_submissions, concurrency, rate, job_id=None, adaptive=False):
+    client = FormHTTPClient(pool_size=concurrency)
+    # Shared by all workers: they all pause when the error rate spikes
+    breaker = CircuitBreaker()
+    controller = adaptive
+    if adaptive is True:
+        from concurrency_control import AIMDController
+
+        controller = AIMDController(initial=min(2, concurrency), max_limit=concurrency)
+
+    def attempt(answers):
+        if not controller:
+            return submit_answers(client, form_url, answers, page_count)[0]
+        # The slot is held per attempt, not through the retry backoff, and
+        # every attempt, retries included, tells the controller how the
+        # server copes
+        with controller.slot():
+            start = time.perf_counter()
+            try:
+                confirmed = submit_answers(client, form_url, answers, page_count)[0]
+            except Exception as e:
+                controller.record(time.perf_counter() - start, classify(e).kind)
+                raise
+            controller.record(time.perf_counter() - start, None if confirmed else NOT_CONFIRMED)
+            return confirmed
+
+    def submit_one(i):
+        answers = make_answers(i)
+        result = call_with_retries(
+            lambda: attempt(answers),
+            breaker=breaker,
+            label=f"Submission {i+1}/{num_submissions}",
+        )
+        if result.attempts:
+            METRICS.count_submission(result.outcome, engine="http")
+        if result.failure is not None and not result.failure.submitted:
+            # Never reached the form, journaled as failed so a resume retries it
+            raise result.failure
+        return result.confirmed
+
+    try:
+        successful_submissions, _ = run_concurrent(submit_one, num_submissions, concurrency, rate, job_id=job_id)
+    finally:
+        client.close()
+    if controller:
+        print(f"Adaptive concurrency ended at {controller.current_limit} (max {concurrency}), "
+              f"{controller.decision_count} decisions")
+    return successful_submissions
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    submit_form_concurrent(num_submissions=25, randomize=True, concurrency=8, rate=5)
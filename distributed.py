@@ -0,0 +1,562 @@
+import argparse
+import json
+import logging
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from form_answers import DONATION_FORM_URL, FARMER_PAGE_COUNT, build_donation_answers, build_farmer_answers
+
+logger = logging.getLogger(__name__)
+
+FORMS = ("farmer", "donation")
+WORKER_ENGINES = ("http", "selenium")
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+
+class Chunk:
+    """
+    A range of submission indices [start, stop) handed out as a unit
+    """
+
+    def __init__(self, chunk_id, start, stop):
+        self.id = chunk_id
+        self.start = start
+        self.stop = stop
+        self.state = PENDING
+        self.token = None
+        self.worker = None
+        self.lease_expires = 0.0
+        self.leases = 0
+        self.successful = 0
+        self.attempted = 0
+
+
+class Coordinator:
+    """
+    Splits a submission job into chunks and leases them to workers. A lease
+    that is neither renewed nor completed in time goes back to the pending
+    chunks and is handed to the next worker asking for work.
+
+    Args:
+        form: "farmer" or "donation"
+        form_url: URL of the form (the prefill URL for the farmer survey)
+        num_submissions: Total number of submissions
+        chunk_size: Submissions per lease
+        lease_seconds: How long a worker may hold a chunk without renewing it
+        randomize: Whether to randomize the answers
+        weights: Optional option weights used when randomizing
+        seed: Seed for reproducible random answers
+        engine: What the workers submit with, "http" or "selenium"
+        concurrency: Submissions in flight per worker (http engine)
+    """
+
+    def __init__(self, form, form_url, num_submissions, chunk_size=50, lease_seconds=120, randomize=False,
+                 weights=None, seed=None, engine="http", concurrency=4):
+        if form not in FORMS:
+            raise ValueError(f"Unknown form {form!r}, expected one of {', '.join(FORMS)}")
+        if engine not in WORKER_ENGINES:
+            raise ValueError(f"Unknown worker engine {engine!r}, expected one of {', '.join(WORKER_ENGINES)}")
+        self.form = form
+        self.form_url = form_url
+        self.num_submissions = num_submissions
+        self.lease_seconds = lease_seconds
+        self.engine = engine
+        self.concurrency = concurrency
+        self.chunks = [
+            Chunk(chunk_id, start, min(start + chunk_size, num_submissions))
+            for chunk_id, start in enumerate(range(0, num_submissions, chunk_size))
+        ]
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        if not self.chunks:
+            self.finished.set()
+        self.reassigned = 0
+        self.duplicates = 0
+        self.per_worker = {}
+        self.started = None
+        self.elapsed = None
+        self._prepare_answers(randomize, weights, seed)
+
+    def _prepare_answers(self, randomize, weights, seed):
+        # All answers are drawn up front in one vectorized pass (see
+        # answer_generation.py), leases just slice them
+        if self.form == "farmer":
+            from form_answers import load_entry_mapping
+
+            entry = load_entry_mapping(form_url=self.form_url)
+            self.page_count = self._page_count(FARMER_PAGE_COUNT)
+            if randomize:
+                from answer_generation import farmer_answer_batch
+
+                self._answers = farmer_answer_batch(entry, self.num_submissions, weights, seed)
+            else:
+                answers = build_farmer_answers(entry)
+                self._answers = lambda: answers
+        else:
+            from form_schema import load_schema, schema_page_count, schema_questions
+
+            schema = load_schema(self.form_url)
+            questions = schema_questions(schema)
+            self.page_count = schema_page_count(schema)
+            if randomize:
+                from answer_generation import donation_answer_batch
+
+                self._answers = donation_answer_batch(questions, self.num_submissions, weights, seed)
+            else:
+                answers = build_donation_answers(questions)
+                self._answers = lambda: answers
+
+    def _page_count(self, default):
+        from http_submission import form_page_count
+
+        return form_page_count(self.form_url, default)
+
+    def _chunk_answers(self, chunk):
+        if callable(self._answers):
+            return [self._answers() for _ in range(chunk.start, chunk.stop)]
+        return [self._answers[i] for i in range(chunk.start, chunk.stop)]
+
+    def _worker_stats(self, worker):
+        return self.per_worker.setdefault(worker, {"chunks": 0, "successful": 0, "attempted": 0, "seconds": 0.0})
+
+    def lease(self, worker):
+        """
+        Hand the next pending (or expired) chunk to `worker`
+
+        Returns:
+            Lease dict, {"done": True} once every chunk is done, or None if
+            all remaining chunks are leased to other workers right now
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            for chunk in self.chunks:
+                if chunk.state == LEASED and chunk.lease_expires < now:
+                    logger.warning(f"Lease of chunk {chunk.id} held by {chunk.worker} expired, reassigning it")
+                    chunk.state = PENDING
+                    self.reassigned += 1
+            chunk = next((chunk for chunk in self.chunks if chunk.state == PENDING), None)
+            if chunk is None:
+                return {"done": True} if self.finished.is_set() else None
+            chunk.state = LEASED
+            chunk.token = secrets.token_hex(8)
+            chunk.worker = worker
+            chunk.lease_expires = now + self.lease_seconds
+            chunk.leases += 1
+
+        logger.info(f"Leased chunk {chunk.id} ({chunk.start}-{chunk.stop - 1}) to {worker}")
+        return {
+            "chunk_id": chunk.id,
+            "token": chunk.token,
+            "start": chunk.start,
+            "stop": chunk.stop,
+            "lease_seconds": self.lease_seconds,
+            "job": {
+                "form": self.form,
+                "form_url": self.form_url,
+                "engine": self.engine,
+                "page_count": self.page_count,
+                "concurrency": self.concurrency,
+            },
+            "answers": self._chunk_answers(chunk),
+        }
+
+    def renew(self, chunk_id, token):
+        with self.lock:
+            chunk = self.chunks[chunk_id]
+            if chunk.state != LEASED or chunk.token != token:
+                return False
+            chunk.lease_expires = time.monotonic() + self.lease_seconds
+            return True
+
+    def release(self, chunk_id, token):
+        """
+        Give a leased chunk back, e.g. because its worker could not submit
+        it. It is pending again and goes to the next worker asking for work.
+        """
+        with self.lock:
+            chunk = self.chunks[chunk_id]
+            if chunk.state != LEASED or chunk.token != token:
+                return False
+            chunk.state = PENDING
+            chunk.token = None
+        logger.warning(f"Chunk {chunk_id} released by {chunk.worker}, it will be leased again")
+        return True
+
+    def complete(self, chunk_id, token, worker, successful, attempted, seconds):
+        """
+        Record the result of a chunk. A result that arrives after the lease
+        expired still counts if no other worker finished the chunk first;
+        otherwise the chunk was submitted twice and it is counted as a
+        duplicate.
+        """
+        with self.lock:
+            chunk = self.chunks[chunk_id]
+            stats = self._worker_stats(worker)
+            stats["attempted"] += attempted
+            stats["successful"] += successful
+            stats["seconds"] += seconds
+            if chunk.state == DONE:
+                logger.warning(f"Chunk {chunk_id} was already completed, {worker} submitted it again")
+                self.duplicates += attempted
+                return False
+            if chunk.token != token:
+                logger.warning(f"Late result for chunk {chunk_id} from {worker}, accepting it")
+            chunk.state = DONE
+            chunk.worker = worker
+            chunk.successful = successful
+            chunk.attempted = attempted
+            stats["chunks"] += 1
+            if all(chunk.state == DONE for chunk in self.chunks):
+                self.elapsed = time.perf_counter() - (self.started or time.perf_counter())
+                self.finished.set()
+        logger.info(f"Chunk {chunk_id} done by {worker}: {successful}/{attempted} confirmed")
+        return True
+
+    def report(self):
+        with self.lock:
+            successful = sum(chunk.successful for chunk in self.chunks)
+            attempted = sum(chunk.attempted for chunk in self.chunks)
+            if self.elapsed is not None:
+                elapsed = self.elapsed
+            elif self.started is not None:
+                elapsed = time.perf_counter() - self.started
+            else:
+                elapsed = 0.0
+            return {
+                "form": self.form,
+                "engine": self.engine,
+                "num_submissions": self.num_submissions,
+                "successful": successful,
+                "attempted": attempted,
+                "chunks": len(self.chunks),
+                "chunks_done": sum(1 for chunk in self.chunks if chunk.state == DONE),
+                "reassigned_leases": self.reassigned,
+                "duplicate_submissions": self.duplicates,
+                "finished": self.finished.is_set(),
+                "elapsed_seconds": round(elapsed, 3),
+                "submissions_per_second": round(attempted / elapsed, 3) if elapsed else 0.0,
+                "per_worker": {
+                    worker: {**stats, "seconds": round(stats["seconds"], 3)} for worker, stats in self.per_worker.items()
+                },
+            }
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/report":
+            return self._send(200, self.server.coordinator.report())
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        try:
+            body = self._body()
+            if self.path == "/lease":
+                lease = coordinator.lease(body.get("worker", self.client_address[0]))
+                return self._send(200, lease) if lease is not None else self._send(204)
+            if self.path == "/renew":
+                return self._send(200 if coordinator.renew(body["chunk_id"], body["token"]) else 409, {})
+            if self.path == "/release":
+                return self._send(200 if coordinator.release(body["chunk_id"], body["token"]) else 409, {})
+            if self.path == "/complete":
+                accepted = coordinator.complete(
+                    body["chunk_id"], body["token"], body.get("worker", self.client_address[0]),
+                    body["successful"], body["attempted"], body.get("seconds", 0.0),
+                )
+                return self._send(200, {"accepted": accepted})
+        except (KeyError, IndexError, ValueError) as e:
+            return self._send(400, {"error": str(e)})
+        self._send(404, {"error": "not found"})
+
+
+class CoordinatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, coordinator, host="0.0.0.0", port=8766):
+        super().__init__((host, port), CoordinatorHandler)
+        self.coordinator = coordinator
+
+    @property
+    def url(self):
+        host = self.server_address[0]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="coordinator", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _post(url, payload, timeout=30):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        return response.status, json.loads(body) if body else None
+
+
+def submit_chunk(job, answers):
+    """
+    Submit one leased chunk with the existing engines
+
+    Returns:
+        Number of confirmed submissions
+    """
+    form_url = job["form_url"]
+    if job["engine"] == "http":
+        from answer_sources import run_stream
+        from http_submission import FormHTTPClient, submit_answers_once
+
+        client = FormHTTPClient(pool_size=job["concurrency"])
+        try:
+            successful_submissions, _ = run_stream(
+                answers,
+                lambda i, row: submit_answers_once(client, form_url, row, job["page_count"])[0],
+                job["concurrency"],
+            )
+        finally:
+            client.close()
+        return successful_submissions
+
+    if job["form"] == "farmer":
+        from google_form_submission import submit_form
+
+        return submit_form(len(answers), answers=answers, base_url=form_url)
+
+    # The donation survey is filled by clicking, the leased labels are turned
+    # into the options to click
+    from single_page_form import submit_donation_survey
+
+    return submit_donation_survey(len(answers), form_url=form_url, answers=answers)
+
+
+def run_worker(coordinator_url, worker=None, poll_interval=1.0, max_failures=3):
+    """
+    Lease chunks from the coordinator and submit them until the job is done.
+    The lease is renewed in the background while a chunk is being submitted.
+    A chunk that fails is released so it is submitted again, by this or
+    another worker; after `max_failures` failed chunks in a row the worker
+    gives up.
+
+    Returns:
+        Dict with the chunks and submissions this worker did
+    """
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    coordinator_url = coordinator_url.rstrip("/")
+    stats = {"worker": worker, "chunks": 0, "successful": 0, "attempted": 0}
+    failures = 0
+
+    while True:
+        try:
+            status, lease = _post(f"{coordinator_url}/lease", {"worker": worker})
+        except (urllib.error.URLError, OSError) as e:
+            logger.error(f"{worker}: could not reach the coordinator: {e}")
+            break
+        if status == 204:
+            time.sleep(poll_interval)
+            continue
+        if lease.get("done"):
+            break
+
+        renewing = threading.Event()
+
+        def renew(chunk_id=lease["chunk_id"], token=lease["token"]):
+            while not renewing.wait(lease["lease_seconds"] / 3):
+                try:
+                    _post(f"{coordinator_url}/renew", {"chunk_id": chunk_id, "token": token})
+                except urllib.error.HTTPError as e:
+                    logger.warning(f"{worker}: lease of chunk {chunk_id} lost (HTTP {e.code})")
+                    return
+                except (urllib.error.URLError, OSError) as e:
+                    logger.warning(f"{worker}: could not renew the lease of chunk {chunk_id}: {e}")
+
+        renewer = threading.Thread(target=renew, name=f"renew-{lease['chunk_id']}", daemon=True)
+        renewer.start()
+        start = time.perf_counter()
+        try:
+            successful = submit_chunk(lease["job"], lease["answers"])
+        except Exception as e:
+            logger.exception(f"{worker}: chunk {lease['chunk_id']} failed: {e}")
+            successful = None
+        finally:
+            renewing.set()
+        seconds = time.perf_counter() - start
+        attempted = lease["stop"] - lease["start"]
+
+        if successful is None:
+            # Not a result: hand the chunk back instead of having it counted
+            # as done
+            try:
+                _post(f"{coordinator_url}/release", {"chunk_id": lease["chunk_id"], "token": lease["token"]})
+            except urllib.error.HTTPError as e:
+                logger.warning(f"{worker}: could not release chunk {lease['chunk_id']} (HTTP {e.code})")
+            except (urllib.error.URLError, OSError) as e:
+                logger.error(f"{worker}: could not release chunk {lease['chunk_id']}: {e}")
+                break
+            failures += 1
+            if failures >= max_failures:
+                logger.error(f"{worker}: {failures} chunks failed in a row, stopping")
+                break
+            time.sleep(poll_interval)
+            continue
+        failures = 0
+
+        try:
+            _post(f"{coordinator_url}/complete", {
+                "chunk_id": lease["chunk_id"], "token": lease["token"], "worker": worker,
+                "successful": successful, "attempted": attempted, "seconds": seconds,
+            })
+        except (urllib.error.URLError, OSError) as e:
+            logger.error(f"{worker}: could not report chunk {lease['chunk_id']}: {e}")
+            break
+        stats["chunks"] += 1
+        stats["successful"] += successful
+        stats["attempted"] += attempted
+
+    logger.info(f"{worker}: done, {stats['successful']}/{stats['attempted']} confirmed in {stats['chunks']} chunks")
+    return stats
+
+
+def run_coordinator(coordinator, host="0.0.0.0", port=8766, report_path=None):
+    """
+    Serve leases until every chunk is done, then return the combined report
+    """
+    server = CoordinatorServer(coordinator, host, port).start()
+    logger.info(f"Coordinator listening on {server.url}, {len(coordinator.chunks)} chunks")
+    try:
+        coordinator.finished.wait()
+        # Give the workers a moment to pick up the "done" answer
+        time.sleep(1)
+    finally:
+        server.stop()
+    return _finish(coordinator, report_path)
+
+
+def _finish(coordinator, report_path=None):
+    report = coordinator.report()
+    print(f"All submissions completed! Successful: {report['successful']}/{report['num_submissions']}")
+    print(
+        f"Elapsed {report['elapsed_seconds']:.2f}s, throughput {report['submissions_per_second']:.2f} submissions/s, "
+        f"{report['reassigned_leases']} leases reassigned, {report['duplicate_submissions']} duplicate submissions"
+    )
+    for worker, stats in sorted(report["per_worker"].items()):
+        print(f"  {worker}: {stats['successful']}/{stats['attempted']} in {stats['chunks']} chunks")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def run_local(coordinator, workers=2, report_path=None):
+    """
+    Run the coordinator plus `workers` worker processes on this machine
+    """
+    server = CoordinatorServer(coordinator, "127.0.0.1", 0).start()
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", server.url, "--name", f"local-{w}"])
+        for w in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.wait()
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        server.stop()
+    return _finish(coordinator, report_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spread a submission job over worker processes on several machines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("coordinator", "local"):
+        command = commands.add_parser(name)
+        command.add_argument("--form", choices=FORMS, default="donation")
+        command.add_argument("--form-url", help="Defaults to the donation survey / GOOGLE_FORM_BASE_PREFILL_URL")
+        command.add_argument("--mock", action="store_true", help="Submit to a local mock form server instead")
+        command.add_argument("-n", "--submissions", type=int, default=100)
+        command.add_argument("--chunk-size", type=int, default=50)
+        command.add_argument("--lease-seconds", type=float, default=120)
+        command.add_argument("--engine", choices=WORKER_ENGINES, default="http")
+        command.add_argument("--concurrency", type=int, default=4, help="Submissions in flight per worker")
+        command.add_argument("--seed", type=int)
+        command.add_argument("--no-randomize", action="store_true")
+        command.add_argument("--report", help="Write the combined report to this JSON file")
+    commands.choices["coordinator"].add_argument("--host", default="0.0.0.0")
+    commands.choices["coordinator"].add_argument("--port", type=int, default=8766)
+    commands.choices["local"].add_argument("--workers", type=int, default=2)
+
+    worker_command = commands.add_parser("worker")
+    worker_command.add_argument("coordinator_url")
+    worker_command.add_argument("--name")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        return run_worker(args.coordinator_url, args.name)
+
+    mock_server = None
+    form_url = args.form_url
+    if args.mock:
+        from mock_form_server import DONATION_FORM_ID, FARMER_FORM_ID, MockFormServer
+
+        mock_server = MockFormServer().start()
+        form_url = mock_server.form_url(FARMER_FORM_ID if args.form == "farmer" else DONATION_FORM_ID)
+    elif not form_url:
+        form_url = os.getenv("GOOGLE_FORM_BASE_PREFILL_URL") if args.form == "farmer" else DONATION_FORM_URL
+
+    try:
+        coordinator = Coordinator(
+            args.form, form_url, args.submissions, args.chunk_size, args.lease_seconds,
+            randomize=not args.no_randomize, seed=args.seed, engine=args.engine, concurrency=args.concurrency,
+        )
+        if args.command == "local":
+            return run_local(coordinator, args.workers, args.report)
+        return run_coordinator(coordinator, args.host, args.port, args.report)
+    finally:
+        if mock_server:
+            mock_server.stop()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,270 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+from form_metrics import METRICS, phase
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_tree_rss_bytes(pid):
+    """
+    Resident memory of a process and all its descendants, read from /proc
+    (Linux only). For a driver that's chromedriver plus every Chrome process
+    it started.
+
+    Returns:
+        Bytes, or None if it can't be read on this platform
+    """
+    if pid is None or not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may contain spaces
+        fields = stat[stat.rfind(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(stat_path.split("/")[2]))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except OSError:
+            continue
+        pending.extend(children.get(current, ()))
+    return total
+
+
+def driver_pid(driver):
+    service = getattr(driver, "service", None)
+    process = getattr(service, "process", None)
+    return getattr(process, "pid", None)
+
+
+def is_alive(driver):
+    """
+    Whether the browser session still answers. A crashed Chrome or an expired
+    session raises on any command.
+    """
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+
+def quit_quietly(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"Error closing a browser: {e}")
+
+
+class RecyclePolicy:
+    """
+    When a browser is replaced by a fresh one
+
+    Args:
+        max_submissions: Submissions (attempts) a browser serves before it is
+            replaced, None for no limit
+        max_rss_mb: Resident memory of the browser and its child processes
+            that gets it replaced, None for no limit
+        prewarm: Start the replacement in the background shortly before it is
+            needed, so the run doesn't wait for Chrome to start
+        prewarm_margin: How early to start the replacement: this many
+            submissions before max_submissions, or at this fraction of
+            max_rss_mb
+        rss_check_interval: Seconds between memory readings. A reading walks
+            all of /proc, so it isn't taken after every submission
+    """
+
+    def __init__(self, max_submissions=100, max_rss_mb=1024, prewarm=True, prewarm_margin=(2, 0.8),
+                 rss_check_interval=5.0):
+        self.max_submissions = max_submissions
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_interval = rss_check_interval
+        self.prewarm = prewarm
+        self.prewarm_submissions, self.prewarm_rss_fraction = prewarm_margin
+
+    def recycle_reason(self, submissions, rss_mb):
+        if self.max_submissions and submissions >= self.max_submissions:
+            return "submissions"
+        if self.max_rss_mb and rss_mb is not None and rss_mb >= self.max_rss_mb:
+            return "memory"
+        return None
+
+    def should_prewarm(self, submissions, rss_mb):
+        if not self.prewarm:
+            return False
+        if self.max_submissions and submissions >= self.max_submissions - self.prewarm_submissions:
+            return True
+        return bool(self.max_rss_mb and rss_mb is not None and rss_mb >= self.prewarm_rss_fraction * self.max_rss_mb)
+
+
+class DriverManager:
+    """
+    Owns the browser of one worker. It counts the submissions the browser
+    served and tracks its memory. It replaces the browser after
+    policy.max_submissions or once it passes policy.max_rss_mb, or at once
+    when its session died. The replacement is started in the background
+    ahead of time, and the old browser is closed in the background too.
+
+    Use it with use(), which hands the current driver to a submission:
+
+        with DriverManager(make_driver) as drivers:
+            drivers.use(lambda driver: fill_once(driver, i))
+
+    Args:
+        make_driver: Callable returning a new WebDriver
+        policy: RecyclePolicy, the defaults if not given
+        name: Name of the worker for the log
+    """
+
+    def __init__(self, make_driver, policy=None, name="driver"):
+        self.make_driver = make_driver
+        self.policy = policy or RecyclePolicy()
+        self.name = name
+        self.driver = None
+        self.submissions = 0
+        self.rss_mb = None
+        self._rss_checked_at = None
+        self.recycles = {"submissions": 0, "memory": 0, "dead": 0}
+        self._spare = None
+        self._spare_thread = None
+        self._quitting = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with phase("driver_startup"):
+            return self.make_driver()
+
+    def _prewarm(self):
+        try:
+            spare = self._start()
+        except Exception as e:
+            logger.warning(f"{self.name}: could not prewarm a browser: {e}")
+            return
+        with self._lock:
+            self._spare = spare
+
+    def _start_prewarm(self):
+        if self._spare is None and (self._spare_thread is None or not self._spare_thread.is_alive()):
+            self._spare_thread = threading.Thread(target=self._prewarm, name=f"{self.name}-prewarm", daemon=True)
+            self._spare_thread.start()
+
+    def _take_spare(self):
+        """
+        The prewarmed browser, waiting for it if it's still starting, or a
+        new one started right here
+        """
+        if self._spare_thread is not None:
+            with phase("driver_wait"):
+                self._spare_thread.join()
+            self._spare_thread = None
+        with self._lock:
+            spare, self._spare = self._spare, None
+        return spare if spare is not None else self._start()
+
+    def get(self):
+        """
+        The current driver, started if there is none yet
+        """
+        if self.driver is None:
+            self.driver = self._take_spare()
+            self.submissions = 0
+            self.rss_mb = None
+            self._rss_checked_at = None
+        return self.driver
+
+    def replace(self, reason):
+        """
+        Drop the current browser for a fresh one, closing it in the background
+        """
+        old, self.driver = self.driver, None
+        self.recycles[reason] += 1
+        METRICS.set_gauge("driver_recycles", self.recycles[reason], worker=self.name, reason=reason)
+        logger.info(
+            f"{self.name}: replacing the browser ({reason}) after {self.submissions} submissions"
+            + (f", {self.rss_mb:.0f} MB" if self.rss_mb is not None else "")
+        )
+        if old is not None:
+            thread = threading.Thread(target=quit_quietly, args=(old,), name=f"{self.name}-quit", daemon=True)
+            thread.start()
+            self._quitting = [t for t in self._quitting if t.is_alive()] + [thread]
+        # The next get() takes the replacement, start it now if it isn't already
+        if self.policy.prewarm:
+            self._start_prewarm()
+
+    def _check_memory(self):
+        """
+        Update rss_mb, unless the last reading of this browser is less than
+        policy.rss_check_interval old
+        """
+        now = time.monotonic()
+        if self._rss_checked_at is not None and now - self._rss_checked_at < self.policy.rss_check_interval:
+            return
+        self._rss_checked_at = now
+        rss = process_tree_rss_bytes(driver_pid(self.driver))
+        self.rss_mb = rss / 2**20 if rss is not None else None
+        if self.rss_mb is not None:
+            METRICS.set_gauge("driver_rss_mb", round(self.rss_mb, 1), worker=self.name)
+
+    def _replace_if_dead(self, driver):
+        if not is_alive(driver):
+            logger.warning(f"{self.name}: browser session is dead")
+            self.replace("dead")
+
+    def use(self, submit):
+        """
+        Run submit(driver) on the current browser, then recycle it if it is
+        due. If submit fails (raises or returns something falsy) and the
+        session turns out to be dead, the browser is replaced right away so
+        the next submission or retry gets a working one.
+        """
+        driver = self.get()
+        try:
+            result = submit(driver)
+            if not result:
+                self._replace_if_dead(driver)
+            return result
+        except Exception:
+            self._replace_if_dead(driver)
+            raise
+        finally:
+            if self.driver is driver:
+                self.submissions += 1
+                if self.policy.max_rss_mb:
+                    self._check_memory()
+                reason = self.policy.recycle_reason(self.submissions, self.rss_mb)
+                if reason:
+                    self.replace(reason)
+                elif self.policy.should_prewarm(self.submissions, self.rss_mb):
+                    self._start_prewarm()
+
+    def close(self):
+        if self._spare_thread is not None:
+            self._spare_thread.join()
+        for thread in self._quitting:
+            thread.join()
+        for driver in (self.driver, self._spare):
+            if driver is not None:
+                quit_quietly(driver)
+        self.driver = None
+        self._spare = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
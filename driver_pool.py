@@ -0,0 +1,199 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from browser_profiles import check_profile, make_lean_driver
+from driver_manager import DriverManager
+from form_metrics import METRICS, write_run_metrics
+from job_journal import open_journal
+from retry_policy import CircuitBreaker, RetryPolicy, call_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+def make_headless_driver(user_agent=None):
+    """
+    Start a headless Chrome suitable for running next to other workers
+    """
+    chrome_options = Options()
+    chrome_options.add_argument(f"--user-agent={user_agent or os.getenv('USER_AGENT') or 'Mozilla/5.0'}")
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1280,900")
+    return webdriver.Chrome(options=chrome_options)
+
+
+def run_driver_pool(fill_once, num_submissions, workers=4, make_driver=make_headless_driver, journal=None,
+                    breaker=None, recycle_policy=None, retry_policy=None):
+    """
+    Run submissions on a pool of browsers sharing one work queue. Each worker
+    keeps its driver warm between submissions, and its DriverManager replaces
+    it when it served enough submissions, grew too big or died.
+
+    Args:
+        fill_once: Callable (driver, i, num_submissions) performing one
+            attempt, as call_with_retries expects: True if confirmed, False
+            if submitted without confirmation, or raises
+        num_submissions: Number of submissions
+        workers: Number of browsers running at the same time
+        make_driver: Callable returning a new WebDriver
+        journal: Optional JobJournal, indices it has as done are not queued
+            and the outcome of every submission is recorded in it
+        breaker: CircuitBreaker shared by the workers, all of them pause when
+            the error rate spikes (a new one if not given)
+        recycle_policy: RecyclePolicy of every worker's browser
+        retry_policy: RetryPolicy of the submissions, defaults to RetryPolicy()
+
+    Returns:
+        Report dict with the success count, elapsed time and per-worker stats
+    """
+    jobs = queue.Queue()
+    for i in journal.pending(num_submissions) if journal else range(num_submissions):
+        jobs.put(i)
+    already_done = num_submissions - jobs.qsize()
+
+    breaker = breaker or CircuitBreaker()
+    policy = retry_policy or RetryPolicy()
+    results = {}
+    per_worker = {}
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        stats = {"submissions": 0, "successful": 0, "startup_seconds": None, "recycles": None, "error": ""}
+        with lock:
+            per_worker[worker_id] = stats
+
+        drivers = DriverManager(make_driver, recycle_policy, f"driver-worker-{worker_id}")
+        start = time.perf_counter()
+        try:
+            drivers.get()
+        except Exception as e:
+            logger.error(f"Worker {worker_id}: error initializing WebDriver: {e}")
+            stats["error"] = str(e)
+            return
+        stats["startup_seconds"] = time.perf_counter() - start
+
+        try:
+            while True:
+                try:
+                    i = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                result = call_with_retries(
+                    lambda: drivers.use(lambda driver: fill_once(driver, i, num_submissions)),
+                    policy,
+                    breaker,
+                    f"Worker {worker_id}: submission {i+1}/{num_submissions}",
+                )
+                if not result.attempts:
+                    logger.error(f"Worker {worker_id}: stopping, {breaker.halted}")
+                    break
+                METRICS.count_submission(result.outcome, engine="selenium")
+                success = result.confirmed
+                if journal:
+                    journal.record(i, result.journal_state)
+                with lock:
+                    results[i] = success
+                    stats["submissions"] += 1
+                    stats["successful"] += int(success)
+        finally:
+            stats["recycles"] = dict(drivers.recycles)
+            drivers.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,), name=f"driver-worker-{w}") for w in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    successful_submissions = sum(1 for success in results.values() if success)
+    report = {
+        "num_submissions": num_submissions,
+        "successful": successful_submissions,
+        "failed": len(results) - successful_submissions,
+        "not_attempted": num_submissions - len(results) - already_done,
+        "already_done": already_done,
+        "workers": workers,
+        "elapsed_seconds": elapsed,
+        "submissions_per_second": len(results) / elapsed if elapsed else 0.0,
+        "per_worker": per_worker,
+    }
+    logger.info(
+        f"All submissions completed! Successful: {successful_submissions}/{num_submissions} "
+        f"with {workers} browsers in {elapsed:.2f}s"
+    )
+    METRICS.set_gauge("throughput_submissions_per_second", round(report["submissions_per_second"], 3), engine="selenium")
+    write_run_metrics()
+    return report
+
+
+def pool_driver_factory(browser_profile="standard"):
+    """
+    make_driver callable for run_driver_pool for the given browser profile
+    """
+    return make_lean_driver if check_profile(browser_profile) == "lean" else make_headless_driver
+
+
+def submit_form_with_manual_fill_pool(num_submissions=1, randomize=False, workers=4, base_url=None, job_id=None,
+                                      browser_profile="standard", batch=False, recycle_policy=None):
+    """
+    Pool version of google_form_submission.submit_form_with_manual_fill
+    """
+    from google_form_submission import BASE_URL, fill_form_once
+
+    base_url = base_url or BASE_URL
+    journal = open_journal(job_id)
+    try:
+        return run_driver_pool(
+            lambda driver, i, n: fill_form_once(driver, base_url, i, n, randomize, batch),
+            num_submissions,
+            workers,
+            make_driver=pool_driver_factory(browser_profile),
+            journal=journal,
+            recycle_policy=recycle_policy,
+        )
+    finally:
+        if journal:
+            journal.close()
+
+
+def submit_donation_survey_pool(num_submissions=1, randomize=False, workers=4, form_url=None, job_id=None,
+                                browser_profile="standard", batch=False, recycle_policy=None, plan=None):
+    """
+    Pool version of single_page_form.submit_donation_survey
+    """
+    from single_page_form import FORM_URL, fill_donation_survey_once, planned_selections
+
+    form_url = form_url or FORM_URL
+    selections_for = lambda i: None
+    if plan is not None:
+        selections_for = planned_selections(num_submissions, plan, form_url, randomize=randomize)
+    journal = open_journal(job_id)
+    try:
+        return run_driver_pool(
+            lambda driver, i, n: fill_donation_survey_once(driver, i, n, randomize, form_url, batch,
+                                                           selections_for(i)),
+            num_submissions,
+            workers,
+            make_driver=pool_driver_factory(browser_profile),
+            journal=journal,
+            recycle_policy=recycle_policy,
+        )
+    finally:
+        if journal:
+            journal.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    report = submit_donation_survey_pool(num_submissions=25, randomize=True, workers=os.cpu_count() or 4)
+    print(report)
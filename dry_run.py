@@ -0,0 +1,253 @@
+import argparse
+import csv
+import glob
+import itertools
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from answer_generation import (
+    AnswerTable,
+    donation_answer_table,
+    donation_fixed_codes,
+    farmer_answer_table,
+    farmer_fixed_codes,
+    generate_answer_codes,
+)
+from form_answers import DONATION_FORM_URL, DONATION_OPTIONS, FARMER_OPTIONS
+from form_schema import SCHEMA_CACHE_DIR, form_id_from_url, load_schema, schema_questions
+
+logger = logging.getLogger(__name__)
+
+DRY_RUN_FORMATS = (".npy", ".csv")
+
+
+def labels_path(path):
+    """
+    Where the question names / entry ids / option labels of a .npy dataset
+    are stored, next to it
+    """
+    return f"{os.path.splitext(path)[0]}.labels.json"
+
+
+def farmer_dry_run_table(entry_path="entry_mapping.json"):
+    """
+    AnswerTable of the farmer survey without touching the network: the entry
+    ids come from entry_mapping.json, or are the field names if it's missing
+    """
+    if os.path.exists(entry_path):
+        with open(entry_path) as f:
+            entry = json.load(f)
+    else:
+        entry = {field: field for field in FARMER_OPTIONS}
+    return farmer_answer_table(entry)
+
+
+def donation_dry_run_questions(form_url=DONATION_FORM_URL):
+    """
+    Questions of the donation survey from the cached schema, or built from
+    DONATION_OPTIONS (with the field names as entry ids) if the form was
+    never fetched
+    """
+    form_id = form_id_from_url(form_url)
+    if glob.glob(os.path.join(SCHEMA_CACHE_DIR, f"{glob.escape(form_id)}-*.json")):
+        return schema_questions(load_schema(form_url))
+    return [{"entry": field, "title": field, "options": options} for field, options in DONATION_OPTIONS.items()]
+
+
+def _csv_field(label):
+    if any(char in label for char in ',"\r\n'):
+        return '"' + label.replace('"', '""') + '"'
+    return label
+
+
+def csv_blocks(table, max_combinations=4096):
+    """
+    Split the questions into runs of consecutive questions and render every
+    combination of their answers as CSV text once, so a row is written by
+    joining a few pre-rendered pieces instead of one label per question
+
+    Returns:
+        List of (first question, stop question, per-question multipliers,
+        object array of rendered combinations)
+    """
+    blocks = []
+    start = 0
+    while start < len(table.labels):
+        stop = start + 1
+        combinations = table.option_counts[start]
+        while stop < len(table.labels) and combinations * table.option_counts[stop] <= max_combinations:
+            combinations *= table.option_counts[stop]
+            stop += 1
+        counts = table.option_counts[start:stop]
+        # Mixed radix index of a combination, the last question varies fastest
+        multipliers = np.cumprod([1] + counts[:0:-1])[::-1].astype(np.int64)
+        rendered = [
+            ",".join(_csv_field(label) for label in combination)
+            for combination in itertools.product(*table.labels[start:stop])
+        ]
+        blocks.append((start, stop, multipliers, np.array(rendered, dtype=object)))
+        start = stop
+    return blocks
+
+
+def write_dataset(table, num_responses, output, weights=None, seed=None, fixed=None, chunk_size=1_000_000,
+                  planned=None):
+    """
+    Generate the answers of num_responses responses and write them to
+    `output`, chunk by chunk so memory stays flat however many rows there are
+
+    A .npy output holds the option codes as a (responses x questions) uint8
+    array that np.load(output, mmap_mode="r") maps without reading it, with
+    the labels to decode it in labels_path(output). A .csv output holds the
+    option labels, one column per question.
+
+    `planned` writes codes built beforehand (see response_planner.plan_codes)
+    instead of generating them.
+
+    Returns:
+        List of per-question arrays with how often each option was picked
+    """
+    extension = os.path.splitext(output)[1].lower()
+    if extension not in DRY_RUN_FORMATS:
+        raise ValueError(f"Unsupported output {output!r}, expected one of {', '.join(DRY_RUN_FORMATS)}")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # One generator for all chunks, so the dataset only depends on the seed
+    rng = np.random.default_rng(seed)
+    counts = [np.zeros(count, dtype=np.int64) for count in table.option_counts]
+    shape = (num_responses, len(table.entries))
+
+    if extension == ".npy":
+        data = np.lib.format.open_memmap(output, mode="w+", dtype=np.uint8, shape=shape)
+        with open(labels_path(output), "w") as f:
+            json.dump({"names": table.names, "entries": table.entries, "labels": table.labels}, f, indent=2)
+    else:
+        data = None
+        csv_file = open(output, "w", newline="", encoding="utf-8")
+        csv.writer(csv_file, lineterminator="\n").writerow(table.names)
+        blocks = csv_blocks(table)
+
+    try:
+        for start in range(0, num_responses, chunk_size):
+            stop = min(start + chunk_size, num_responses)
+            if planned is not None:
+                codes = planned[start:stop]
+            else:
+                codes = generate_answer_codes(table, stop - start, weights, rng, fixed)
+            for q, count in enumerate(table.option_counts):
+                counts[q] += np.bincount(codes[:, q], minlength=count)
+            if data is not None:
+                data[start:stop] = codes
+            else:
+                pieces = [rendered[codes[:, first:last] @ multipliers] for first, last, multipliers, rendered in blocks]
+                lines = pieces[0] if len(pieces) == 1 else map(",".join, zip(*pieces))
+                csv_file.write("\n".join(lines))
+                csv_file.write("\n")
+    finally:
+        if data is not None:
+            data.flush()
+            del data
+        else:
+            csv_file.close()
+    return counts
+
+
+def frequency_tables(table, counts):
+    """
+    Dict of question name -> {option label: count}
+    """
+    return {
+        name: {label: int(count) for label, count in zip(options, question_counts)}
+        for name, options, question_counts in zip(table.names, table.labels, counts)
+    }
+
+
+def print_frequency_tables(table, counts):
+    for name, entry, options, question_counts in zip(table.names, table.entries, table.labels, counts):
+        total = question_counts.sum()
+        print(f"{name} ({entry})" if name != entry else name)
+        for label, count in zip(options, question_counts):
+            share = 100 * count / total if total else 0.0
+            print(f"  {label:<45} {count:>12,} {share:6.2f}%")
+
+
+def dry_run(table, num_responses, output, weights=None, seed=None, fixed=None, planned=None):
+    """
+    Write the dataset and print its per-question frequency tables
+
+    Returns:
+        Dict of question name -> {option label: count}
+    """
+    start = time.perf_counter()
+    counts = write_dataset(table, num_responses, output, weights, seed, fixed, planned=planned)
+    elapsed = time.perf_counter() - start
+    print_frequency_tables(table, counts)
+    print(f"Wrote {num_responses:,} responses to {output} in {elapsed:.2f}s")
+    return frequency_tables(table, counts)
+
+
+def dry_run_farmer(num_submissions, output, randomize=True, weights=None, seed=None, plan=None):
+    """
+    What submit_form would send, without a browser or network
+    """
+    table = farmer_dry_run_table()
+    if plan is not None:
+        from response_planner import plan_codes
+
+        fixed = None if randomize else farmer_fixed_codes(table)
+        planned = plan_codes(table, num_submissions, plan, weights, seed, fixed)
+        return dry_run(table, num_submissions, output, planned=planned)
+    return dry_run(table, num_submissions, output, weights, seed, None if randomize else farmer_fixed_codes(table))
+
+
+def dry_run_donation(num_submissions, output, randomize=True, form_url=DONATION_FORM_URL, weights=None, seed=None,
+                     plan=None):
+    """
+    What submit_donation_survey would send, without a browser or network
+    """
+    questions = donation_dry_run_questions(form_url)
+    table = donation_answer_table(questions)
+    if plan is not None:
+        from response_planner import plan_codes
+
+        planned = plan_codes(table, num_submissions, plan, weights, seed, donation_fixed_codes(questions, randomize))
+        return dry_run(table, num_submissions, output, planned=planned)
+    return dry_run(table, num_submissions, output, weights, seed, donation_fixed_codes(questions, randomize))
+
+
+def load_dataset(path):
+    """
+    Memory-map a .npy dataset written by write_dataset
+
+    Returns:
+        Tuple of (AnswerTable, uint8 array of option codes)
+    """
+    with open(labels_path(path)) as f:
+        labels = json.load(f)
+    table = AnswerTable(labels["entries"], labels["labels"], names=labels["names"])
+    return table, np.load(path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the answers a run would submit, without submitting")
+    parser.add_argument("form", choices=["farmer", "donation"])
+    parser.add_argument("-n", "--num-submissions", type=int, default=1000)
+    parser.add_argument("-o", "--output", help="Output .npy or .csv file, defaults to dry_run/<form>_answers.npy")
+    parser.add_argument("--fixed", action="store_true", help="Use the fixed answers instead of randomizing")
+    parser.add_argument("--weights", type=json.loads, help='Option weights as JSON, e.g. \'{"location": [0.6, 0.4]}\'')
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--plan", help="JSON file of exact quotas and conditional rules (see response_planner.py)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join("dry_run", f"{args.form}_answers.npy")
+    if args.form == "farmer":
+        dry_run_farmer(args.num_submissions, output, not args.fixed, args.weights, args.seed, args.plan)
+    else:
+        dry_run_donation(args.num_submissions, output, not args.fixed, weights=args.weights, seed=args.seed,
+                         plan=args.plan)
@@ -0,0 +1,209 @@
+import random
+import json
+import os
+from urllib.parse import urlencode, urlsplit
+
+from form_schema import entry_mapping_from_schema, load_schema
+
+# Options for the farmer survey - values are the labels exactly as they appear
+# on the form (they get URL encoded when the prefill URL or POST body is built)
+FARMER_OPTIONS = {
+    'market': ["Middlemen", "Local market", "Cooperatives", "Direct to consumers"],
+    'certified': ["Yes", "No", "May be"],
+    'quality_check': ["Yes", "No", "May be"],
+    'available': ["Yes", "No", "May be"],
+    'accessible': ["Yes", "No", "May be"],
+    'payment_method': ["Cash", "Mobile money", "Bank transfer"],
+    'interest_trying': ["Yes", "No", "May be"],
+    'location': ["Urban", "Rural"],
+    'frequency': ["Daily", "Weekly", "Monthly", "Rarely"],
+    'purchase_place': ["Local market", "Supermarkets", "Middlemen", "Farmers"],
+    'priority': ["Price", "Quality", "Convenience"],
+    'recommendation': ["Yes", "No", "May be"],
+    'already_used': ["Yes", "No", "May be"],
+    'openness': ["Yes", "No", "May be"],
+    'importance': ["Very important", "Somewhat important", "Not important"],
+    'feedback': ["Yes", "No", "May be"],
+}
+
+# Answers used when randomize=False
+FARMER_FIXED_ANSWERS = {
+    'market': "Middlemen",
+    'certified': "No",
+    'quality_check': "No",
+    'available': "Yes",
+    'accessible': "Yes",
+    'payment_method': "Cash",
+    'interest_trying': "I will try",
+    'location': "Urban",
+    'frequency': "Rarely",
+    'purchase_place': "Local market",
+    'priority': "Quality",
+    'recommendation': "No",
+    'already_used': "Yes",
+    'openness': "May be",
+    'importance': "Very important",
+    'feedback': "Yes",
+}
+
+# The farmer survey is split into three sections (Farmers, Technology Usage &
+# Payments, Final Section)
+FARMER_PAGE_COUNT = 3
+
+DONATION_FORM_URL = "https://docs.google.com/forms/d/e/1FAIpQLSclLS6L0_UWKz4maZhKNeVa0HjUoZkg64JHVaHCzXhkYjHCpA/viewform"
+
+# The question answered with its first option ("Yes, definitely") in every
+# donation survey response
+DONATION_FIXED_QUESTION = 8
+
+# Options for each question of the donation survey
+DONATION_OPTIONS = {
+    'awareness': [
+        "never heard of it", 
+        "somewhat familiar", 
+        "very familiar"
+    ],
+    'motivation': [
+        "Religious beliefs", 
+        "Personal connection", 
+        "Social responsibility", 
+        "Tax benefits"
+    ],
+    'frequency': [
+        "Never", 
+        "Occasionally (no specific frequented)", 
+        "Monthly", 
+        "Quarterly", 
+        "Annually"
+    ],
+    'donation_type': [
+        "Clothing and shoes", 
+        "Food items", 
+        "Monetary donations", 
+        "Personal care items", 
+        "Educational supplies"
+    ],
+    'donation_method': [
+        "Physical visiting", 
+        "Online donation", 
+        "Through intermediaries"
+    ],
+    'experience': [
+        "Very positive", 
+        "Positive", 
+        "Neutral", 
+        "Negative", 
+        "Very negative"
+    ],
+    'organization_needs': [
+        "Organization needs.", 
+        "Staff competence", 
+        "Donation usage transparency", 
+        "Facility conditions", 
+        "Number of children served"
+    ],
+    'challenges': [
+        "Lack of information about orphanages", 
+        "Inconvenient donation process", 
+        "Limited donation options", 
+        "Concerns about donation use", 
+        "Time constraints"
+    ],
+    'future_donation': [
+        "Yes, definitely", 
+        "Probably", 
+        "Not sure", 
+        "Probably not", 
+        "Definitely not"
+    ],
+    'payment_options': [
+        "More payment options", 
+        "Improved online platform", 
+        "Regular updates on impact", 
+        "Easier donation process", 
+        "Tax deduction documentation"
+    ]
+}
+
+# Default selections (indices in the options arrays)
+DONATION_DEFAULT_SELECTIONS = {
+    'awareness': 0,  # "never heard of it"
+    'motivation': 0,  # "Religious beliefs"
+    'frequency': 1,  # "Occasionally (no specific frequented)"
+    'donation_type': 0,  # "Clothing and shoes"
+    'donation_method': 0,  # "Physical visiting"
+    'experience': 2,  # "Neutral"
+    'organization_needs': 0,  # "Organization needs."
+    'challenges': 0,  # "Lack of information about orphanages"
+    'future_donation': 0,  # "Yes, definitely"
+    'payment_options': 0   # "More payment options"
+}
+
+
+def load_entry_mapping(path="entry_mapping.json", form_url=None):
+    """
+    Load the field name -> entry.XXXXXXX mapping of the farmer survey. When the
+    file does not exist and form_url is given, the mapping is taken from the
+    (cached) schema of the form instead.
+    """
+    if form_url and not os.path.exists(path):
+        return entry_mapping_from_schema(load_schema(form_url), list(FARMER_OPTIONS))
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def build_farmer_answers(entry, randomize=False):
+    """
+    Build the answers of one farmer survey response
+
+    Args:
+        entry: Field name -> entry.XXXXXXX mapping (see entry_mapping.json)
+        randomize: Whether to randomize the answers
+
+    Returns:
+        Dict of entry.XXXXXXX -> answer label
+    """
+    if randomize:
+        return {entry[field]: random.choice(choices) for field, choices in FARMER_OPTIONS.items()}
+    return {entry[field]: answer for field, answer in FARMER_FIXED_ANSWERS.items()}
+
+
+def build_prefill_url(base_url, answers):
+    """
+    Append the answers to the prefill URL of the form, which may or may not
+    already have a query string (e.g. ?usp=pp_url)
+    """
+    separator = "&" if urlsplit(base_url).query else "?"
+    return f"{base_url}{separator}{urlencode(answers)}"
+
+
+def build_donation_answers(questions, randomize=False):
+    """
+    Build the answers of one donation survey response, following the same
+    rules as the browser version in single_page_form.py
+
+    Args:
+        questions: Questions of the form in order (see form_schema.schema_questions)
+        randomize: Whether to randomize the answers
+
+    Returns:
+        Dict of entry.XXXXXXX -> answer label
+    """
+    field_names = list(DONATION_DEFAULT_SELECTIONS.keys())
+    answers = {}
+    for question_index, question in enumerate(questions):
+        options = question["options"]
+        if not options:
+            continue
+        if question_index == DONATION_FIXED_QUESTION:
+            option_index = 0
+        elif randomize:
+            option_index = random.randrange(len(options))
+        else:
+            option_index = 0
+            if question_index < len(field_names):
+                option_index = DONATION_DEFAULT_SELECTIONS[field_names[question_index]]
+            if option_index >= len(options):
+                option_index = 0
+        answers[question["entry"]] = options[option_index]
+    return answers
@@ -0,0 +1,192 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+HUMAN_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_FILE = "form_automation.log"
+EVENTS_FILE = os.path.join("logs", "form_events.jsonl")
+
+# Pass as extra= on per-question messages so they can be sampled
+PER_QUESTION = {"per_question": True}
+
+# Structured events (one per submission and per phase). They only go to the
+# JSONL sink, and cost nothing until setup_logging() attached it.
+events = logging.getLogger("form_events")
+events.propagate = False
+
+_listener = None
+_queue_handler = None
+
+
+def event(name, **fields):
+    """
+    Log one structured event, e.g. event("submission", outcome="confirmed")
+    """
+    if events.handlers:
+        events.info(name, extra={"event": name, "fields": fields})
+
+
+class JSONLFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger and thread, plus the fields
+    of an event or the message of a regular log record
+    """
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+        }
+        name = getattr(record, "event", None)
+        if name:
+            data["event"] = name
+            data.update(record.fields)
+        else:
+            data["message"] = record.getMessage()
+        return json.dumps(data, default=str)
+
+
+class BatchingHandler(logging.handlers.MemoryHandler):
+    """
+    Buffers records and writes them to `target` in batches of `capacity`, or
+    once `flush_interval` seconds passed since the last write. Errors are
+    written right away. A background thread writes out what is left after a
+    quiet period, so no record waits much longer than `flush_interval`.
+    """
+
+    def __init__(self, target, capacity=100, flush_interval=1.0, flush_level=logging.ERROR):
+        super().__init__(capacity, flushLevel=flush_level, target=target, flushOnClose=True)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._flush_when_quiet, name="log-batch-flush", daemon=True).start()
+
+    def _flush_when_quiet(self):
+        while not self._stopped.wait(self.flush_interval):
+            if self.buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self._stopped.set()
+        target = self.target
+        super().close()
+        if target:
+            target.close()
+
+
+class QuestionSampler(logging.Filter):
+    """
+    Keeps a fraction `rate` of the per-question messages below WARNING (the
+    ones logged with extra=PER_QUESTION), everything else passes
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and getattr(record, "per_question", False):
+            return self.rate >= 1 or random.random() < self.rate
+        return True
+
+
+def _not_event(record):
+    return not hasattr(record, "event")
+
+
+def setup_logging(level=None, log_file=LOG_FILE, events_file=EVENTS_FILE, question_sample_rate=None,
+                  console=True, batch_size=100, flush_interval=1.0, force=False):
+    """
+    Log through a queue: the threads submitting forms only put records on the
+    queue, a background listener thread writes them to the human readable
+    sinks (the log file and the console, same format as before) and to a
+    batched JSONL file that also gets the submission and phase events.
+
+    Like logging.basicConfig this does nothing if the root logger already has
+    handlers, unless `force` is set.
+
+    Args:
+        level: Level of the root logger, defaults to LOG_LEVEL or INFO
+        log_file: Human readable log file, None for none
+        events_file: JSONL file, None to turn off the structured log and events
+        question_sample_rate: Fraction of per-question messages kept,
+            defaults to LOG_QUESTION_SAMPLE_RATE or 0.1
+        console: Also log to stderr
+        batch_size: JSONL records written at a time
+        flush_interval: Max seconds a JSONL record waits in the batch
+
+    Returns:
+        The QueueListener, or None if logging was configured elsewhere
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    if force:
+        stop_logging()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+    elif _listener is not None or root.handlers:
+        return _listener
+
+    human_format = logging.Formatter(HUMAN_FORMAT)
+    sinks = []
+    if log_file:
+        sinks.append(logging.FileHandler(log_file))
+    if console:
+        sinks.append(logging.StreamHandler())
+    for sink in sinks:
+        sink.setFormatter(human_format)
+        sink.addFilter(_not_event)
+    if events_file:
+        directory = os.path.dirname(events_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        target = logging.FileHandler(events_file)
+        target.setFormatter(JSONLFormatter())
+        sinks.append(BatchingHandler(target, batch_size, flush_interval))
+
+    if question_sample_rate is None:
+        question_sample_rate = float(os.getenv("LOG_QUESTION_SAMPLE_RATE", "0.1"))
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(QuestionSampler(question_sample_rate))
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    root.addHandler(_queue_handler)
+    if events_file:
+        events.setLevel(logging.INFO)
+        events.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *sinks, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """
+    Write out whatever is still queued and close the sinks
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for sink in _listener.handlers:
+        sink.close()
+    logging.getLogger().removeHandler(_queue_handler)
+    events.removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from form_logging import event
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = os.path.join("metrics", "form_metrics")
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_text(labels)} {value}")
+        return lines
+
+    def summary(self):
+        return {_label_text(labels) or "total": value for labels, value in sorted(self.values.items())}
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def prometheus(self):
+        lines = super().prometheus()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus style histogram. The most recent samples are also kept per
+    label set so the JSON summary can report p50/p95/p99.
+    """
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS, window=1000):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {
+                "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)
+            }
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["count"] += 1
+        series["sum"] += value
+        series["recent"].append(value)
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {series['count']}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {series['count']}")
+        return lines
+
+    def summary(self):
+        summary = {}
+        for labels, series in sorted(self.series.items()):
+            recent = list(series["recent"])
+            summary[_label_text(labels) or "total"] = {
+                "count": series["count"],
+                "sum_seconds": round(series["sum"], 4),
+                "mean_seconds": round(series["sum"] / series["count"], 4),
+                "p50_seconds": round(percentile(recent, 0.50), 4),
+                "p95_seconds": round(percentile(recent, 0.95), 4),
+                "p99_seconds": round(percentile(recent, 0.99), 4),
+            }
+        return summary
+
+
+class MetricsRegistry:
+    """
+    In-process metrics of a run: per-phase timings and outcome counters
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phase_seconds = Histogram("form_phase_seconds", "Time spent in each submission phase")
+            self.submissions = Counter("form_submissions_total", "Submissions by outcome")
+            self.page_errors = Counter("form_page_errors_total", "Errors by form page / step")
+            self.failures = Counter("form_failures_total", "Failed attempts by failure kind and whether they were retried")
+            self.confirmations = Counter("form_confirmation_signals_total", "Signal that ended each confirmation wait")
+            self.concurrency_decisions = Counter(
+                "form_concurrency_decisions_total", "Adaptive concurrency changes by action and reason"
+            )
+            self.gauges = Gauge("form_gauge", "Point in time values")
+            self.started = time.time()
+
+    def observe_phase(self, phase_name, seconds, **labels):
+        with self._lock:
+            self.phase_seconds.observe(seconds, phase=phase_name, **labels)
+
+    def count_submission(self, outcome, **labels):
+        with self._lock:
+            self.submissions.inc(outcome=outcome, **labels)
+        event("submission", outcome=outcome, **labels)
+
+    def count_page_error(self, page, **labels):
+        with self._lock:
+            self.page_errors.inc(page=page, **labels)
+
+    def phase_samples(self, phase_name):
+        """
+        Recent samples of a phase over all of its label sets
+        """
+        with self._lock:
+            return [
+                value
+                for labels, series in self.phase_seconds.series.items()
+                if ("phase", phase_name) in labels
+                for value in series["recent"]
+            ]
+
+    def count_failure(self, kind, **labels):
+        with self._lock:
+            self.failures.inc(kind=kind, **labels)
+
+    def count_confirmation(self, signal, **labels):
+        with self._lock:
+            self.confirmations.inc(signal=signal, **labels)
+
+    def count_concurrency_decision(self, action, reason, **labels):
+        with self._lock:
+            self.concurrency_decisions.inc(action=action, reason=reason, **labels)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges.set(value, name=name, **labels)
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = []
+            for metric in (self.phase_seconds, self.submissions, self.page_errors, self.failures, self.confirmations,
+                           self.concurrency_decisions, self.gauges):
+                lines.extend(metric.prometheus())
+            return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration_seconds": round(time.time() - self.started, 3),
+                "phases": self.phase_seconds.summary(),
+                "submissions": self.submissions.summary(),
+                "page_errors": self.page_errors.summary(),
+                "failures": self.failures.summary(),
+                "confirmation_signals": self.confirmations.summary(),
+                "concurrency_decisions": self.concurrency_decisions.summary(),
+                "gauges": self.gauges.summary(),
+            }
+
+    def write(self, prefix=METRICS_PREFIX):
+        """
+        Write <prefix>.prom (Prometheus text format) and <prefix>.json
+
+        Returns:
+            The JSON summary
+        """
+        summary = self.to_json()
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{prefix}.prom", "w") as f:
+            f.write(self.to_prometheus())
+        with open(f"{prefix}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+# Shared by every engine in the process
+METRICS = MetricsRegistry()
+
+
+@contextmanager
+def phase(phase_name, **labels):
+    """
+    Time the body of the with block as one occurrence of `phase_name`. The
+    time is recorded even when the body raises.
+    """
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        seconds = time.perf_counter() - start
+        METRICS.observe_phase(phase_name, seconds, **labels)
+        event("phase", phase=phase_name, seconds=round(seconds, 6), ok=ok, **labels)
+
+
+def write_run_metrics(prefix=METRICS_PREFIX):
+    """
+    Export the metrics at the end of a run and log where they went
+    """
+    try:
+        summary = METRICS.write(prefix)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {prefix}: {e}")
+        return None
+    logger.info(f"Metrics written to {prefix}.prom and {prefix}.json: {json.dumps(summary['submissions'])}")
+    return summary
@@ -0,0 +1,238 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_DIR = ".form_schema_cache"
+# A cached schema older than this (seconds) is fetched again
+SCHEMA_MAX_AGE = float(os.getenv("SCHEMA_CACHE_MAX_AGE", str(24 * 3600)))
+
+_LOAD_DATA_RE = re.compile(r"FB_PUBLIC_LOAD_DATA_\s*=\s*(.*?);\s*</script>", re.DOTALL)
+_FORM_ID_RE = re.compile(r"/forms/d/(?:e/)?([A-Za-z0-9_-]+)")
+
+# form id -> content hash of the schema last loaded or cached in this process
+_current_hashes = {}
+_refresh_lock = threading.Lock()
+
+# Question type codes used in FB_PUBLIC_LOAD_DATA_
+QUESTION_TYPES = {
+    0: "short_answer",
+    1: "paragraph",
+    2: "multiple_choice",
+    3: "dropdown",
+    4: "checkboxes",
+    5: "linear_scale",
+    7: "grid",
+    9: "date",
+    10: "time",
+}
+SECTION_TYPE = 8
+
+
+def form_id_from_url(form_url):
+    match = _FORM_ID_RE.search(form_url)
+    if match:
+        return match.group(1)
+    return hashlib.sha1(form_url.split("?", 1)[0].encode()).hexdigest()[:16]
+
+
+def extract_load_data(html):
+    """
+    Get the raw FB_PUBLIC_LOAD_DATA_ JSON text embedded in a viewform page
+    """
+    match = _LOAD_DATA_RE.search(html)
+    if not match:
+        raise ValueError("FB_PUBLIC_LOAD_DATA_ not found in the form page")
+    return match.group(1)
+
+
+def content_hash(load_data_text):
+    return hashlib.sha256(load_data_text.encode()).hexdigest()[:16]
+
+
+def parse_schema(load_data_text, form_id):
+    """
+    Build the schema of a form from its FB_PUBLIC_LOAD_DATA_ JSON text
+
+    Returns:
+        Dict with the form id, content hash, title and a list of sections, each
+        with its questions (title, type, entry id, option labels, required)
+    """
+    data = json.loads(load_data_text)
+    form = data[1]
+    items = form[1] or []
+
+    sections = [{"index": 0, "title": data[3] if len(data) > 3 else "", "questions": []}]
+    for item in items:
+        item_type = item[3]
+        if item_type == SECTION_TYPE:
+            sections.append({"index": len(sections), "title": item[1] or "", "questions": []})
+            continue
+        if item_type not in QUESTION_TYPES or not item[4]:
+            # Title/description blocks, images and videos have no answers
+            continue
+        for answer in item[4]:
+            options = [option[0] for option in (answer[1] or []) if option and option[0]]
+            sections[-1]["questions"].append({
+                "title": item[1] or "",
+                "type": QUESTION_TYPES[item_type],
+                "entry": f"entry.{answer[0]}",
+                "options": options,
+                "required": bool(answer[2]) if len(answer) > 2 else False,
+            })
+
+    return {
+        "form_id": form_id,
+        "content_hash": content_hash(load_data_text),
+        "title": data[3] if len(data) > 3 else "",
+        "sections": sections,
+    }
+
+
+def fetch_form_html(form_url, user_agent=None):
+    request = urllib.request.Request(
+        form_url.split("?", 1)[0],
+        headers={"User-Agent": user_agent or os.getenv("USER_AGENT") or "Mozilla/5.0"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode("utf-8", errors="replace")
+
+
+def schema_cache_path(form_id, content_hash, cache_dir=SCHEMA_CACHE_DIR):
+    return os.path.join(cache_dir, f"{form_id}-{content_hash}.json")
+
+
+def discover_schema(form_url, cache_dir=SCHEMA_CACHE_DIR, html=None):
+    """
+    Fetch the form once, parse its schema and store it in the cache
+
+    Args:
+        form_url: The viewform URL of the form
+        cache_dir: Directory of the schema cache
+        html: Already fetched form page, skips the request if given
+
+    Returns:
+        The schema dict
+    """
+    form_id = form_id_from_url(form_url)
+    if html is None:
+        html = fetch_form_html(form_url)
+    schema = parse_schema(extract_load_data(html), form_id)
+
+    path = schema_cache_path(form_id, schema["content_hash"], cache_dir)
+    if os.path.exists(path):
+        # Unchanged, it counts as fresh again
+        os.utime(path)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(schema, f, indent=2)
+        os.replace(tmp_path, path)
+        logger.info(f"Cached schema of form {form_id} ({schema['content_hash']}) in {path}")
+    _current_hashes[form_id] = schema["content_hash"]
+    return schema
+
+
+def load_schema(form_url, cache_dir=SCHEMA_CACHE_DIR, refresh=False, max_age=None):
+    """
+    Return the schema of a form, from the cache when there is a recent one
+
+    Args:
+        form_url: The viewform URL of the form
+        cache_dir: Directory of the schema cache
+        refresh: Fetch the form again even if a cached schema exists
+        max_age: Seconds a cached schema is used for before the form is
+            fetched again, defaults to SCHEMA_CACHE_MAX_AGE or a day
+
+    Returns:
+        The schema dict
+    """
+    if not refresh:
+        form_id = form_id_from_url(form_url)
+        cached = glob.glob(os.path.join(cache_dir, f"{glob.escape(form_id)}-*.json"))
+        if cached:
+            path = max(cached, key=os.path.getmtime)
+            if time.time() - os.path.getmtime(path) < (SCHEMA_MAX_AGE if max_age is None else max_age):
+                with open(path, "r") as f:
+                    schema = json.load(f)
+                _current_hashes[form_id] = schema["content_hash"]
+                return schema
+    return discover_schema(form_url, cache_dir)
+
+
+def refresh_if_changed(form_url, html, cache_dir=SCHEMA_CACHE_DIR):
+    """
+    Compare a form page that was fetched anyway (the HTTP engine loads it for
+    every submission) with the schema in use, and parse and cache it again
+    if the form was edited since
+
+    Returns:
+        The new schema dict if the form changed, otherwise None
+    """
+    form_id = form_id_from_url(form_url)
+    known = _current_hashes.get(form_id)
+    if known is None:
+        return None
+    try:
+        load_data_text = extract_load_data(html)
+    except ValueError:
+        return None
+    if content_hash(load_data_text) == known:
+        return None
+    with _refresh_lock:
+        if _current_hashes.get(form_id) != known:
+            # Another worker noticed first
+            return None
+        schema = discover_schema(form_url, cache_dir, html=html)
+    logger.warning(
+        f"Form {form_id} changed ({known} -> {schema['content_hash']}), cached the new schema. "
+        f"Answers already generated by this run still follow the old one."
+    )
+    return schema
+
+
+def page_schema(form_url, html, cache_dir=SCHEMA_CACHE_DIR):
+    """
+    Schema to fill a form page a browser loaded: the cached one, or the page
+    parsed again if it shows the form was edited (see refresh_if_changed),
+    so the browser engines notice edits like the HTTP engine does
+    """
+    schema = load_schema(form_url, cache_dir)
+    return refresh_if_changed(form_url, html, cache_dir) or schema
+
+
+def schema_questions(schema):
+    """
+    All questions of the form in order, across sections
+    """
+    return [question for section in schema["sections"] for question in section["questions"]]
+
+
+def schema_page_count(schema):
+    return len(schema["sections"])
+
+
+def entry_mapping_from_schema(schema, field_names):
+    """
+    Build a field name -> entry.XXXXXXX mapping by pairing the field names with
+    the form questions in order (used when entry_mapping.json is missing)
+    """
+    questions = schema_questions(schema)
+    if len(questions) < len(field_names):
+        raise ValueError(f"Form has {len(questions)} questions, expected at least {len(field_names)}")
+    return {field: question["entry"] for field, question in zip(field_names, questions)}
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    print(json.dumps(discover_schema(sys.argv[1]), indent=2))
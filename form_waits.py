@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from form_metrics import METRICS, percentile
+
+logger = logging.getLogger(__name__)
+
+# Returns what identifies the section currently shown: the URL, the pageHistory
+# hidden field Google updates on every section change, and the questions shown
+PAGE_SIGNATURE_SCRIPT = """
+var history = document.querySelector('input[name="pageHistory"]');
+var questions = Array.prototype.map.call(
+    document.querySelectorAll('div[role="listitem"]'),
+    function (item) { return item.getAttribute('data-params') || item.textContent.slice(0, 60); }
+);
+return [window.location.href, history ? history.value : '', questions.join('|')];
+"""
+
+# Element the confirmation page shows "Your response has been recorded" in
+CONFIRMATION_SELECTOR = ".vHW8K"
+
+# Checks the confirmation signals cheapest first, in one round trip: the URL,
+# the HTTP status of the page, then the one element the confirmation page has.
+# formResponse is also the URL of a submission Google rejected (the form is
+# shown again with the errors), so the URL only counts once the form is gone.
+CONFIRMATION_SIGNAL_SCRIPT = """
+var url = window.location.href;
+if (url.indexOf('closedform') >= 0) return 'closed';
+if (url.indexOf('formResponse') >= 0) {
+  var nav = performance.getEntriesByType('navigation')[0];
+  var status = nav && nav.responseStatus;
+  if (status >= 400) return 'status_' + status;
+  if (document.readyState !== 'loading' && !document.getElementById('mG61Hd')) return 'url';
+}
+if (document.querySelector(arguments[0])) return 'element';
+return null;
+"""
+
+# Signals that mean the response was recorded, the others ("closed",
+# "status_<code>") mean it wasn't
+CONFIRMED_SIGNALS = ("url", "element")
+
+
+class WaitStats:
+    """
+    Durations of every wait, per wait name. The recent samples are used to
+    derive an adaptive timeout for the next wait of the same name.
+    """
+
+    def __init__(self, default_timeout=10, min_timeout=2, max_timeout=30, multiplier=3, window=200):
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._timeouts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, timed_out=False):
+        with self._lock:
+            self._counts[name] += 1
+            self._totals[name] += seconds
+            if timed_out:
+                self._timeouts[name] += 1
+            else:
+                self._samples[name].append(seconds)
+
+    def timeout_for(self, name):
+        """
+        A few times the p95 of what was measured so far, kept within
+        [min_timeout, max_timeout]. Until enough waits have been measured the
+        default timeout is used.
+        """
+        with self._lock:
+            samples = list(self._samples[name])
+            timeouts = self._timeouts[name]
+        if len(samples) < 5:
+            return self.default_timeout
+        timeout = self.multiplier * percentile(samples, 0.95)
+        # Back off towards the maximum if waits of this kind keep timing out
+        timeout *= 2 ** min(timeouts, 4)
+        return max(self.min_timeout, min(self.max_timeout, timeout))
+
+    def summary(self):
+        with self._lock:
+            names = sorted(self._counts)
+            return {
+                name: {
+                    "count": self._counts[name],
+                    "total_seconds": round(self._totals[name], 3),
+                    "p50_seconds": round(percentile(self._samples[name], 0.50), 3),
+                    "p95_seconds": round(percentile(self._samples[name], 0.95), 3),
+                    "max_seconds": round(max(self._samples[name], default=0.0), 3),
+                    "timeouts": self._timeouts[name],
+                }
+                for name in names
+            }
+
+    def log_summary(self):
+        for name, stats in self.summary().items():
+            logger.info(
+                f"wait {name}: {stats['count']} waits, {stats['total_seconds']}s total, "
+                f"p50 {stats['p50_seconds']}s, p95 {stats['p95_seconds']}s, {stats['timeouts']} timeouts"
+            )
+
+
+# Shared by every driver so the timeouts adapt over the whole run
+WAIT_STATS = WaitStats()
+
+
+class PageWaiter:
+    """
+    Event driven waits for a form page: every wait returns as soon as its
+    condition holds instead of sleeping a fixed amount of time
+    """
+
+    def __init__(self, driver, stats=WAIT_STATS, poll_frequency=0.05):
+        self.driver = driver
+        self.stats = stats
+        self.poll_frequency = poll_frequency
+
+    def until(self, name, condition, timeout=None):
+        """
+        Wait for condition(driver) to return something truthy, recording how
+        long it took under `name`
+        """
+        timeout = timeout or self.stats.timeout_for(name)
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(self.driver, timeout, poll_frequency=self.poll_frequency).until(condition)
+        except TimeoutException:
+            self.stats.record(name, time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(name, time.perf_counter() - start)
+        return result
+
+    def clickable(self, name, locator):
+        return self.until(name, EC.element_to_be_clickable(locator))
+
+    def form_loaded(self, name="form_load"):
+        return self.until(name, EC.presence_of_element_located((By.CSS_SELECTOR, "form")))
+
+    def page_signature(self):
+        return tuple(self.driver.execute_script(PAGE_SIGNATURE_SCRIPT))
+
+    def click_and_wait_for_transition(self, name, element):
+        """
+        Click `element` and return once the form moved on: the section index
+        (pageHistory) or the set of questions changed, or the formResponse URL
+        appeared
+        """
+        before = self.page_signature()
+        element.click()
+
+        def transitioned(driver):
+            if "formResponse" in driver.current_url and "formResponse" not in before[0]:
+                return True
+            try:
+                return self.page_signature() != before
+            except Exception:
+                # The old document is being torn down, try again on the next poll
+                return False
+
+        return self.until(name, transitioned)
+
+    def confirmation(self, name="confirmation", selector=CONFIRMATION_SELECTOR):
+        """
+        Wait for the outcome of a submit click, returning as soon as any
+        signal fires instead of searching the whole document for the
+        confirmation text
+
+        Returns:
+            The signal that fired: "url" or "element" when the response was
+            recorded (see CONFIRMED_SIGNALS), "closed" or "status_<code>" when not
+
+        Raises:
+            TimeoutException: if no signal fired in time
+        """
+        signal = self.until(name, lambda driver: driver.execute_script(CONFIRMATION_SIGNAL_SCRIPT, selector))
+        METRICS.count_confirmation(signal)
+        logger.debug(f"Confirmation wait ended on {signal}")
+        return signal
@@ -1,315 +1,479 @@
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from dotenv import load_dotenv
 import time, logging
-import random, os, json
+import random, os, itertools
+from form_logging import PER_QUESTION, setup_logging
+from form_answers import build_farmer_answers, build_prefill_url, load_entry_mapping
+from form_schema import page_schema
+from answer_generation import farmer_answer_batch
+from response_planner import plan_farmer_responses
+from job_journal import open_journal
+from http_submission import submit_form_http
+from form_waits import CONFIRMED_SIGNALS, PageWaiter, WAIT_STATS
+from form_metrics import METRICS, phase, write_run_metrics
+from browser_profiles import check_profile, make_lean_driver
+from driver_manager import DriverManager
+from batch_fill import failed_questions, fill_page
+from retry_policy import (
+    CircuitBreaker, RetryPolicy, SubmissionFailure, call_with_retries, classify, confirmation_failure, page_failure_kind,
+)
 
 load_dotenv()
 
-# Setup logging
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("form_automation.log"),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 # Environment variables 
 USER_AGENT = os.getenv("USER_AGENT")
 BASE_URL = os.getenv("GOOGLE_FORM_BASE_PREFILL_URL")
 
-def submit_form(num_submissions=1, randomize=False):
+def _start_driver(browser_profile, headless):
     """
-    Submit the Google Form multiple times, handling multiple pages/sections
-    
-    Args:
-        num_submissions: Number of times to submit the form
-        randomize: Whether to randomize some of the answers
+    Start Chrome with the given browser profile
     """
+    if browser_profile == "lean":
+        return make_lean_driver(USER_AGENT, headless)
+
     # Setup Chrome options
     chrome_options = Options()
     chrome_options.add_argument(f"--user-agent={USER_AGENT}")
 
-    # Uncomment the line below to run in headless mode (no browser UI)
-    chrome_options.add_argument("--headless")
-    
-    # Initialize WebDriver
+    # Headless mode (no browser UI)
+    if headless:
+        chrome_options.add_argument("--headless")
+
     driver = webdriver.Chrome(options=chrome_options)
     driver.maximize_window()
+    return driver
+
+
+def _submit_prefilled_once(driver, url):
+    """
+    One attempt at submitting a prefilled URL by clicking through the pages
+
+    Returns:
+        True once the confirmation page shows
+
+    Raises:
+        SubmissionFailure: classified by what went wrong, submitted=True once
+            the submit click may have gone through
+    """
+    # Navigate to the form
+    with phase("page_load"):
+        driver.get(url)
+    # A closed form redirects to .../closedform, don't wait for buttons that never come
+    kind = page_failure_kind(driver.current_url)
+    if kind:
+        raise SubmissionFailure(kind, driver.current_url)
+    waiter = PageWaiter(driver)
+    
+    # Step 1: Click on the first "Next" button - using the exact XPath you provided
+    try:
+        first_next_button = waiter.clickable(
+            "first_next", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span')
+        )
+        logger.info("Found the first Next button")
+        with phase("next_click", page="1"):
+            waiter.click_and_wait_for_transition("page_1_to_2", first_next_button)
+    except Exception as e:
+        # print(f"Error clicking first Next button: {e}")
+        logger.error(f"Error clicking first next button: {e}")
+        # driver.save_screenshot(f"first_page_error_{i+1}.png")
+        METRICS.count_page_error("page_1")
+        raise classify(e, driver) from e
+    
+    # Fill in the second page if needed (if not using prefilled URL for those fields)
+    # For now, we're assuming the form is prefilled or has default values
     
+    # Step 2: Click on the second "Next" button - using the exact XPath you provided
+    try:
+        second_next_button = waiter.clickable(
+            "second_next", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span')
+        )
+        logger.info("Found the second Next button")
+        with phase("next_click", page="2"):
+            waiter.click_and_wait_for_transition("page_2_to_3", second_next_button)
+    except Exception as e:
+        # print(f"Error clicking second Next button: {e}")
+        logger.exception(f"Error clicking the next button: {e}")
+        # driver.save_screenshot(f"second_page_error_{i+1}.png")
+        METRICS.count_page_error("page_2")
+        raise classify(e, driver) from e
+    
+    # Step 3: Click on the final "Submit" button - using the exact XPath you provided
+    submit_button = None
+    try:
+        submit_button = waiter.clickable(
+            "submit", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span')
+        )
+        # print("Found the Submit button")
+        logger.info(f"Found the submit button")
+        with phase("submit_click"):
+            waiter.click_and_wait_for_transition("page_3_to_confirmation", submit_button)
+    except Exception as e:
+        # print(f"Error clicking Submit button: {e}")
+        logger.exception(f"Error clicking the submit button: {e}")
+        # driver.save_screenshot(f"third_page_error_{i+1}.png")
+        METRICS.count_page_error("page_3")
+        # Once the button was found the click may have gone through
+        raise classify(e, driver, submitted=submit_button is not None) from e
+    
+    # Check for confirmation page
+    try:
+        with phase("confirmation"):
+            signal = waiter.confirmation()
+    except Exception as e:
+        # driver.save_screenshot(f"confirmation_page_error_{i+1}.png")
+        METRICS.count_page_error("confirmation")
+        raise classify(e, driver, submitted=True) from e
+    if signal not in CONFIRMED_SIGNALS:
+        METRICS.count_page_error("confirmation")
+        raise confirmation_failure(signal)
+    logger.info(f"Submission confirmed by {signal}")
+    return True
+
+def submit_form(num_submissions=1, randomize=False, engine="selenium", weights=None, seed=None, answers=None,
+                job_id=None, base_url=None, browser_profile="standard", retry_policy=None, dry_run=None,
+                recycle_policy=None, plan=None):
+    """
+    Submit the Google Form multiple times, handling multiple pages/sections
+    
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize some of the answers
+        engine: "selenium" to click through the form in Chrome, or "http" to
+            post the answers straight to the formResponse endpoint
+        weights: Optional dict of field name -> option weights used when
+            randomizing, e.g. {"location": [0.6, 0.4]}
+        seed: Seed for reproducible random answers
+        answers: Optional iterable of answer dicts (e.g. from
+            answer_sources.stream_answers) used instead of generated answers
+        job_id: Optional job id. Progress is journaled under it and a re-run
+            with the same job id skips the submissions already done.
+        base_url: Prefill URL of the form, defaults to GOOGLE_FORM_BASE_PREFILL_URL
+        browser_profile: "standard", or "lean" to block images/fonts/media,
+            use the eager page load strategy and a small viewport
+        retry_policy: RetryPolicy deciding which failures are retried and
+            how long to back off, defaults to RetryPolicy()
+        dry_run: Path of a .npy or .csv file. Instead of submitting, the
+            answers are generated and written there (no browser or network)
+            and per-question frequency tables are printed.
+        recycle_policy: RecyclePolicy deciding after how many submissions or
+            how much memory the browser is replaced, defaults to RecyclePolicy()
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly, e.g. 60% Rural with Rural respondents answering Weekly
+            twice as often (a dict or JSON file, see response_planner.plan_codes)
+    """
+    if dry_run:
+        from dry_run import dry_run_farmer
+
+        return dry_run_farmer(num_submissions, dry_run, randomize, weights, seed, plan)
+
     # Base URL with prefilled responses
-    base_url = BASE_URL
+    base_url = base_url or BASE_URL
+
+    if engine == "http":
+        return submit_form_http(num_submissions=num_submissions, randomize=randomize, base_url=base_url,
+                                weights=weights, seed=seed, answers=answers, job_id=job_id, plan=plan)
+
+    # Initialize WebDriver. The manager replaces it when it gets old, bloated
+    # or dies
+    check_profile(browser_profile)
+    drivers = DriverManager(lambda: _start_driver(browser_profile, headless=True), recycle_policy, "submit_form")
+    drivers.get()
 
     # load entries
-    with open("entry_mapping.json", "r") as f:
-        entry = json.load(f)
-
-    for i in range(num_submissions):
-        # Create the URL for this submission
-        if randomize:
-            # Options for randomization - you can modify these as needed
-            market_options = ["Middlemen", "Local+market", "Cooperatives", "Direct+to+consumers"]
-            payment_options = ["Cash", "Mobile+money", "Bank+transfer"]
-            location_options = ["Urban", "Rural"]
-            frequency_options = ["Daily", "Weekly", "Monthly", "Rarely"]
-            purchase_options = ["Local+market", "Supermarkets", "Middlemen", "Farmers"]
-            important_options = ["Price", "Quality", "Convenience"]
-            yes_no_options = ["Yes", "No", "May+be"]
-            importance_options = ["Very+important", "Somewhat+important", "Not+important"]
-            
-            url = (f"{base_url}"
-                  f"&{entry['market']}={random.choice(market_options)}"
-                  f"&{entry['certified']}={random.choice(yes_no_options)}"
-                  f"&{entry['quality_check']}={random.choice(yes_no_options)}"
-                  f"&{entry['available']}={random.choice(yes_no_options)}"
-                  f"&{entry['accessible']}={random.choice(yes_no_options)}"
-                  f"&{entry['payment_method']}={random.choice(payment_options)}"
-                  f"&{entry['interest_trying']}={random.choice(yes_no_options)}"
-                  f"&{entry['location']}={random.choice(location_options)}"
-                  f"&{entry['frequency']}={random.choice(frequency_options)}"
-                  f"&{entry['purchase_place']}={random.choice(purchase_options)}"
-                  f"&{entry['priority']}={random.choice(important_options)}"
-                  f"&{entry['recommendation']}={random.choice(yes_no_options)}"
-                  f"&{entry['already_used']}={random.choice(yes_no_options)}"
-                  f"&{entry['openness']}={random.choice(yes_no_options)}"
-                  f"&{entry['importance']}={random.choice(importance_options)}"
-                  f"&{entry['feedback']}={random.choice(yes_no_options)}")
-        else:
-            # Use the provided prefilled URL
-            url = (
-                f"{base_url}"
-                f"&{entry['market']}=Middlemen"
-                f"&{entry['certified']}=No"
-                f"&{entry['quality_check']}=No"
-                f"&{entry['available']}=Yes"
-                f"&{entry['accessible']}=Yes"
-                f"&{entry['payment_method']}=Cash"
-                f"&{entry['interest_trying']}=I+will+try"
-                f"&{entry['location']}=Urban"
-                f"&{entry['frequency']}=Rarely"
-                f"&{entry['purchase_place']}=Local+market"
-                f"&{entry['priority']}=Quality"
-                f"&{entry['recommendation']}=No"
-                f"&{entry['already_used']}=Yes"
-                f"&{entry['openness']}=May+be"
-                f"&{entry['importance']}=Very+important"
-                f"&{entry['feedback']}=Yes"
-            )
-        
-        # Navigate to the form
-        driver.get(url)
+    entry = load_entry_mapping(form_url=base_url)
+
+    # Answers come from the given stream or plan, or random answers for
+    # every submission are drawn up front in one go
+    if answers is not None:
+        answer_source = itertools.islice(answers, num_submissions)
+    elif plan is not None:
+        answer_source = plan_farmer_responses(entry, num_submissions, plan, weights, seed, randomize)
+    elif randomize:
+        answer_source = farmer_answer_batch(entry, num_submissions, weights, seed)
+    else:
+        answer_source = itertools.repeat(build_farmer_answers(entry), num_submissions)
+
+    journal = open_journal(job_id)
+    successful_submissions = journal.confirmed_count if journal else 0
+
+    policy = retry_policy or RetryPolicy()
+    breaker = CircuitBreaker()
+
+    for i, submission_answers in enumerate(answer_source):
+        if journal and journal.is_done(i):
+            continue
+
+        # Create the URL for this submission (see form_answers.py for the
+        # options used when randomizing)
+        url = build_prefill_url(base_url, submission_answers)
         logger.info(f"======Processing submission {i+1}/{num_submissions}")
-        
-        # Step 1: Click on the first "Next" button - using the exact XPath you provided
-        try:
-            first_next_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span'))
-            )
-            print("Found the first Next button")
-            first_next_button.click()
-            time.sleep(2)  # Wait for page transition
-        except Exception as e:
-            # print(f"Error clicking first Next button: {e}")
-            logger.error(f"Error clicking first next button: {e}")
-            # driver.save_screenshot(f"first_page_error_{i+1}.png")
-            continue  # Skip to next submission if we can't proceed
-        
-        # Fill in the second page if needed (if not using prefilled URL for those fields)
-        # For now, we're assuming the form is prefilled or has default values
-        
-        # Step 2: Click on the second "Next" button - using the exact XPath you provided
-        try:
-            second_next_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span'))
-            )
-            print("Found the second Next button")
-            second_next_button.click()
-            time.sleep(2)  # Wait for page transition
-        except Exception as e:
-            # print(f"Error clicking second Next button: {e}")
-            logger.exception(f"Error clicking the next button: {e}")
-            # driver.save_screenshot(f"second_page_error_{i+1}.png")
-            continue  # Skip to next submission if we can't proceed
-        
-        # Step 3: Click on the final "Submit" button - using the exact XPath you provided
-        try:
-            submit_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span'))
-            )
-            # print("Found the Submit button")
-            logger.info(f"Found the submit button")
-            submit_button.click()
-            time.sleep(2)  # Wait for submission
-        except Exception as e:
-            # print(f"Error clicking Submit button: {e}")
-            logger.exception(f"Error clicking the submit button: {e}")
-            # driver.save_screenshot(f"third_page_error_{i+1}.png")
-            continue  # Skip to next submission if we can't proceed
-        
-        # Check for confirmation page
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Your response has been recorded') or contains(text(), 'Form submitted') or contains(text(), 'Thanks')]"))
-            )
+
+        result = call_with_retries(
+            lambda: drivers.use(lambda driver: _submit_prefilled_once(driver, url)),
+            policy,
+            breaker,
+            f"Submission {i+1}/{num_submissions}",
+        )
+        if not result.attempts:
+            logger.error(f"Stopping: {breaker.halted}")
+            break
+
+        METRICS.count_submission(result.outcome, engine="selenium")
+        if result.confirmed:
             # print(f"Submission {i+1}/{num_submissions} confirmed successful")
             logger.info(f"Submission {i+1}/{num_submissions} confirmed successful")
-        except:
+            successful_submissions += 1
+        else:
             # print(f"Could not confirm if submission {i+1}/{num_submissions} was successful")
-            logger.warning(f"Could not confirm if submission {i+1}/{num_submissions} was successful")
-            # driver.save_screenshot(f"confirmation_page_error_{i+1}.png")
+            logger.warning(f"Could not confirm if submission {i+1}/{num_submissions} was successful: {result.failure}")
+        # A submission whose submit click may have gone through is recorded
+        # as unconfirmed, so it isn't sent again on resume
+        if journal:
+            journal.record(i, result.journal_state)
         
         time.sleep(3)  # Pause between submissions
     
     # Close the browser once all submissions are complete
-    driver.quit()
+    drivers.close()
+    if journal:
+        journal.close()
     # print("All submission attempts completed!")
     logger.info("All submission attempts completed!")
+    WAIT_STATS.log_summary()
+    write_run_metrics()
+    return successful_submissions
+
+def _select_page_options(driver, page, questions, randomize, batch=False):
+    """
+    Select an option for every question of the current page: a random one
+    or the first one. Which questions and options there are comes from the
+    form schema (`questions` of the page's section), not from the page.
+
+    With batch=True all of them are selected by one injected script, one
+    WebDriver round trip for the whole page instead of several per question.
+    """
+    # Option index per radio group of the page, in order
+    choices = [
+        random.randrange(len(question["options"])) if randomize else 0
+        for question in questions if question["options"]
+    ]
+    with phase("fill", page=str(page), mode="batch" if batch else "per_question"):
+        if batch:
+            labels = [question["options"] for question in questions if question["options"]]
+            results = fill_page(driver, {q_idx: labels[q_idx][option] for q_idx, option in enumerate(choices)},
+                                rest=None)
+            failed = failed_questions(results)
+            if failed:
+                raise RuntimeError(f"Could not select options on page {page}: {failed}")
+            logger.info(f"Selected options for {len(results)} questions on page {page}")
+            return
+
+        # For each question, find all the radio buttons and click the chosen one
+        radio_groups = driver.find_elements(By.XPATH, "//div[contains(@role, 'radiogroup')]")
+        if len(radio_groups) != len(choices):
+            raise RuntimeError(f"Page {page} has {len(radio_groups)} questions, the form schema {len(choices)}")
+
+        for q_idx, (question, option) in enumerate(zip(radio_groups, choices)):
+            options = question.find_elements(By.XPATH, ".//div[@role='radio']")
+            option_to_select = options[option]
+            driver.execute_script("arguments[0].scrollIntoView();", option_to_select)
+            option_to_select.click()
+            logger.info(f"Selected an option for question {q_idx+1} on page {page}", extra=PER_QUESTION)
+
+def fill_form_once(driver, base_url, i, num_submissions, randomize=False, batch=False):
+    """
+    One attempt at filling in and submitting the form by clicking through
+    every page
+
+    Args:
+        driver: WebDriver to use, it is left open for the next submission
+        base_url: Form URL without prefills
+        i: Index of this submission (for logging)
+        num_submissions: Total number of submissions (for logging)
+        randomize: Whether to randomize the answers
+        batch: Select each page's answers with one injected script instead of
+            clicking question by question
+
+    Returns:
+        True if the confirmation page was found
+
+    Raises:
+        SubmissionFailure: classified by what went wrong, submitted=True once
+            the submit click may have gone through
+    """
+    # Navigate to the form
+    with phase("page_load"):
+        driver.get(base_url)
+    # print(f"======Processing submission {i+1}/{num_submissions}")
+    logger.info(f"======Processing submission {i+1}/{num_submissions}")
+    
+    # Wait for the form to load
+    waiter = PageWaiter(driver)
+    try:
+        waiter.form_loaded()
+    except Exception as e:
+        logger.exception(f"Form did not load: {e}")
+        METRICS.count_page_error("form_load")
+        raise classify(e, driver) from e
+    # The questions of every page come from the form schema, checked against
+    # the loaded page so an edited form is noticed
+    sections = page_schema(base_url, driver.page_source)["sections"]
+    
+    # === PAGE 1: Farmers Section ===
+    # We need to select options on this page
+    try:
+        # Find and click radio buttons for each question on the first page
+        # For simplicity, we'll randomly select from the available options
+        _select_page_options(driver, 1, sections[0]["questions"], randomize, batch)
+        
+        # Click the next button
+        first_next_button = waiter.clickable(
+            "first_next", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span')
+        )
+        with phase("next_click", page="1"):
+            waiter.click_and_wait_for_transition("page_1_to_2", first_next_button)
+        # print("Moved to page 2")
+        logger.info("Moved to page 2")
+    except Exception as e:
+        logger.exception(f"Error on page 1: {e}")
+        # driver.save_screenshot(f"page1_error_{i+1}.png")
+        METRICS.count_page_error("page_1")
+        raise classify(e, driver) from e
+    
+    # === PAGE 2: Technology Usage & Payments ===
+    try:
+        # Find and click radio buttons for each question on the second page
+        _select_page_options(driver, 2, sections[1]["questions"], randomize, batch)
+
+        # Click the next button
+        second_next_button = waiter.clickable(
+            "second_next", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span')
+        )
+        with phase("next_click", page="2"):
+            waiter.click_and_wait_for_transition("page_2_to_3", second_next_button)
+        # print("Moved to page 3")
+        logger.info("Moved to page 3")
+    except Exception as e:
+        # print(f"Error on page 2: {e}")
+        logger.exception(f"Error on page 2: {e}")
+        # driver.save_screenshot(f"page2_error_{i+1}.png")
+        METRICS.count_page_error("page_2")
+        raise classify(e, driver) from e
+    
+    # === PAGE 3: Final Section ===
+    submit_button = None
+    try:
+        # Find and click radio buttons for each question on the third page
+        _select_page_options(driver, 3, sections[2]["questions"], randomize, batch)
+        
+        # Click the submit button
+        submit_button = waiter.clickable(
+            "submit", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span')
+        )
+        with phase("submit_click"):
+            waiter.click_and_wait_for_transition("page_3_to_confirmation", submit_button)
+        # print("Submitted the form")
+        logger.info("Submitted the form")
+    except Exception as e:
+        # print(f"Error on page 3: {e}")
+        logger.exception(f"Error on page 3: {e}")
+        # driver.save_screenshot(f"page3_error_{i+1}.png")
+        METRICS.count_page_error("page_3")
+        # Once the button was found the click may have gone through, such an
+        # attempt is not retried and not resubmitted on resume
+        raise classify(e, driver, submitted=submit_button is not None) from e
+    
+    # Check for confirmation page
+    try:
+        with phase("confirmation"):
+            signal = waiter.confirmation()
+        if signal not in CONFIRMED_SIGNALS:
+            raise confirmation_failure(signal)
+        # print(f"Submission {i+1}/{num_submissions} confirmed successful")
+        logger.info(f"Submission {i+1}/{num_submissions} confirmed successful ({signal})")
+        return True
+    except Exception as e:
+        # print(f"Could not confirm if submission {i+1}/{num_submissions} was successful")
+        failure = classify(e, driver, submitted=True)
+        logger.warning(f"Could not confirm if submission {i+1}/{num_submissions} was successful: {failure}")
+        # driver.save_screenshot(f"confirmation_error_{i+1}.png")
+        METRICS.count_page_error("confirmation")
+        raise failure from e
 
-def submit_form_with_manual_fill(num_submissions=1, randomize=False):
+def submit_form_with_manual_fill(num_submissions=1, randomize=False, job_id=None, base_url=None,
+                                 browser_profile="standard", batch=False, recycle_policy=None, retry_policy=None):
     """
     Alternative approach that goes to the form and fills in each field manually
     rather than using prefilled URLs
+
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize the answers
+        job_id: Optional job id to journal progress under, a re-run with the
+            same job id resumes where the previous one stopped
+        base_url: URL of the form, defaults to GOOGLE_FORM_BASE_PREFILL_URL
+        browser_profile: "standard" or "lean" (see submit_form)
+        batch: Select each page's answers with one injected script (one
+            round trip per page instead of several per question)
+        recycle_policy: RecyclePolicy of the browser (see submit_form)
+        retry_policy: RetryPolicy of the submissions (see submit_form)
     """
-    # Setup Chrome options
-    chrome_options = Options()
-    chrome_options.add_argument(f"--user-agent={USER_AGENT}")
-    # chrome_options.add_argument("--headless")
-    
     # Initialize WebDriver
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.maximize_window()
+    check_profile(browser_profile)
+    drivers = DriverManager(lambda: _start_driver(browser_profile, headless=False), recycle_policy, "manual_fill")
+    drivers.get()
     
     # Base URL without prefills
-    base_url = BASE_URL
+    base_url = base_url or BASE_URL
     
-    for i in range(num_submissions):
-        # Navigate to the form
-        driver.get(base_url)
-        # print(f"======Processing submission {i+1}/{num_submissions}")
-        logger.info(f"======Processing submission {i+1}/{num_submissions}")
-        
-        # Wait for the form to load
-        time.sleep(3)
-        
-        # === PAGE 1: Farmers Section ===
-        # We need to select options on this page
-        try:
-            # Find and click radio buttons for each question on the first page
-            # For simplicity, we'll randomly select from the available options
-            
-            # For each question, find all the radio buttons and click one randomly
-            questions = driver.find_elements(By.XPATH, "//div[contains(@role, 'radiogroup')]")
-            
-            for q_idx, question in enumerate(questions):
-                options = question.find_elements(By.XPATH, ".//div[@role='radio']")
-                if options:
-                    # Select a random option or specific one based on preference
-                    option_to_select = random.choice(options) if randomize else options[0]
-                    driver.execute_script("arguments[0].scrollIntoView();", option_to_select)
-                    option_to_select.click()
-                    # print(f"Selected an option for question {q_idx+1}")
-                    logger.info(f"Selected an option for question {q_idx+1}")
-            
-            # Click the next button
-            first_next_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span'))
-            )
-            first_next_button.click()
-            # print("Moved to page 2")
-            logger.info("Moved to page 2")
-            time.sleep(2)
-        except Exception as e:
-            print(f"Error on page 1: {e}")
-            logger.exception(f"Error on page 1: {e}")
-            # driver.save_screenshot(f"page1_error_{i+1}.png")
-            continue
-        
-        # === PAGE 2: Technology Usage & Payments ===
-        try:
-            # Find and click radio buttons for each question on the second page
-            questions = driver.find_elements(By.XPATH, "//div[contains(@role, 'radiogroup')]")
-            
-            for q_idx, question in enumerate(questions):
-                options = question.find_elements(By.XPATH, ".//div[@role='radio']")
-                if options:
-                    option_to_select = random.choice(options) if randomize else options[0]
-                    driver.execute_script("arguments[0].scrollIntoView();", option_to_select)
-                    option_to_select.click()
-                    print(f"Selected an option for question {q_idx+1} on page 2")
-                    logger.info(f"Selected an option for question {q_idx+1} on page 2")
-
-            # Click the next button
-            second_next_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span'))
-            )
-            second_next_button.click()
-            print("Moved to page 3")
-            logger.info("Moved to page 3")
-            time.sleep(2)
-        except Exception as e:
-            # print(f"Error on page 2: {e}")
-            logger.exception(f"Error on page 2: {e}")
-            # driver.save_screenshot(f"page2_error_{i+1}.png")
-            continue
-        
-        # === PAGE 3: Final Section ===
-        try:
-            # Find and click radio buttons for each question on the third page
-            questions = driver.find_elements(By.XPATH, "//div[contains(@role, 'radiogroup')]")
-            
-            for q_idx, question in enumerate(questions):
-                options = question.find_elements(By.XPATH, ".//div[@role='radio']")
-                if options:
-                    option_to_select = random.choice(options) if randomize else options[0]
-                    driver.execute_script("arguments[0].scrollIntoView();", option_to_select)
-                    option_to_select.click()
-                    # print(f"Selected an option for question {q_idx+1} on page 3")
-                    logger.info(f"Selected an option for question {q_idx+1} on page 3")
-            
-            # Click the submit button
-            submit_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div[2]/span/span'))
-            )
-            submit_button.click()
-            # print("Submitted the form")
-            logger.info("Submitted the form")
-            time.sleep(2)
-        except Exception as e:
-            # print(f"Error on page 3: {e}")
-            logger.exception(f"Error on page 3: {e}")
-            # driver.save_screenshot(f"page3_error_{i+1}.png")
-            continue
-        
-        # Check for confirmation page
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Your response has been recorded') or contains(text(), 'Form submitted') or contains(text(), 'Thanks')]"))
-            )
-            # print(f"Submission {i+1}/{num_submissions} confirmed successful")
-            logger.info(f"Submission {i+1}/{num_submissions} confirmed successful")
-        except:
-            # print(f"Could not confirm if submission {i+1}/{num_submissions} was successful")
-            logger.exception(f"Could not confirm if submission {i+1}/{num_submissions} was successful")
-            # driver.save_screenshot(f"confirmation_error_{i+1}.png")
+    journal = open_journal(job_id)
+    successful_submissions = journal.confirmed_count if journal else 0
+    pending = journal.pending(num_submissions) if journal else range(num_submissions)
+    policy = retry_policy or RetryPolicy()
+    # Pauses the run while most submissions are failing
+    breaker = CircuitBreaker()
+
+    for i in pending:
+        result = call_with_retries(
+            lambda: drivers.use(lambda driver: fill_form_once(driver, base_url, i, num_submissions, randomize,
+                                                              batch)),
+            policy,
+            breaker,
+            f"Submission {i+1}/{num_submissions}",
+        )
+        if not result.attempts:
+            logger.error(f"Stopping: {breaker.halted}")
+            break
+        METRICS.count_submission(result.outcome, engine="selenium")
+        if result.confirmed:
+            successful_submissions += 1
+        if journal:
+            journal.record(i, result.journal_state)
         
         time.sleep(3)  # Pause between submissions
     
     # Close the browser once all submissions are complete
-    driver.quit()
+    drivers.close()
+    if journal:
+        journal.close()
     # print("All submission attempts completed!")
     logger.info("All submission attempts completed!")
+    WAIT_STATS.log_summary()
+    write_run_metrics()
+    return successful_submissions
 
 if __name__ == "__main__":
+    # Setup logging: form_automation.log and the console, written from a
+    # background thread (see form_logging.py). Only when run as a script, so
+    # importing this module doesn't configure the caller's logging.
+    setup_logging()
+
     # Choose which function to use
 
     submit_form(num_submissions=2, randomize=True)  # Uses prefilled URLs
+    # submit_form(num_submissions=2, randomize=True, engine="http")  # Posts to formResponse, no browser
     # submit_form_with_manual_fill(num_submissions=1, randomize=True)  # Fills in the form manually
\ No newline at end of file
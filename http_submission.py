@@ -0,0 +1,424 @@
+import http.client
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import time
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from form_answers import (
+    DONATION_FORM_URL,
+    FARMER_PAGE_COUNT,
+    build_donation_answers,
+    build_farmer_answers,
+    load_entry_mapping,
+)
+from form_metrics import METRICS, phase, write_run_metrics
+from form_schema import load_schema, refresh_if_changed, schema_page_count, schema_questions
+from job_journal import open_journal
+from retry_policy import (
+    FORM_CLOSED,
+    RATE_LIMITED,
+    CircuitBreaker,
+    SubmissionFailure,
+    call_with_retries,
+    page_failure_kind,
+)
+
+logger = logging.getLogger(__name__)
+
+CONFIRMATION_TEXTS = ("Your response has been recorded", "Form submitted", "Thanks")
+
+_HIDDEN_INPUT_RE = re.compile(r'<input[^>]*type="hidden"[^>]*>')
+_NAME_RE = re.compile(r'name="([^"]*)"')
+_VALUE_RE = re.compile(r'value="([^"]*)"')
+
+
+def form_response_url(form_url):
+    """
+    Turn a viewform (or prefill) URL into the formResponse URL the form posts to
+    """
+    path_url = form_url.split("?", 1)[0]
+    if path_url.endswith("/viewform"):
+        path_url = path_url[: -len("/viewform")]
+    return f"{path_url.rstrip('/')}/formResponse"
+
+
+def parse_hidden_fields(html):
+    """
+    Collect the hidden <input> fields (fbzx, fvv, pageHistory, ...) of a form page
+    """
+    fields = {}
+    for tag in _HIDDEN_INPUT_RE.findall(html):
+        name = _NAME_RE.search(tag)
+        value = _VALUE_RE.search(tag)
+        if name:
+            fields[name.group(1)] = value.group(1) if value else ""
+    return fields
+
+
+def confirmation_signal(html):
+    """
+    What shows that `html` is the confirmation page: "element" for the
+    element holding the confirmation message (checked first, it's one
+    substring search), "text" for one of the confirmation texts, or None
+    """
+    if 'class="vHW8K"' in html:
+        return "element"
+    if any(text in html for text in CONFIRMATION_TEXTS):
+        return "text"
+    return None
+
+
+def is_confirmation_page(html):
+    return confirmation_signal(html) is not None
+
+
+# What a keep-alive connection the server already closed fails with: the
+# write of the request breaks, or the server hangs up without an answer
+_STALE_CONNECTION_ERRORS = (BrokenPipeError, http.client.RemoteDisconnected)
+
+
+class FormHTTPClient:
+    """
+    Small keep-alive HTTP client that pools connections per host so that every
+    submission does not pay for a new TCP/TLS handshake
+    """
+
+    def __init__(self, user_agent=None, pool_size=8, timeout=10):
+        self.user_agent = user_agent or os.getenv("USER_AGENT") or "Mozilla/5.0"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+
+    def _pool(self, scheme, netloc):
+        pool = self._pools.get((scheme, netloc))
+        if pool is None:
+            pool = self._pools.setdefault((scheme, netloc), queue.LifoQueue(maxsize=self.pool_size))
+        return pool
+
+    def _connect(self, scheme, netloc):
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _acquire(self, scheme, netloc):
+        """
+        Tuple of (connection, whether it was reused from the pool)
+        """
+        try:
+            return self._pool(scheme, netloc).get_nowait(), True
+        except queue.Empty:
+            return self._connect(scheme, netloc), False
+
+    def _release(self, scheme, netloc, conn):
+        try:
+            self._pool(scheme, netloc).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None, max_redirects=5):
+        """
+        Send a request, following redirects
+
+        Returns:
+            Tuple of (status, final URL, response body as text)
+        """
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+            send_headers = {"User-Agent": self.user_agent, "Connection": "keep-alive"}
+            send_headers.update(headers or {})
+
+            conn, reused = self._acquire(parts.scheme, parts.netloc)
+            try:
+                response, data = self._send(conn, method, path, body, send_headers)
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # The server had closed the idle keep-alive connection, the
+                # request never reached it: send it once on a fresh one
+                conn = self._connect(parts.scheme, parts.netloc)
+                try:
+                    response, data = self._send(conn, method, path, body, send_headers)
+                except Exception:
+                    conn.close()
+                    raise
+            except Exception:
+                # Timeouts and the rest may come after the server got the
+                # request, resending a POST could record it twice
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                if response.status in (301, 302, 303):
+                    method, body = "GET", None
+                continue
+            return response.status, url, data.decode("utf-8", errors="replace")
+
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    @staticmethod
+    def _send(conn, method, path, body, headers):
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def close(self):
+        for pool in self._pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
+        self._pools = {}
+
+
+def fetch_hidden_fields(client, form_url):
+    """
+    Load the form once to get the per-load hidden fields (fbzx is required by
+    Google to accept a formResponse POST)
+    """
+    with phase("form_load", engine="http"):
+        status, final_url, html = client.request("GET", form_url.split("?", 1)[0])
+    if status == 429:
+        raise SubmissionFailure(RATE_LIMITED, f"Loading {form_url} returned HTTP 429")
+    if status != 200:
+        raise http.client.HTTPException(f"Loading {form_url} returned HTTP {status}")
+    if page_failure_kind(final_url, html) == FORM_CLOSED:
+        raise SubmissionFailure(FORM_CLOSED, f"{form_url} is no longer accepting responses")
+    # The page is here anyway, notice when the form was edited
+    refresh_if_changed(form_url, html)
+    return parse_hidden_fields(html)
+
+
+def submit_answers(client, form_url, answers, page_count=1):
+    """
+    Submit one response with a single POST to the formResponse endpoint
+
+    The outcome isn't counted in the submission metrics, an attempt may be
+    retried: callers count it once per submission (see submit_answers_once).
+
+    Args:
+        client: FormHTTPClient used for the requests
+        form_url: The viewform (or prefill) URL of the form
+        answers: Dict of entry.XXXXXXX -> answer label
+        page_count: Number of sections of the form, all of them are reported
+            as visited in pageHistory so a multi-section form goes through in
+            one request
+
+    Returns:
+        Tuple of (confirmed, HTTP status)
+
+    Raises:
+        SubmissionFailure: The form is closed or the request was rate limited
+    """
+    try:
+        hidden = fetch_hidden_fields(client, form_url)
+    except Exception:
+        METRICS.count_page_error("form_load", engine="http")
+        raise
+    fbzx = hidden.get("fbzx", "")
+
+    data = dict(answers)
+    data["fvv"] = hidden.get("fvv", "1")
+    data["fbzx"] = fbzx
+    data["pageHistory"] = ",".join(str(page) for page in range(page_count))
+    data["partialResponse"] = json.dumps([None, None, fbzx])
+
+    try:
+        with phase("post_response", engine="http"):
+            status, _, html = client.request(
+                "POST",
+                form_response_url(form_url),
+                body=urlencode(data).encode(),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+    except Exception:
+        METRICS.count_page_error("post_response", engine="http")
+        raise
+    if status == 429:
+        # Rejected, nothing was recorded
+        raise SubmissionFailure(RATE_LIMITED, "formResponse returned HTTP 429")
+    # The status is the cheapest signal, the page is only searched on a 200
+    signal = confirmation_signal(html) if status == 200 else f"status_{status}"
+    confirmed = status == 200 and signal is not None
+    METRICS.count_confirmation(signal or "none", engine="http")
+    return confirmed, status
+
+
+def submit_answers_once(client, form_url, answers, page_count=1):
+    """
+    submit_answers for a submission that is not retried, its outcome is
+    counted here
+    """
+    try:
+        confirmed, status = submit_answers(client, form_url, answers, page_count)
+    except Exception:
+        METRICS.count_submission("failed", engine="http")
+        raise
+    METRICS.count_submission("confirmed" if confirmed else "unconfirmed", engine="http")
+    return confirmed, status
+
+
+def form_page_count(form_url, default=1):
+    """
+    Number of sections of a form, taken from its cached schema
+    """
+    try:
+        return schema_page_count(load_schema(form_url))
+    except Exception as e:
+        logger.warning(f"Could not load the schema of {form_url}, assuming {default} sections: {e}")
+        return default
+
+
+def submit_form_http(num_submissions=1, randomize=False, base_url=None, entry=None,
+                     page_count=None, client=None, weights=None, seed=None, answers=None, job_id=None, plan=None):
+    """
+    Submit the farmer survey multiple times without a browser, posting the
+    answers straight to the formResponse endpoint
+
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize some of the answers
+        base_url: Form URL, defaults to GOOGLE_FORM_BASE_PREFILL_URL
+        entry: Field name -> entry.XXXXXXX mapping, defaults to entry_mapping.json
+        page_count: Number of sections of the form, defaults to the number in
+            the form schema
+        client: FormHTTPClient to reuse, a new one is created if not given
+        weights: Optional dict of field name -> option weights used when
+            randomizing (see answer_generation.generate_answer_codes)
+        seed: Seed for reproducible random answers
+        answers: Optional iterable of answer dicts (e.g. from
+            answer_sources.stream_answers) used instead of generated answers
+        job_id: Optional job id to journal progress under, a re-run with the
+            same job id skips the submissions already done
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly (a dict or JSON file, see response_planner.plan_codes)
+
+    Returns:
+        Number of confirmed submissions
+    """
+    base_url = base_url or os.getenv("GOOGLE_FORM_BASE_PREFILL_URL")
+    if entry is None:
+        entry = load_entry_mapping(form_url=base_url)
+    if page_count is None:
+        page_count = form_page_count(base_url, FARMER_PAGE_COUNT)
+    if answers is not None:
+        answer_source = itertools.islice(answers, num_submissions)
+    elif plan is not None:
+        from response_planner import plan_farmer_responses
+
+        answer_source = plan_farmer_responses(entry, num_submissions, plan, weights, seed, randomize)
+    elif randomize:
+        # numpy is only imported when answers are generated
+        from answer_generation import farmer_answer_batch
+
+        answer_source = farmer_answer_batch(entry, num_submissions, weights, seed)
+    else:
+        answer_source = itertools.repeat(build_farmer_answers(entry), num_submissions)
+    return _submit_many(base_url, num_submissions, answer_source, page_count, client, job_id)
+
+
+def submit_donation_survey_http(num_submissions=1, randomize=False, form_url=DONATION_FORM_URL, client=None,
+                                weights=None, seed=None, job_id=None, plan=None, answers=None):
+    """
+    Submit the donation survey multiple times without a browser. The entry ids
+    and option labels come from the cached form schema.
+
+    Args:
+        num_submissions: Number of times to submit the form
+        randomize: Whether to randomize the answers
+        form_url: URL of the form
+        client: FormHTTPClient to reuse, a new one is created if not given
+        weights: Optional dict of question title (or entry id) -> option
+            weights used when randomizing
+        seed: Seed for reproducible random answers
+        job_id: Optional job id to journal progress under, a re-run with the
+            same job id skips the submissions already done
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly (see response_planner.plan_codes)
+        answers: Optional iterable of answer dicts used instead of generated
+            answers
+
+    Returns:
+        Number of confirmed submissions
+    """
+    schema = load_schema(form_url)
+    questions = schema_questions(schema)
+    if answers is not None:
+        answer_source = itertools.islice(answers, num_submissions)
+    elif plan is not None:
+        from response_planner import plan_donation_responses
+
+        answer_source = plan_donation_responses(questions, num_submissions, plan, weights, seed, randomize)
+    elif randomize:
+        from answer_generation import donation_answer_batch
+
+        answer_source = donation_answer_batch(questions, num_submissions, weights, seed)
+    else:
+        answer_source = itertools.repeat(build_donation_answers(questions), num_submissions)
+    return _submit_many(form_url, num_submissions, answer_source, schema_page_count(schema), client, job_id)
+
+
+def _submit_many(form_url, num_submissions, answer_source, page_count, client=None, job_id=None,
+                 retry_policy=None):
+    own_client = client is None
+    if own_client:
+        client = FormHTTPClient()
+    journal = open_journal(job_id)
+    breaker = CircuitBreaker()
+
+    successful_submissions = journal.confirmed_count if journal else 0
+    start = time.perf_counter()
+
+    for i, answers in enumerate(answer_source):
+        if journal and journal.is_done(i):
+            continue
+        logger.info(f"======Processing submission {i+1}/{num_submissions}")
+        result = call_with_retries(
+            lambda: submit_answers(client, form_url, answers, page_count)[0],
+            retry_policy,
+            breaker,
+            f"Submission {i+1}/{num_submissions}",
+        )
+        if not result.attempts:
+            logger.error(f"Stopping at submission {i+1}/{num_submissions}: {breaker.halted}")
+            break
+        # Once per submission, however many attempts it took
+        METRICS.count_submission(result.outcome, engine="http")
+
+        if result.confirmed:
+            successful_submissions += 1
+            logger.info(f"Submission {i+1}/{num_submissions} confirmed successful")
+        if journal:
+            journal.record(i, result.journal_state)
+
+    if own_client:
+        client.close()
+    if journal:
+        journal.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"All submission attempts completed! Successful: {successful_submissions}/{num_submissions} in {elapsed:.2f}s")
+    write_run_metrics()
+    return successful_submissions
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from form_logging import setup_logging
+
+    setup_logging()
+    submit_form_http(num_submissions=2, randomize=True)
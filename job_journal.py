@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = ".journal"
+
+# Submission states written to the journal
+OK = "ok"
+UNCONFIRMED = "unconfirmed"
+FAILED = "failed"
+
+# One byte per submission index holds its latest state
+_STATE_CODES = {FAILED: 1, UNCONFIRMED: 2, OK: 3}
+
+
+class JobJournal:
+    """
+    Append-only journal of the submissions of one job, so that a crashed run
+    can be resumed without sending duplicates.
+
+    Every line is "<submission index>\\t<state>". Writes are buffered and
+    fsynced in batches (every `fsync_every` records or `fsync_interval`
+    seconds, whichever comes first). On open the journal is replayed into a
+    byte per index, so checking whether an index is done is O(1).
+
+    Submissions that were confirmed (ok) or clicked but not confirmed
+    (unconfirmed) count as done: the form may already hold the response.
+    Failed submissions never reached the submit step and are retried.
+    """
+
+    def __init__(self, job_id, journal_dir=JOURNAL_DIR, fsync_every=50, fsync_interval=1.0,
+                 retry_unconfirmed=False):
+        self.job_id = job_id
+        self.path = os.path.join(journal_dir, f"{job_id}.journal")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        done_states = {OK} if retry_unconfirmed else {OK, UNCONFIRMED}
+        self._done_codes = {_STATE_CODES[state] for state in done_states}
+
+        self._states = bytearray()
+        self._counts = [0] * 4
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(journal_dir, exist_ok=True)
+        self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # A crash can leave the last line half written
+        valid_size = data.rfind(b"\n") + 1
+        state_codes = {state.encode(): code for state, code in _STATE_CODES.items()}
+        for line in data[:valid_size].splitlines():
+            index, _, state = line.partition(b"\t")
+            code = state_codes.get(state)
+            if code and index.isdigit():
+                self._mark(int(index), code)
+        if valid_size < len(data):
+            # Drop the torn line so new records start on a fresh line
+            os.truncate(self.path, valid_size)
+        if self.done_count:
+            logger.info(f"Journal {self.path}: {self.done_count} submissions already done")
+
+    def _mark(self, index, code):
+        if index >= len(self._states):
+            # Grow geometrically so appending in index order stays cheap
+            self._states.extend(bytes(max(index + 1 - len(self._states), len(self._states))))
+        self._counts[self._states[index]] -= 1
+        self._counts[code] += 1
+        self._states[index] = code
+
+    @property
+    def done_count(self):
+        return sum(self._counts[code] for code in self._done_codes)
+
+    @property
+    def confirmed_count(self):
+        return self._counts[_STATE_CODES[OK]]
+
+    def is_done(self, index):
+        return index < len(self._states) and self._states[index] in self._done_codes
+
+    def pending(self, num_submissions):
+        """
+        Indices below num_submissions that still have to be submitted
+        """
+        return (i for i in range(num_submissions) if not self.is_done(i))
+
+    def record(self, index, state):
+        """
+        Append the outcome of one submission (OK, UNCONFIRMED or FAILED)
+        """
+        with self._lock:
+            self._file.write(f"{index}\t{state}\n")
+            self._mark(index, _STATE_CODES[state])
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_journal(job_id, **kwargs):
+    """
+    JobJournal for job_id, or None when no job id is given
+    """
+    return JobJournal(job_id, **kwargs) if job_id else None
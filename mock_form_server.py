@@ -0,0 +1,340 @@
+import html
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from form_answers import DONATION_OPTIONS, FARMER_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# Stand-ins for the two forms this project submits to. Every section is a list
+# of (question title, option labels).
+FARMER_FORM_ID = "mock-farmer-survey"
+DONATION_FORM_ID = "mock-donation-survey"
+
+
+def _questions(options, fields):
+    return [(field.replace("_", " ").capitalize(), options[field]) for field in fields]
+
+
+MOCK_FORMS = {
+    FARMER_FORM_ID: {
+        "title": "Farmer survey",
+        "sections": [
+            _questions(FARMER_OPTIONS, ["market", "certified", "quality_check", "available", "accessible"]),
+            _questions(FARMER_OPTIONS, ["payment_method", "interest_trying", "location", "frequency", "purchase_place"]),
+            _questions(FARMER_OPTIONS, ["priority", "recommendation", "already_used", "openness", "importance", "feedback"]),
+        ],
+    },
+    DONATION_FORM_ID: {
+        "title": "Donation survey",
+        "sections": [_questions(DONATION_OPTIONS, list(DONATION_OPTIONS))],
+    },
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<link rel="stylesheet" href="/static/form.css">
+<script>var FB_PUBLIC_LOAD_DATA_ = {load_data};
+</script>
+<script>
+function pick(radio) {{
+  var group = radio.parentNode;
+  var radios = group.querySelectorAll('div[role="radio"]');
+  for (var i = 0; i < radios.length; i++) radios[i].setAttribute('aria-checked', 'false');
+  radio.setAttribute('aria-checked', 'true');
+  document.querySelector('input[name="' + group.getAttribute('data-entry') + '"]').value = radio.getAttribute('data-value');
+}}
+function go(next) {{
+  document.querySelector('input[name="continue"]').value = next ? '1' : '';
+  document.getElementById('mG61Hd').submit();
+}}
+</script>
+</head><body>
+<form id="mG61Hd" method="POST" action="formResponse">
+<div class="header"><img src="/static/banner.png" alt=""><div role="heading">{title}</div></div>
+<div><div>
+<div class="section-title">{section_title}</div>
+<div class="questions">{questions}</div>
+<div><div><div class="buttons">{buttons}</div></div></div>
+</div></div>
+{hidden}
+</form>
+</body></html>
+"""
+
+# Like the real forms the pages pull in a stylesheet, a web font and a banner
+# image, so blocking resources (browser_profiles.py) has something to save
+STATIC_ASSETS = {
+    "form.css": (
+        "text/css",
+        b"@font-face { font-family: 'Mock Sans'; src: url('/static/mock-sans.woff2') format('woff2'); }\n"
+        b"body { font-family: 'Mock Sans', sans-serif; }\n"
+        b".header img { width: 100%; height: 120px; }\n",
+    ),
+    "mock-sans.woff2": ("font/woff2", bytes(128 * 1024)),
+    "banner.png": ("image/png", bytes(512 * 1024)),
+}
+
+CONFIRMATION_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title></head><body>
+<div role="heading">{title}</div>
+<div class="vHW8K">Your response has been recorded.</div>
+</body></html>
+"""
+
+CLOSED_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title></head><body>
+<div class="closed">This form is no longer accepting responses</div>
+</body></html>
+"""
+
+
+def entry_id(form_id, section_index, question_index):
+    # Stable, form specific entry ids
+    return 1000000 + 10000 * (list(MOCK_FORMS).index(form_id) + 1) + 100 * section_index + question_index
+
+
+def load_data(form_id):
+    """
+    FB_PUBLIC_LOAD_DATA_ in the same layout as Google Forms, so form_schema.py
+    can discover the mock forms
+    """
+    form = MOCK_FORMS[form_id]
+    items = []
+    for section_index, section in enumerate(form["sections"]):
+        if section_index:
+            items.append([900 + section_index, f"Section {section_index + 1}", None, 8, None])
+        for question_index, (title, options) in enumerate(section):
+            items.append([
+                100 * section_index + question_index,
+                title,
+                None,
+                2,
+                [[entry_id(form_id, section_index, question_index), [[option] for option in options], 1]],
+            ])
+    return [None, ["", items, None], "/forms", form["title"]]
+
+
+def _button(label):
+    return f'<div role="button" onclick="go({str(label == "Next").lower()})"><span><span>{label}</span></span></div>'
+
+
+def render_page(form_id, page, values, fbzx, page_history):
+    form = MOCK_FORMS[form_id]
+    sections = form["sections"]
+
+    questions = []
+    hidden = {"fvv": "1", "fbzx": fbzx, "pageHistory": page_history, "continue": ""}
+    for section_index, section in enumerate(sections):
+        for question_index, (title, options) in enumerate(section):
+            name = f"entry.{entry_id(form_id, section_index, question_index)}"
+            hidden[name] = values.get(name, "")
+            if section_index != page:
+                continue
+            radios = "".join(
+                f'<div role="radio" data-value="{html.escape(option)}" '
+                f'aria-checked="{str(values.get(name) == option).lower()}" onclick="pick(this)">'
+                f'<span>{html.escape(option)}</span></div>'
+                for option in options
+            )
+            questions.append(
+                f'<div role="listitem" data-params="{name}"><div role="heading">{html.escape(title)}</div>'
+                f'<div role="radiogroup" data-entry="{name}">{radios}</div></div>'
+            )
+
+    buttons = []
+    if page > 0:
+        buttons.append(_button("Back"))
+    buttons.append(_button("Next" if page < len(sections) - 1 else "Submit"))
+
+    return PAGE_TEMPLATE.format(
+        title=html.escape(form["title"]),
+        load_data=json.dumps(load_data(form_id)),
+        section_title=html.escape(f"Section {page + 1} of {len(sections)}"),
+        questions="".join(questions),
+        buttons="".join(buttons),
+        hidden="\n".join(
+            f'<input type="hidden" name="{name}" value="{html.escape(value)}">' for name, value in hidden.items()
+        ),
+    )
+
+
+class MockFormState:
+    """
+    Responses and per-submission latencies recorded by the mock server. A
+    submission's latency runs from the viewform GET that issued its fbzx to
+    the POST that completed it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.sessions = {}
+            self.responses = {form_id: 0 for form_id in MOCK_FORMS}
+            self.latencies = {form_id: [] for form_id in MOCK_FORMS}
+            self.requests = 0
+
+    def new_session(self):
+        fbzx = str(-random.getrandbits(62))
+        with self.lock:
+            self.sessions[fbzx] = time.perf_counter()
+        return fbzx
+
+    def complete(self, form_id, fbzx):
+        with self.lock:
+            self.responses[form_id] += 1
+            start = self.sessions.pop(fbzx, None)
+            if start is not None:
+                self.latencies[form_id].append(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "responses": dict(self.responses),
+                "latencies": {form_id: list(values) for form_id, values in self.latencies.items()},
+            }
+
+
+class MockFormHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes, don't let Nagle delay them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _form_route(self, path):
+        parts = path.strip("/").split("/")
+        # forms/d/e/<form id>/<action>
+        if len(parts) == 5 and parts[:3] == ["forms", "d", "e"] and parts[3] in MOCK_FORMS:
+            return parts[3], parts[4]
+        return None, None
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_GET(self):
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        url = urlsplit(self.path)
+
+        if url.path == "/stats":
+            return self._send(200, json.dumps(state.snapshot()), "application/json")
+        if url.path.startswith("/static/"):
+            asset = STATIC_ASSETS.get(url.path[len("/static/"):])
+            if asset is None:
+                return self._send(404, "Not found")
+            self._delay()
+            content_type, data = asset
+            return self._send(200, data, content_type)
+
+        form_id, action = self._form_route(url.path)
+        if action != "viewform":
+            return self._send(404, "Not found")
+        self._delay()
+        if self.server.closed:
+            return self._send(200, CLOSED_TEMPLATE.format(title="Form closed"))
+
+        prefill = {name: values[-1] for name, values in parse_qs(url.query).items() if name.startswith("entry.")}
+        self._send(200, render_page(form_id, 0, prefill, state.new_session(), "0"))
+
+    def do_POST(self):
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        url = urlsplit(self.path)
+
+        if url.path == "/reset":
+            state.reset()
+            return self._send(200, "{}", "application/json")
+
+        form_id, action = self._form_route(url.path)
+        if action != "formResponse":
+            return self._send(404, "Not found")
+        self._delay()
+
+        length = int(self.headers.get("Content-Length") or 0)
+        fields = {name: values[-1] for name, values in parse_qs(self.rfile.read(length).decode()).items()}
+        if "fbzx" not in fields:
+            return self._send(400, "Missing fbzx")
+        if self.server.rate_limit_every and (state.requests % self.server.rate_limit_every) == 0:
+            return self._send(429, "Too many requests")
+
+        if fields.get("continue") == "1":
+            history = fields.get("pageHistory", "0")
+            next_page = int(history.split(",")[-1]) + 1
+            if next_page < len(MOCK_FORMS[form_id]["sections"]):
+                return self._send(200, render_page(form_id, next_page, fields, fields["fbzx"], f"{history},{next_page}"))
+
+        state.complete(form_id, fields["fbzx"])
+        self._send(200, CONFIRMATION_TEMPLATE.format(title=html.escape(MOCK_FORMS[form_id]["title"])))
+
+
+class MockFormServer(ThreadingHTTPServer):
+    """
+    Local stand-in for Google Forms serving the farmer and donation surveys
+
+    Args:
+        port: Port to listen on, 0 picks a free one
+        latency: Seconds added to every form request to mimic the network
+        closed: Serve the "no longer accepting responses" page instead
+        rate_limit_every: Answer every Nth request with HTTP 429 (0 = never)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, closed=False, rate_limit_every=0):
+        super().__init__((host, port), MockFormHandler)
+        self.latency = latency
+        self.closed = closed
+        self.rate_limit_every = rate_limit_every
+        self.state = MockFormState()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def form_url(self, form_id):
+        return f"{self.base_url}/forms/d/e/{form_id}/viewform"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="mock-form-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the local mock Google Forms server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = MockFormServer(port=args.port, latency=args.latency)
+    for form_id in MOCK_FORMS:
+        print(f"{MOCK_FORMS[form_id]['title']}: {server.form_url(form_id)}")
+    server.serve_forever()
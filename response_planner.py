@@ -0,0 +1,234 @@
+import json
+import logging
+
+import numpy as np
+
+from answer_generation import (
+    AnswerBatch,
+    donation_answer_table,
+    donation_fixed_codes,
+    farmer_answer_table,
+    farmer_fixed_codes,
+    generate_answer_codes,
+)
+
+logger = logging.getLogger(__name__)
+
+EXAMPLE_PLAN = {
+    "quotas": {
+        "location": {"Rural": 0.6, "Urban": 0.4},
+    },
+    "rules": [
+        {"if": {"location": "Rural"}, "then": {"frequency": {"Daily": 1, "Weekly": 2, "Monthly": 1, "Rarely": 1}}},
+    ],
+}
+
+
+def load_plan(path):
+    """
+    Read a plan (see plan_codes) from a JSON file
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def exact_counts(weights, total):
+    """
+    Split `total` over the options in proportion to `weights`, rounding with
+    the largest remainder method so the counts add up to exactly `total`
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if total == 0 or weights.sum() <= 0:
+        return np.zeros(len(weights), dtype=np.int64)
+    raw = weights / weights.sum() * total
+    counts = np.floor(raw).astype(np.int64)
+    missing = total - counts.sum()
+    counts[np.argsort(counts - raw, kind="stable")[:missing]] += 1
+    return counts
+
+
+def _assign(codes, rows, q, counts, rng):
+    """
+    Give the rows exactly counts[k] answers of option k for question q, in
+    random order
+    """
+    values = np.repeat(np.arange(len(counts), dtype=np.uint8), counts)
+    rng.shuffle(values)
+    codes[rows, q] = values
+
+
+class _Plan:
+    """
+    A plan resolved against an AnswerTable: question names and option labels
+    turned into indices, questions ordered so every rule comes after the
+    questions its condition looks at
+    """
+
+    def __init__(self, table, plan):
+        self.table = table
+        self.quotas = {
+            self.question(name): self.option_weights(self.question(name), weights)
+            for name, weights in (plan.get("quotas") or {}).items()
+        }
+        self.rules = {}
+        for rule in plan.get("rules") or []:
+            condition = [
+                (self.question(name), self.option_codes(self.question(name), labels))
+                for name, labels in rule["if"].items()
+            ]
+            for name, weights in rule["then"].items():
+                q = self.question(name)
+                self.rules.setdefault(q, []).append((condition, self.option_weights(q, weights)))
+        self.order = self._order()
+
+    def question(self, name):
+        for names in (self.table.names, self.table.entries):
+            if name in names:
+                return names.index(name)
+        raise ValueError(f"Unknown question {name!r} in the plan")
+
+    def option_codes(self, q, labels):
+        labels = [labels] if isinstance(labels, str) else labels
+        unknown = [label for label in labels if label not in self.table.labels[q]]
+        if unknown:
+            raise ValueError(f"Unknown options {unknown} for {self.table.names[q]}, "
+                             f"expected some of {self.table.labels[q]}")
+        return [self.table.labels[q].index(label) for label in labels]
+
+    def option_weights(self, q, weights):
+        """
+        Array of per-option weights from a dict of label -> weight, options
+        left out get none
+        """
+        array = np.zeros(self.table.option_counts[q], dtype=np.float64)
+        for code, weight in zip(self.option_codes(q, list(weights)), weights.values()):
+            array[code] = weight
+        if (array < 0).any() or array.sum() <= 0:
+            raise ValueError(f"Bad quota for {self.table.names[q]}: {weights}")
+        return array
+
+    def _order(self):
+        """
+        Planned questions in an order where each rule's condition is already
+        answered when its question is planned
+        """
+        planned = set(self.quotas) | set(self.rules)
+        depends = {
+            q: {cq for condition, _ in self.rules.get(q, []) for cq, _ in condition} & planned
+            for q in planned
+        }
+        order = []
+        while depends:
+            ready = sorted(q for q, needs in depends.items() if not needs - set(order))
+            if not ready:
+                cycle = ", ".join(self.table.names[q] for q in sorted(depends))
+                raise ValueError(f"The rules of the plan depend on each other in a cycle: {cycle}")
+            order.extend(ready)
+            for q in ready:
+                del depends[q]
+        return order
+
+
+def plan_codes(table, num_responses, plan, weights=None, seed=None, fixed=None):
+    """
+    Build the answers of num_responses responses that meet the plan exactly,
+    in O(responses x questions)
+
+    A plan is a dict (or JSON file) with optional "quotas" and "rules":
+
+        {
+            "quotas": {"location": {"Rural": 0.6, "Urban": 0.4}},
+            "rules": [{"if": {"location": "Rural"},
+                       "then": {"frequency": {"Daily": 1, "Weekly": 2, "Monthly": 1, "Rarely": 1}}}]
+        }
+
+    A quota gives the share of every option of a question over all responses
+    (weights, or counts adding up to num_responses); options left out are
+    never picked. A rule gives the shares of a question among the responses
+    matching its condition (question -> label or list of labels, all of them
+    have to match), the first matching rule of a question wins. Shares are
+    rounded to whole responses with the largest remainder method, so 60% of
+    1000 is exactly 600. When a question has both, the responses no rule
+    matched make up what the rules left of the quota.
+
+    Questions the plan doesn't mention are drawn like generate_answer_codes
+    does (`weights`, `fixed`). Finally the responses are shuffled, so the
+    order they are submitted in carries no pattern.
+
+    Args:
+        table: AnswerTable of the form
+        num_responses: Number of responses to plan
+        plan: Plan dict, see above, or the path of a JSON file holding one.
+            Questions are named as in the table or by entry id.
+        weights: Optional option weights of the unplanned questions
+        seed: Seed for a reproducible plan
+        fixed: Optional dict of question index -> option index for the
+            unplanned questions
+
+    Returns:
+        uint8 array of shape (num_responses, number of questions)
+    """
+    rng = np.random.default_rng(seed)
+    if isinstance(plan, str):
+        plan = load_plan(plan)
+    resolved = _Plan(table, plan)
+    codes = generate_answer_codes(table, num_responses, weights, rng, fixed)
+
+    for q in resolved.order:
+        unassigned = np.ones(num_responses, dtype=bool)
+        used = np.zeros(table.option_counts[q], dtype=np.int64)
+        for condition, rule_weights in resolved.rules.get(q, []):
+            match = unassigned.copy()
+            for cq, options in condition:
+                match &= np.isin(codes[:, cq], options)
+            rows = np.flatnonzero(match)
+            counts = exact_counts(rule_weights, len(rows))
+            _assign(codes, rows, q, counts, rng)
+            used += counts
+            unassigned[rows] = False
+
+        rows = np.flatnonzero(unassigned)
+        if q in resolved.quotas:
+            target = exact_counts(resolved.quotas[q], num_responses)
+            need = np.clip(target - used, 0, None)
+            if need.sum() != len(rows):
+                logger.warning(
+                    f"The rules leave the quota of {table.names[q]} unreachable: "
+                    f"{dict(zip(table.labels[q], target.tolist()))} asked, "
+                    f"{dict(zip(table.labels[q], used.tolist()))} already given by the rules"
+                )
+                need = exact_counts(need if need.sum() else resolved.quotas[q], len(rows))
+            _assign(codes, rows, q, need, rng)
+        # Otherwise the unmatched responses keep their drawn answers
+
+    # Indexing with a permutation is an order of magnitude faster than
+    # shuffling the rows of a 2-D array in place
+    return codes[rng.permutation(num_responses)]
+
+
+def plan_farmer_responses(entry, num_responses, plan, weights=None, seed=None, randomize=True):
+    """
+    Planned farmer survey responses (see plan_codes). With randomize=False
+    the questions the plan leaves out get the fixed answers, as without a plan.
+
+    Returns:
+        AnswerBatch decoding one response at a time
+    """
+    table = farmer_answer_table(entry)
+    fixed = None if randomize else farmer_fixed_codes(table)
+    return AnswerBatch(table, plan_codes(table, num_responses, plan, weights, seed, fixed))
+
+
+def plan_donation_responses(questions, num_responses, plan, weights=None, seed=None, randomize=True):
+    """
+    Planned donation survey responses (see plan_codes). The questions the
+    plan leaves out follow the usual rules: the ninth question is answered
+    with its first option, and with randomize=False every question with its
+    default.
+
+    Returns:
+        AnswerBatch decoding one response at a time
+    """
+    table = donation_answer_table(questions)
+    fixed = donation_fixed_codes(questions, randomize)
+    return AnswerBatch(table, plan_codes(table, num_responses, plan, weights, seed, fixed))
@@ -0,0 +1,337 @@
+import http.client
+import logging
+import random
+import socket
+import threading
+import time
+import urllib.error
+from collections import deque
+from dataclasses import dataclass
+
+from form_metrics import METRICS
+from job_journal import FAILED, OK, UNCONFIRMED
+
+logger = logging.getLogger(__name__)
+
+# Kinds of failure, each has its own backoff and retry budget
+NAVIGATION_TIMEOUT = "navigation_timeout"
+ELEMENT_NOT_FOUND = "element_not_found"
+FORM_CLOSED = "form_closed"
+RATE_LIMITED = "rate_limited"
+NOT_CONFIRMED = "unconfirmed"
+
+CLOSED_FORM_TEXTS = ("no longer accepting responses", "closedform")
+RATE_LIMIT_TEXTS = ("unusual traffic", "too many requests", "try again later")
+
+# Selenium exceptions by name so this module doesn't need selenium (the HTTP
+# engine uses it too)
+_TIMEOUT_ERRORS = ("TimeoutException", "TimeoutError", "timeout")
+_ELEMENT_ERRORS = (
+    "NoSuchElementException",
+    "ElementNotInteractableException",
+    "ElementClickInterceptedException",
+    "StaleElementReferenceException",
+)
+
+
+class SubmissionFailure(Exception):
+    """
+    A failed submission attempt
+
+    Args:
+        kind: One of the failure kinds above
+        message: What went wrong
+        submitted: True if the form may have been submitted anyway (the
+            submit click went through but no confirmation was seen), such an
+            attempt is not retried by default so nothing is submitted twice
+    """
+
+    def __init__(self, kind, message="", submitted=False):
+        super().__init__(f"{kind}: {message}" if message else kind)
+        self.kind = kind
+        self.submitted = submitted
+
+
+def page_failure_kind(url="", text=""):
+    """
+    FORM_CLOSED or RATE_LIMITED if the page says so, otherwise None
+    """
+    haystack = f"{url}\n{text}".lower()
+    if any(marker in haystack for marker in CLOSED_FORM_TEXTS):
+        return FORM_CLOSED
+    if any(marker in haystack for marker in RATE_LIMIT_TEXTS):
+        return RATE_LIMITED
+    return None
+
+
+def confirmation_failure(signal):
+    """
+    SubmissionFailure for a confirmation wait that ended on a signal other
+    than a confirmation (see form_waits.PageWaiter.confirmation)
+    """
+    if signal == "closed":
+        return SubmissionFailure(FORM_CLOSED, "form closed after the submit click")
+    if signal == "status_429":
+        # Rejected, nothing was recorded
+        return SubmissionFailure(RATE_LIMITED, "formResponse returned HTTP 429")
+    return SubmissionFailure(NOT_CONFIRMED, f"confirmation wait ended on {signal}", submitted=True)
+
+
+def classify(error, driver=None, submitted=False):
+    """
+    Turn an exception from a submission attempt into a SubmissionFailure
+
+    Args:
+        error: The exception
+        driver: Optional WebDriver, its current page is checked for the
+            "form closed" and rate limiting pages
+        submitted: Whether the submit click had already gone through
+    """
+    if isinstance(error, SubmissionFailure):
+        return error
+
+    kind = None
+    if driver is not None:
+        try:
+            kind = page_failure_kind(driver.current_url, driver.execute_script("return document.body.innerText"))
+        except Exception:
+            pass
+
+    if kind is None:
+        name = type(error).__name__
+        if name in _ELEMENT_ERRORS:
+            kind = ELEMENT_NOT_FOUND
+        elif name in _TIMEOUT_ERRORS or isinstance(error, (socket.timeout, TimeoutError)):
+            kind = NOT_CONFIRMED if submitted else NAVIGATION_TIMEOUT
+        elif isinstance(error, urllib.error.HTTPError) and error.code == 429:
+            kind = RATE_LIMITED
+        elif isinstance(error, (OSError, http.client.HTTPException)):
+            # Connection errors and unexpected HTTP statuses while loading
+            kind = NAVIGATION_TIMEOUT
+        else:
+            kind = NOT_CONFIRMED if submitted else ELEMENT_NOT_FOUND
+    return SubmissionFailure(kind, f"{type(error).__name__}: {error}", submitted)
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and jitter, per failure kind
+
+    Args:
+        max_retries: Dict of kind -> retries allowed per submission
+        backoff: Dict of kind -> (base delay, max delay) in seconds
+        retry_submitted: Also retry attempts whose submit click may have
+            gone through (risks duplicate responses)
+    """
+
+    DEFAULT_MAX_RETRIES = {
+        NAVIGATION_TIMEOUT: 2,
+        ELEMENT_NOT_FOUND: 1,
+        RATE_LIMITED: 3,
+        FORM_CLOSED: 0,
+        NOT_CONFIRMED: 0,
+    }
+    DEFAULT_BACKOFF = {
+        NAVIGATION_TIMEOUT: (1.0, 10.0),
+        ELEMENT_NOT_FOUND: (0.5, 2.0),
+        RATE_LIMITED: (5.0, 60.0),
+        FORM_CLOSED: (0.0, 0.0),
+        NOT_CONFIRMED: (2.0, 10.0),
+    }
+
+    def __init__(self, max_retries=None, backoff=None, retry_submitted=False):
+        self.max_retries = {**self.DEFAULT_MAX_RETRIES, **(max_retries or {})}
+        self.backoff = {**self.DEFAULT_BACKOFF, **(backoff or {})}
+        self.retry_submitted = retry_submitted
+
+    def should_retry(self, failure, retries_so_far):
+        if failure.submitted and not self.retry_submitted:
+            return False
+        return retries_so_far < self.max_retries.get(failure.kind, 0)
+
+    def delay(self, failure, retries_so_far):
+        base, cap = self.backoff.get(failure.kind, (1.0, 10.0))
+        # "Full jitter": spread the retries of concurrent workers out
+        return random.uniform(0, min(cap, base * 2 ** retries_so_far))
+
+
+class CircuitBreaker:
+    """
+    Shared by all workers of a run. When too many of the recent attempts
+    failed the circuit opens and every worker pauses for `cooldown` seconds
+    instead of each of them burning a full timeout on an attempt that is
+    bound to fail. After the pause attempts go through again; if the error
+    rate is still high the circuit opens again with a doubled cooldown.
+
+    A closed form halts the circuit for good.
+
+    Args:
+        window: Number of recent attempts the error rate is computed over
+        threshold: Error rate (0-1) that opens the circuit
+        min_attempts: Attempts needed in the window before it can open
+        cooldown: Seconds the circuit stays open the first time
+        max_cooldown: Upper bound of the doubled cooldowns
+    """
+
+    def __init__(self, window=20, threshold=0.5, min_attempts=10, cooldown=30.0, max_cooldown=300.0):
+        self.threshold = threshold
+        self.min_attempts = min_attempts
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.results = deque(maxlen=window)
+        self.open_until = 0.0
+        self.halted = None
+        self.trips = 0
+        self._condition = threading.Condition()
+
+    def wait(self):
+        """
+        Block while the circuit is open
+
+        Returns:
+            False if the circuit was halted, True when attempts may go on
+        """
+        with self._condition:
+            while True:
+                if self.halted:
+                    return False
+                remaining = self.open_until - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._condition.wait(remaining)
+
+    def record(self, success):
+        with self._condition:
+            self.results.append(bool(success))
+            if len(self.results) < self.min_attempts:
+                return
+            failures = self.results.count(False)
+            if failures / len(self.results) < self.threshold / 2:
+                # Healthy again, the next trip starts from the base cooldown
+                self.cooldown = self.base_cooldown
+            elif not success and failures / len(self.results) >= self.threshold:
+                self._open(self.cooldown, f"{failures}/{len(self.results)} recent attempts failed")
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.results.clear()
+
+    def trip(self, seconds, reason):
+        """
+        Open the circuit for `seconds` right away, e.g. when rate limited
+        """
+        with self._condition:
+            self._open(seconds, reason)
+
+    def halt(self, reason):
+        with self._condition:
+            self.halted = reason
+            self._condition.notify_all()
+        logger.error(f"Circuit breaker halted: {reason}")
+
+    def _open(self, seconds, reason):
+        until = time.monotonic() + seconds
+        if until > self.open_until:
+            self.open_until = until
+            self.trips += 1
+            logger.warning(f"Circuit breaker open for {seconds:.1f}s: {reason}")
+            METRICS.set_gauge("circuit_breaker_trips", self.trips)
+
+
+@dataclass
+class RetryResult:
+    confirmed: bool
+    attempts: int
+    failure: SubmissionFailure = None
+    # Seconds to back off before the next attempt (see attempt_once), None
+    # once the submission is settled
+    retry_in: float = None
+
+    @property
+    def journal_state(self):
+        """
+        What to record in the job journal: a submission that may have gone
+        through is UNCONFIRMED so a resumed run doesn't send it again
+        """
+        if self.confirmed:
+            return OK
+        return UNCONFIRMED if self.failure is not None and self.failure.submitted else FAILED
+
+    @property
+    def outcome(self):
+        """
+        How the submission is counted in METRICS.count_submission
+        """
+        return {OK: "confirmed", UNCONFIRMED: "unconfirmed", FAILED: "failed"}[self.journal_state]
+
+
+def attempt_once(attempt, policy=None, breaker=None, label="submission", retries=0):
+    """
+    One attempt of a submission, with the bookkeeping of call_with_retries
+    but without waiting: a failure that should be retried comes back with
+    `retry_in` set, and the caller decides where the backoff is spent (e.g.
+    the scheduler requeues the submission instead of holding a worker).
+
+    Args:
+        attempt: Callable performing the attempt, see call_with_retries
+        policy: RetryPolicy, the defaults if not given
+        breaker: Optional CircuitBreaker shared by the workers of the run
+        label: Name of the submission for the log
+        retries: Retries of this submission before this attempt
+
+    Returns:
+        RetryResult
+    """
+    policy = policy or RetryPolicy()
+    attempts = retries + 1
+    try:
+        if attempt():
+            if breaker:
+                breaker.record(True)
+            return RetryResult(True, attempts)
+        failure = SubmissionFailure(NOT_CONFIRMED, "no confirmation page", submitted=True)
+    except Exception as e:
+        failure = classify(e)
+
+    if breaker:
+        breaker.record(False)
+        if failure.kind == FORM_CLOSED:
+            breaker.halt(f"form closed ({label})")
+    if not policy.should_retry(failure, retries):
+        METRICS.count_failure(failure.kind, retried="false")
+        logger.warning(f"{label} failed after {attempts} attempt(s): {failure}")
+        return RetryResult(False, attempts, failure)
+
+    delay = policy.delay(failure, retries)
+    if breaker and failure.kind == RATE_LIMITED:
+        # Everyone backs off, not just this worker
+        breaker.trip(delay, f"rate limited ({label})")
+    METRICS.count_failure(failure.kind, retried="true")
+    logger.info(f"{label}: {failure}, retry {retries + 1} in {delay:.1f}s")
+    return RetryResult(False, attempts, failure, retry_in=delay)
+
+
+def call_with_retries(attempt, policy=None, breaker=None, label="submission"):
+    """
+    Run one submission with retries
+
+    Args:
+        attempt: Callable performing one attempt. Returns True if confirmed,
+            False if submitted without confirmation, or raises (preferably a
+            SubmissionFailure, other exceptions are classified)
+        policy: RetryPolicy, the defaults if not given
+        breaker: Optional CircuitBreaker shared by the workers of the run
+        label: Name of the submission for the log
+
+    Returns:
+        RetryResult. attempts == 0 means the breaker was halted before the
+        submission was tried.
+    """
+    retries = 0
+    while True:
+        if breaker and not breaker.wait():
+            return RetryResult(False, retries, SubmissionFailure(FORM_CLOSED, breaker.halted))
+        result = attempt_once(attempt, policy, breaker, label, retries)
+        if result.retry_in is None:
+            return result
+        retries += 1
+        time.sleep(result.retry_in)
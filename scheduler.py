@@ -0,0 +1,481 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+from form_answers import DONATION_FORM_URL, FARMER_PAGE_COUNT, build_donation_answers, build_farmer_answers
+from form_metrics import METRICS, write_run_metrics
+from job_journal import open_journal
+from retry_policy import CircuitBreaker, RetryPolicy, attempt_once
+
+logger = logging.getLogger(__name__)
+
+FORMS = ("farmer", "donation")
+ENGINES = ("http", "selenium")
+
+EXAMPLE_JOB_FILE = """{
+  "workers": 8,
+  "forms": [
+    {"name": "farmers", "form": "farmer", "engine": "http", "count": 500, "rate": 2, "weight": 2,
+     "answers": {"randomize": true, "seed": 1}},
+    {"name": "donations", "form": "donation", "engine": "selenium", "count": 100, "weight": 1,
+     "browser_profile": "lean", "job_id": "donations-oct"},
+    {"name": "replay", "form": "farmer", "engine": "http", "count": 1000,
+     "answers": {"file": "answers.csv"}}
+  ]
+}"""
+
+
+class FormJob:
+    """
+    One form of the job file: where to submit, how many times, with which
+    engine and answers
+
+    Spec keys: name, form ("farmer"/"donation"), url, engine ("http"/
+    "selenium"), count, weight (share of the workers, default 1), rate
+    (max submissions per second), concurrency (max workers at once),
+    answers ({"randomize", "seed", "weights"} or {"file", "columns"}),
+    job_id, browser_profile
+    """
+
+    def __init__(self, spec):
+        self.name = spec.get("name") or spec["form"]
+        self.form = spec["form"]
+        if self.form not in FORMS:
+            raise ValueError(f"{self.name}: unknown form {self.form!r}, expected one of {', '.join(FORMS)}")
+        self.engine = spec.get("engine", "http")
+        if self.engine not in ENGINES:
+            raise ValueError(f"{self.name}: unknown engine {self.engine!r}, expected one of {', '.join(ENGINES)}")
+        self.url = spec.get("url") or (
+            os.getenv("GOOGLE_FORM_BASE_PREFILL_URL") if self.form == "farmer" else DONATION_FORM_URL
+        )
+        self.count = int(spec["count"])
+        self.weight = float(spec.get("weight", 1))
+        if self.weight <= 0:
+            raise ValueError(f"{self.name}: weight must be positive")
+        self.min_interval = 1.0 / spec["rate"] if spec.get("rate") else 0.0
+        self.max_in_flight = spec.get("concurrency")
+        self.browser_profile = spec.get("browser_profile", "standard")
+        self.answer_spec = spec.get("answers") or {"randomize": True}
+
+        self.journal = open_journal(spec.get("job_id"))
+        self.breaker = CircuitBreaker()
+        self.policy = RetryPolicy()
+
+        # Scheduling state, guarded by the scheduler's lock
+        self.next_start = 0.0
+        self.in_flight = 0
+        self.charged = 0.0
+        self.exhausted = False
+        # Submissions backing off before a retry: (ready at, index, answers, retries)
+        self.retries = []
+        self.started = 0
+        self.already_done = self.journal.done_count if self.journal else 0
+        self.confirmed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.completed = 0
+
+        self._prepare()
+
+    def _prepare(self):
+        """
+        Answers and whatever the engine needs, set up once per form
+        """
+        if self.form == "farmer":
+            from form_answers import load_entry_mapping
+
+            entry = load_entry_mapping(form_url=self.url)
+            self.page_count = self._page_count(FARMER_PAGE_COUNT)
+        else:
+            from form_schema import load_schema, schema_page_count, schema_questions
+
+            schema = load_schema(self.url)
+            questions = self.questions = schema_questions(schema)
+            self.page_count = schema_page_count(schema)
+
+        spec = self.answer_spec
+        if spec.get("file"):
+            from answer_sources import stream_answers
+
+            rows = stream_answers(spec["file"], entry if self.form == "farmer" else None, spec.get("columns"),
+                                  self.count)
+            self._tasks = (
+                (i, answers) for i, answers in enumerate(rows) if not (self.journal and self.journal.is_done(i))
+            )
+            return
+
+        if spec.get("randomize", True):
+            from answer_generation import donation_answer_batch, farmer_answer_batch
+
+            if self.form == "farmer":
+                batch = farmer_answer_batch(entry, self.count, spec.get("weights"), spec.get("seed"))
+            else:
+                batch = donation_answer_batch(questions, self.count, spec.get("weights"), spec.get("seed"))
+            answers_for = batch.__getitem__
+        else:
+            answers = build_farmer_answers(entry) if self.form == "farmer" else build_donation_answers(questions)
+            answers_for = lambda i: answers
+        indices = self.journal.pending(self.count) if self.journal else range(self.count)
+        self._tasks = ((i, answers_for(i)) for i in indices)
+
+    def _page_count(self, default):
+        from http_submission import form_page_count
+
+        return form_page_count(self.url, default)
+
+    def has_work(self):
+        return not self.breaker.halted and (not self.exhausted or bool(self.retries))
+
+    def ready_at(self):
+        """
+        When the next submission of this form may start: after the rate
+        limit interval, the breaker's pause and, once only retries are left,
+        the earliest backoff
+        """
+        ready = max(self.next_start, self.breaker.open_until)
+        if self.exhausted and self.retries:
+            ready = max(ready, self.retries[0][0])
+        return ready
+
+    def next_task(self, now):
+        """
+        The next submission, a retry whose backoff is over first
+
+        Returns:
+            (index, answers, retries so far) or None
+        """
+        if self.retries and self.retries[0][0] <= now:
+            _, i, answers, retries = heapq.heappop(self.retries)
+            return i, answers, retries
+        task = next(self._tasks, None)
+        if task is None:
+            self.exhausted = True
+            return None
+        return task + (0,)
+
+    def retry_later(self, i, answers, retries, delay):
+        heapq.heappush(self.retries, (time.monotonic() + delay, i, answers, retries))
+
+    def average_seconds(self):
+        return self.busy_seconds / self.completed if self.completed else 1.0
+
+    def submit(self, i, answers, worker, retries=0):
+        """
+        One attempt of a submission with this form's engine. A failure to
+        retry comes back with `retry_in` set instead of being slept off here,
+        so the worker can take other work during the backoff.
+
+        Returns:
+            RetryResult
+        """
+        label = f"{self.name} {i+1}/{self.count}"
+        if self.engine == "http":
+            from http_submission import submit_answers
+
+            client = worker.http_client(self)
+            result = attempt_once(
+                lambda: submit_answers(client, self.url, answers, self.page_count)[0], self.policy, self.breaker, label,
+                retries,
+            )
+        else:
+            result = self._submit_selenium(i, answers, worker, label, retries)
+        # Counted once per submission, not per attempt
+        if result.retry_in is None:
+            METRICS.count_submission(result.outcome, engine=self.engine)
+        return result
+
+    def _submit_selenium(self, i, answers, worker, label, retries):
+        drivers = worker.drivers(self)
+        if self.form == "farmer":
+            from form_answers import build_prefill_url
+            from google_form_submission import _submit_prefilled_once
+
+            url = build_prefill_url(self.url, answers)
+            return attempt_once(
+                lambda: drivers.use(lambda driver: _submit_prefilled_once(driver, url)), self.policy, self.breaker,
+                label, retries,
+            )
+
+        from single_page_form import fill_donation_survey_once, selections_from_answers
+
+        # The donation survey is filled by clicking the options of the answers
+        selections = selections_from_answers(self.questions, answers)
+        return attempt_once(
+            lambda: drivers.use(
+                lambda driver: fill_donation_survey_once(driver, i, self.count, form_url=self.url,
+                                                         selections=selections)
+            ),
+            self.policy, self.breaker, label, retries,
+        )
+
+    def progress(self):
+        done = self.already_done + self.confirmed + self.failed
+        return {
+            "form": self.form,
+            "engine": self.engine,
+            "target": self.count,
+            "started": self.started,
+            "already_done": self.already_done,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "done": done,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "halted": self.breaker.halted,
+        }
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+
+
+class WorkerState:
+    """
+    Per-worker resources, one HTTP client / browser per form, kept for the
+    worker's lifetime
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._drivers = {}
+
+    def http_client(self, job):
+        if job.name not in self._clients:
+            from http_submission import FormHTTPClient
+
+            self._clients[job.name] = FormHTTPClient(pool_size=1)
+        return self._clients[job.name]
+
+    def drivers(self, job):
+        """
+        DriverManager of this worker's browser for the job
+        """
+        if job.name not in self._drivers:
+            from driver_manager import DriverManager
+            from driver_pool import pool_driver_factory
+
+            self._drivers[job.name] = DriverManager(
+                pool_driver_factory(job.browser_profile), name=f"{threading.current_thread().name}-{job.name}"
+            )
+        return self._drivers[job.name]
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        for drivers in self._drivers.values():
+            drivers.close()
+
+
+class Scheduler:
+    """
+    Runs several form jobs at the same time on one pool of workers.
+
+    Workers are shared with weighted fair sharing: the next submission always
+    goes to the form that has used the least worker time relative to its
+    weight. A slow form (e.g. a browser engine) is charged for the time its
+    submissions take, so it gets its share of the workers but can't hold on
+    to all of them and starve the fast ones. A submission backing off before
+    a retry is requeued rather than slept off on its worker, and a form whose
+    circuit breaker is open is passed over until it closes.
+
+    Args:
+        jobs: List of FormJob
+        workers: Number of submissions running at the same time over all forms
+        progress_interval: Seconds between progress lines
+    """
+
+    def __init__(self, jobs, workers=4, progress_interval=5.0):
+        names = [job.name for job in jobs]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Form names must be unique, got {names}")
+        self.jobs = jobs
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+
+    def _eligible(self, job, now):
+        # A form whose breaker is open (e.g. rate limited) waits without
+        # holding workers the other forms could use
+        if not job.has_work():
+            return False
+        if job.max_in_flight and job.in_flight >= job.max_in_flight:
+            return False
+        return job.ready_at() <= now
+
+    def _take(self):
+        """
+        Pick the next submission for a worker, waiting while every form with
+        work left is rate limited or at its concurrency limit
+
+        Returns:
+            (job, index, answers, retries, estimated seconds) or None once all
+            work is handed out
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                for job in sorted(
+                    (job for job in self.jobs if self._eligible(job, now)), key=lambda job: job.charged / job.weight
+                ):
+                    task = job.next_task(now)
+                    if task is None:
+                        continue
+                    estimate = job.average_seconds()
+                    job.charged += estimate
+                    job.in_flight += 1
+                    if not task[2]:
+                        job.started += 1
+                    job.next_start = max(job.next_start, now) + job.min_interval
+                    return (job,) + task + (estimate,)
+
+                waiting = [job for job in self.jobs if job.has_work()]
+                if not waiting:
+                    # Submissions still running may yet be requeued for a retry
+                    if any(job.in_flight for job in self.jobs):
+                        self._condition.wait()
+                        continue
+                    return None
+                # Sleep until a rate limited or backing off form may start
+                # again, or until a running submission finishes and frees a
+                # concurrency slot
+                wake_at = min(job.ready_at() for job in waiting)
+                self._condition.wait(max(0.01, wake_at - now) if wake_at > now else None)
+
+    def _finish(self, job, estimate, seconds, confirmed):
+        """
+        Account for one attempt, `confirmed` is None when the submission was
+        requeued for a retry
+        """
+        with self._condition:
+            job.in_flight -= 1
+            job.completed += 1
+            job.busy_seconds += seconds
+            # Replace the estimate charged at start by what it really took
+            job.charged += seconds - estimate
+            if confirmed:
+                job.confirmed += 1
+            elif confirmed is not None:
+                job.failed += 1
+            self._condition.notify_all()
+
+    def _worker(self):
+        state = WorkerState()
+        try:
+            while True:
+                taken = self._take()
+                if taken is None:
+                    break
+                job, i, answers, retries, estimate = taken
+                start = time.perf_counter()
+                try:
+                    result = job.submit(i, answers, state, retries)
+                    confirmed = result.confirmed
+                    if result.retry_in is not None:
+                        with self._condition:
+                            job.retry_later(i, answers, retries + 1, result.retry_in)
+                        confirmed = None
+                    elif job.journal:
+                        job.journal.record(i, result.journal_state)
+                except Exception as e:
+                    logger.exception(f"{job.name}: submission {i+1} failed: {e}")
+                    confirmed = False
+                self._finish(job, estimate, time.perf_counter() - start, confirmed)
+        finally:
+            state.close()
+            with self._condition:
+                self._condition.notify_all()
+
+    def progress(self):
+        with self._condition:
+            return {job.name: job.progress() for job in self.jobs}
+
+    def print_progress(self):
+        parts = []
+        for name, progress in self.progress().items():
+            parts.append(
+                f"{name}: {progress['done']}/{progress['target']} "
+                f"({progress['confirmed']} confirmed, {progress['failed']} failed, {progress['in_flight']} running)"
+            )
+            METRICS.set_gauge("scheduler_done", progress["done"], form=name)
+            METRICS.set_gauge("scheduler_confirmed", progress["confirmed"], form=name)
+        print(" | ".join(parts))
+
+    def _report_progress(self):
+        while not self._stopped.wait(self.progress_interval):
+            self.print_progress()
+
+    def run(self):
+        """
+        Run every job to completion
+
+        Returns:
+            Dict of form name -> progress dict
+        """
+        start = time.perf_counter()
+        reporter = threading.Thread(target=self._report_progress, name="scheduler-progress", daemon=True)
+        reporter.start()
+        threads = [threading.Thread(target=self._worker, name=f"scheduler-worker-{w}") for w in range(self.workers)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self._stopped.set()
+            for job in self.jobs:
+                job.close()
+        elapsed = time.perf_counter() - start
+
+        report = self.progress()
+        print(f"All forms completed in {elapsed:.2f}s")
+        for name, progress in report.items():
+            line = f"  {name}: {progress['confirmed']}/{progress['target']} confirmed, {progress['failed']} failed"
+            if progress["already_done"]:
+                line += f", {progress['already_done']} done by an earlier run"
+            if progress["halted"]:
+                line += f" (stopped: {progress['halted']})"
+            print(line)
+        self.print_progress()
+        write_run_metrics()
+        return report
+
+
+def load_job_file(path):
+    """
+    Read a job file (see EXAMPLE_JOB_FILE)
+
+    Returns:
+        Tuple of (list of FormJob, number of workers)
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    jobs = [FormJob(form_spec) for form_spec in spec["forms"]]
+    return jobs, int(spec.get("workers", 4))
+
+
+def run_job_file(path, workers=None, progress_interval=5.0):
+    jobs, file_workers = load_job_file(path)
+    return Scheduler(jobs, workers or file_workers, progress_interval).run()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Submit several forms at once from a job file")
+    parser.add_argument("job_file", nargs="?", help="JSON job file, see --example")
+    parser.add_argument("--workers", type=int, help="Overrides the job file's worker count")
+    parser.add_argument("--progress-interval", type=float, default=5.0)
+    parser.add_argument("--example", action="store_true", help="Print an example job file")
+    args = parser.parse_args()
+    if args.example or not args.job_file:
+        print(EXAMPLE_JOB_FILE)
+    else:
+        run_job_file(args.job_file, args.workers, args.progress_interval)
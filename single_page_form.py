@@ -2,20 +2,296 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+import logging
 import time
 import random
-import traceback
+from form_answers import DONATION_FORM_URL, build_donation_answers
+from form_schema import load_schema, page_schema, schema_questions
+from form_waits import CONFIRMED_SIGNALS, PageWaiter, WAIT_STATS
+from http_submission import submit_donation_survey_http
+from job_journal import FAILED, OK, UNCONFIRMED, open_journal
+from form_metrics import METRICS, phase, write_run_metrics
+from batch_fill import LISTITEM_SELECTOR, failed_questions, fill_page
+from browser_profiles import check_profile, make_lean_driver
+from driver_manager import DriverManager
+from retry_policy import (
+    ELEMENT_NOT_FOUND, FORM_CLOSED, CircuitBreaker, RetryPolicy, SubmissionFailure, call_with_retries, classify,
+    confirmation_failure,
+)
+from form_logging import PER_QUESTION, setup_logging
 
-def submit_donation_survey(num_submissions=1, randomize=False):
+logger = logging.getLogger(__name__)
+
+# Form URL
+FORM_URL = DONATION_FORM_URL
+
+def _schema_selections(questions, randomize, selections=None):
+    """
+    Option index to select for every question with options, chosen from the
+    form schema by the same rules as the HTTP engine (see
+    form_answers.build_donation_answers). `selections` (question index ->
+    option index, e.g. from a plan) override the usual choice.
+    """
+    answers = build_donation_answers(questions, randomize)
+    chosen = {
+        question_index: question["options"].index(answers[question["entry"]])
+        for question_index, question in enumerate(questions) if question["entry"] in answers
+    }
+    chosen.update(selections or {})
+    return chosen
+
+def _select_options(driver, chosen):
+    """
+    Click the chosen option (question index -> option index, see
+    _schema_selections) of every question, question by question
+    """
+    # Get all questions (each question is in a separate div with role="listitem")
+    questions = driver.find_elements(By.CSS_SELECTOR, 'div[role="listitem"]')
+    logger.info(f"Found {len(questions)} questions on the form")
+    
+    # Process each question
+    for question_index, question in enumerate(questions):
+        try:
+            # Get the radio button options for this question
+            options_elements = question.find_elements(By.CSS_SELECTOR, 'div[role="radio"]')
+            
+            option_index = chosen.get(question_index)
+            if options_elements and option_index is not None and option_index < len(options_elements):
+                option_to_select = options_elements[option_index]
+                
+                # Scroll to the option
+                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", option_to_select)
+                
+                # Click the option
+                try:
+                    option_to_select.click()
+                    logger.info(f"Selected option for question {question_index+1}", extra=PER_QUESTION)
+                except Exception as e:
+                    logger.info(f"Direct click failed: {e}", extra=PER_QUESTION)
+                    driver.execute_script("arguments[0].click();", option_to_select)
+                    logger.info(f"JavaScript click for question {question_index+1}", extra=PER_QUESTION)
+            elif options_elements:
+                logger.warning(f"Question {question_index+1} doesn't match the form schema")
+                METRICS.count_page_error("question")
+            else:
+                logger.info(f"No options found for question {question_index+1}", extra=PER_QUESTION)
+                
+        except Exception as e:
+            logger.warning(f"Error processing question {question_index+1}: {e}")
+            METRICS.count_page_error("question")
+
+def _batch_select_options(driver, questions, chosen):
+    """
+    Select the chosen options (see _schema_selections) of every question with
+    one injected script: one WebDriver round trip instead of several per
+    question. Options are picked by their schema label, so an option the
+    page doesn't have shows up as a failed question.
+    """
+    labels = {question_index: questions[question_index]["options"][option_index]
+              for question_index, option_index in chosen.items()}
+    results = fill_page(driver, labels, rest=None, question_selector=LISTITEM_SELECTOR)
+    logger.info(f"Selected options for {len(results) - len(failed_questions(results))}/{len(results)} questions")
+    for result in failed_questions(results):
+        logger.warning(f"Error processing question {result['question']+1}: {result['error']}")
+        METRICS.count_page_error("question")
+
+def fill_donation_survey_once(driver, i, num_submissions, randomize=False, form_url=FORM_URL, batch=False,
+                              selections=None):
+    """
+    One attempt at filling in and submitting the Donation Survey, run it
+    with retry_policy.call_with_retries
+
+    Args:
+        driver: WebDriver to use, it is left open for the next submission
+        i: Index of this submission (for logging)
+        num_submissions: Total number of submissions (for logging)
+        randomize: Whether to randomize the answers
+        form_url: URL of the form
+        batch: Select all answers with one injected script instead of
+            clicking question by question
+        selections: Optional dict of question index -> option index to
+            answer with (see planned_selections)
+
+    Returns:
+        True if the submission was confirmed, False if the submit click went
+        through without a confirmation
+
+    Raises:
+        SubmissionFailure: when nothing was submitted (the form didn't load,
+            no submit button, rate limited) or the form is closed
+    """
+    logger.info(f"Starting submission {i+1}/{num_submissions}")
+    
+    # Navigate to the form
+    with phase("page_load"):
+        driver.get(form_url)
+    
+    # Wait for the form to load
+    waiter = PageWaiter(driver)
+    try:
+        waiter.form_loaded()
+    except TimeoutException as e:
+        METRICS.count_page_error("form_load")
+        raise classify(e, driver) from e
+    
+    # The questions and options come from the form schema, checked against
+    # the loaded page so an edited form is noticed
+    questions = schema_questions(page_schema(form_url, driver.page_source))
+    chosen = _schema_selections(questions, randomize, selections)
+    with phase("fill", page="1", mode="batch" if batch else "per_question"):
+        if batch:
+            _batch_select_options(driver, questions, chosen)
+        else:
+            _select_options(driver, chosen)
+
+    # Scroll to the bottom of the page
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    
+    # Find and click submit button
+    submit_button = None
+    state = FAILED
+    failure = None
+    try:
+        submit_button = waiter.clickable("submit", (By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span'))
+        
+        if submit_button:
+            logger.info("Found the Submit button")
+            
+            # Scroll to make sure it's visible
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", submit_button)
+            
+            # Click the button
+            with phase("submit_click"):
+                try:
+                    submit_button.click()
+                except Exception:
+                    driver.execute_script("arguments[0].click();", submit_button)
+            
+            logger.info("Clicked submit button")
+            state = UNCONFIRMED
+            
+            # Check if submission was successful
+            try:
+                with phase("confirmation"):
+                    signal = waiter.confirmation()
+                if signal in CONFIRMED_SIGNALS:
+                    logger.info(f"Submission {i+1} confirmed successful ({signal})")
+                    state = OK
+                else:
+                    logger.warning(f"Submission {i+1} not recorded ({signal})")
+                    METRICS.count_page_error("confirmation")
+                    failure = confirmation_failure(signal)
+                    if not failure.submitted:
+                        state = FAILED
+            except TimeoutException:
+                logger.warning(f"Could not confirm submission {i+1}")
+                METRICS.count_page_error("confirmation")
+        else:
+            logger.warning("Could not find submit button")
+            failure = SubmissionFailure(ELEMENT_NOT_FOUND, "no submit button")
+    except Exception as e:
+        logger.warning(f"Error with submit button: {e}")
+        METRICS.count_page_error("submit")
+        failure = classify(e, driver, submitted=state == UNCONFIRMED)
+    
+    # Raise failures before the submit click classified so call_with_retries
+    # retries them, False would mean submitted without a confirmation
+    if failure is not None and (failure.kind == FORM_CLOSED or state == FAILED):
+        raise failure
+    return state == OK
+
+def planned_selections(num_submissions, plan, form_url=FORM_URL, seed=None, randomize=True):
+    """
+    Answer the donation survey according to a plan (see
+    response_planner.plan_codes). The questions come from the form schema.
+
+    Returns:
+        Function of the submission index returning its dict of question
+        index -> option index, decoded one submission at a time
+    """
+    from response_planner import plan_donation_responses
+
+    questions = schema_questions(load_schema(form_url))
+    kept = [q for q, question in enumerate(questions) if question["options"]]
+    planned = plan_donation_responses(questions, num_submissions, plan, seed=seed, randomize=randomize)
+    return lambda i: dict(zip(kept, planned.codes[i].tolist()))
+
+def selections_from_answers(questions, answers):
+    """
+    Turn one response's answer dict (entry.XXXXXXX -> option label) into the
+    question index -> option index dict the fill functions take
+
+    Args:
+        questions: Questions of the form in order (see form_schema.schema_questions)
+        answers: Answer dict, questions it leaves out are not in the result
+    """
+    chosen = {}
+    for question_index, question in enumerate(questions):
+        label = answers.get(question["entry"])
+        if label is None:
+            continue
+        if label not in question["options"]:
+            raise ValueError(f"Unknown option {label!r} for {question['entry']}")
+        chosen[question_index] = question["options"].index(label)
+    return chosen
+
+def answer_selections(answers, form_url=FORM_URL):
+    """
+    Answer the donation survey with given answer dicts (e.g. the rows leased
+    by distributed.py), see selections_from_answers
+
+    Returns:
+        Function of the submission index returning its dict of question
+        index -> option index
+    """
+    questions = schema_questions(load_schema(form_url))
+    return lambda i: selections_from_answers(questions, answers[i])
+
+def submit_donation_survey(num_submissions=1, randomize=False, form_url=FORM_URL, engine="selenium", job_id=None,
+                           browser_profile="standard", batch=False, dry_run=None, recycle_policy=None, plan=None,
+                           answers=None, retry_policy=None):
     """
     Submit the Donation Survey Google Form multiple times by directly interacting with form elements
     
     Args:
         num_submissions: Number of times to submit the form
         randomize: Whether to randomize the answers
+        form_url: URL of the form
+        engine: "selenium" to fill the form in Chrome, or "http" to post the
+            answers straight to the formResponse endpoint (uses the cached form
+            schema for the entry ids)
+        job_id: Optional job id. Progress is journaled under it and a re-run
+            with the same job id skips the submissions already done.
+        browser_profile: "standard", or "lean" to block images/fonts/media,
+            use the eager page load strategy and a small viewport
+        batch: Select all answers with one injected script (one round trip
+            instead of several per question)
+        dry_run: Path of a .npy or .csv file. Instead of submitting, the
+            answers are generated and written there (no browser or network)
+            and per-question frequency tables are printed.
+        recycle_policy: RecyclePolicy deciding after how many submissions or
+            how much memory the browser is replaced, defaults to RecyclePolicy()
+        plan: Optional quotas and conditional rules the answers must meet
+            exactly (a dict or JSON file, see response_planner.plan_codes)
+        answers: Optional sequence of answer dicts (entry.XXXXXXX -> option
+            label) used instead of choosing the options here
+        retry_policy: RetryPolicy deciding which failures are retried and
+            how long to back off, defaults to RetryPolicy()
+
+    Returns:
+        Number of confirmed submissions, or with dry_run the dict of question
+        name -> {option label: count}
     """
+    if dry_run:
+        from dry_run import dry_run_donation
+
+        return dry_run_donation(num_submissions, dry_run, randomize, form_url, plan=plan)
+    if engine == "http":
+        return submit_donation_survey_http(num_submissions=num_submissions, randomize=randomize, form_url=form_url,
+                                           job_id=job_id, plan=plan, answers=answers)
+    check_profile(browser_profile)
+
     # Setup Chrome options
     chrome_options = Options()
     chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
@@ -27,212 +303,73 @@ def submit_donation_survey(num_submissions=1, randomize=False):
     # Uncomment for headless mode
     # chrome_options.add_argument("--headless=new")
     
-    # Initialize WebDriver
+    def make_driver():
+        if browser_profile == "lean":
+            return make_lean_driver(headless=False)
+        return webdriver.Chrome(options=chrome_options)
+
+    # Initialize WebDriver. The manager replaces it when it gets old, bloated
+    # or dies
+    drivers = DriverManager(make_driver, recycle_policy, "donation")
     try:
-        driver = webdriver.Chrome(options=chrome_options)
+        drivers.get()
     except Exception as e:
-        print(f"Error initializing WebDriver: {e}")
-        return
-    
-    # Form URL
-    FORM_URL = "https://docs.google.com/forms/d/e/1FAIpQLSclLS6L0_UWKz4maZhKNeVa0HjUoZkg64JHVaHCzXhkYjHCpA/viewform"
-    
-    # Define options for each question
-    options = {
-        'awareness': [
-            "never heard of it", 
-            "somewhat familiar", 
-            "very familiar"
-        ],
-        'motivation': [
-            "Religious beliefs", 
-            "Personal connection", 
-            "Social responsibility", 
-            "Tax benefits"
-        ],
-        'frequency': [
-            "Never", 
-            "Occasionally (no specific frequented)", 
-            "Monthly", 
-            "Quarterly", 
-            "Annually"
-        ],
-        'donation_type': [
-            "Clothing and shoes", 
-            "Food items", 
-            "Monetary donations", 
-            "Personal care items", 
-            "Educational supplies"
-        ],
-        'donation_method': [
-            "Physical visiting", 
-            "Online donation", 
-            "Through intermediaries"
-        ],
-        'experience': [
-            "Very positive", 
-            "Positive", 
-            "Neutral", 
-            "Negative", 
-            "Very negative"
-        ],
-        'organization_needs': [
-            "Organization needs.", 
-            "Staff competence", 
-            "Donation usage transparency", 
-            "Facility conditions", 
-            "Number of children served"
-        ],
-        'challenges': [
-            "Lack of information about orphanages", 
-            "Inconvenient donation process", 
-            "Limited donation options", 
-            "Concerns about donation use", 
-            "Time constraints"
-        ],
-        'future_donation': [
-            "Yes, definitely", 
-            "Probably", 
-            "Not sure", 
-            "Probably not", 
-            "Definitely not"
-        ],
-        'payment_options': [
-            "More payment options", 
-            "Improved online platform", 
-            "Regular updates on impact", 
-            "Easier donation process", 
-            "Tax deduction documentation"
-        ]
-    }
-    
-    # Default selections (indices in the options arrays)
-    default_selections = {
-        'awareness': 0,  # "never heard of it"
-        'motivation': 0,  # "Religious beliefs"
-        'frequency': 1,  # "Occasionally (no specific frequented)"
-        'donation_type': 0,  # "Clothing and shoes"
-        'donation_method': 0,  # "Physical visiting"
-        'experience': 2,  # "Neutral"
-        'organization_needs': 0,  # "Organization needs."
-        'challenges': 0,  # "Lack of information about orphanages"
-        'future_donation': 0,  # "Yes, definitely"
-        'payment_options': 0   # "More payment options"
-    }
+        # Raised rather than reported as 0 confirmed, so a caller like a
+        # distributed worker knows nothing was tried
+        logger.error(f"Error initializing WebDriver: {e}")
+        raise
     
     successful_submissions = 0
+    journal = open_journal(job_id)
+    if journal:
+        # Count the confirmed submissions of the previous runs too
+        successful_submissions = journal.confirmed_count
+    pending = journal.pending(num_submissions) if journal else range(num_submissions)
+    selections_for = lambda i: None
+    if answers is not None:
+        selections_for = answer_selections(answers, form_url)
+    elif plan is not None:
+        selections_for = planned_selections(num_submissions, plan, form_url, randomize=randomize)
+    policy = retry_policy or RetryPolicy()
+    # Pauses the run while most submissions are failing
+    breaker = CircuitBreaker()
     
-    for i in range(num_submissions):
-        try:
-            print(f"Starting submission {i+1}/{num_submissions}")
-            
-            # Navigate to the form
-            driver.get(FORM_URL)
-            
-            # Wait for the form to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "form"))
-            )
-            
-            # Get all questions (each question is in a separate div with role="listitem")
-            questions = driver.find_elements(By.CSS_SELECTOR, 'div[role="listitem"]')
-            print(f"Found {len(questions)} questions on the form")
-            
-            # Process each question
-            # Process each question
-            for question_index, question in enumerate(questions):
-                try:
-                    # Get the radio button options for this question
-                    options_elements = question.find_elements(By.CSS_SELECTOR, 'div[role="radio"]')
-                    
-                    if options_elements:
-                        # Determine which option to select
-                        if question_index == 8:  # Check if it's the ninth question (index 8)
-                            # Select "Yes, definitely" for the ninth question
-                            option_to_select = options_elements[0]  # Assuming "Yes, definitely" is the first option
-                        else:
-                            if randomize:
-                                # Select a random option
-                                option_to_select = random.choice(options_elements)
-                            else:
-                                # Use the default selection based on question index
-                                field_name = list(default_selections.keys())[question_index]
-                                option_index = default_selections[field_name]
-                                
-                                # Make sure the option index is valid
-                                if option_index >= len(options_elements):
-                                    option_index = 0
-                                
-                                option_to_select = options_elements[option_index]
-                        
-                        # Scroll to the option
-                        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", option_to_select)
-                        time.sleep(0.2)
-                        
-                        # Click the option
-                        try:
-                            option_to_select.click()
-                            print(f"Selected option for question {question_index+1}")
-                        except Exception as e:
-                            print(f"Direct click failed: {e}")
-                            driver.execute_script("arguments[0].click();", option_to_select)
-                            print(f"JavaScript click for question {question_index+1}")
-                    else:
-                        print(f"No options found for question {question_index+1}")
-                        
-                except Exception as e:
-                    print(f"Error processing question {question_index+1}: {e}")
-
-
-            # Scroll to the bottom of the page
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.5)
-            
-            # Find and click submit button
-            submit_button = None
-            try:
-                submit_button = driver.find_element(By.XPATH, '//*[@id="mG61Hd"]/div[2]/div/div[3]/div/div[1]/div/span/span')
-                
-                if submit_button:
-                    print("Found the Submit button")
-                    
-                    # Scroll to make sure it's visible
-                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", submit_button)
-                    time.sleep(0.5)
-                    
-                    # Click the button
-                    try:
-                        submit_button.click()
-                    except:
-                        driver.execute_script("arguments[0].click();", submit_button)
-                    
-                    print("Clicked submit button")
-                    time.sleep(2)
-                    
-                    # Check if submission was successful
-                    current_url = driver.current_url
-                    if "formResponse" in current_url or "closedform" in current_url:
-                        print(f"Submission {i+1} confirmed successful")
-                        successful_submissions += 1
-                    else:
-                        print(f"Could not confirm submission {i+1}")
-                else:
-                    print("Could not find submit button")
-            except Exception as e:
-                print(f"Error with submit button: {e}")
-            
-            # Wait between submissions
-            time.sleep(random.uniform(1, 2))
-            
-        except Exception as e:
-            print(f"Error during submission {i+1}: {e}")
-            traceback.print_exc()
+    for i in pending:
+        result = call_with_retries(
+            lambda: drivers.use(
+                lambda driver: fill_donation_survey_once(driver, i, num_submissions, randomize, form_url, batch,
+                                                         selections_for(i))
+            ),
+            policy,
+            breaker,
+            f"Submission {i+1}/{num_submissions}",
+        )
+        if not result.attempts:
+            logger.error(f"Stopping: {breaker.halted}")
+            break
+        METRICS.count_submission(result.outcome, engine="selenium")
+        if result.confirmed:
+            successful_submissions += 1
+        # A submission whose submit click may have gone through is recorded
+        # as unconfirmed, so it isn't sent again on resume
+        if journal:
+            journal.record(i, result.journal_state)
+        
+        # Wait between submissions
+        time.sleep(random.uniform(1, 2))
     
     # Close the browser
-    driver.quit()
+    drivers.close()
+    if journal:
+        journal.close()
     
     print(f"All submissions completed! Successful: {successful_submissions}/{num_submissions}")
+    for name, stats in WAIT_STATS.summary().items():
+        print(f"Wait {name}: {stats}")
+    write_run_metrics()
+    return successful_submissions
 
 if __name__ == "__main__":
+    setup_logging()
     # Set number of submissions and whether to randomize
     submit_donation_survey(num_submissions=25, randomize=True)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import pytest
+
+import distributed
+from mock_form_server import DONATION_FORM_ID, MockFormServer
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = MockFormServer().start()
+    coordinator = distributed.Coordinator("donation", server.form_url(DONATION_FORM_ID), 30, chunk_size=10,
+                                          randomize=True, seed=1)
+    coordinator_server = distributed.CoordinatorServer(coordinator, "127.0.0.1", 0).start()
+    coordinator.url = coordinator_server.url
+    yield coordinator
+    coordinator_server.stop()
+    server.stop()
+
+
+def test_failed_chunk_is_leased_again(coordinator, monkeypatch):
+    calls = []
+
+    def submit_chunk(job, answers):
+        calls.append(len(answers))
+        if len(calls) == 1:
+            raise RuntimeError("could not start the browser")
+        return len(answers)
+
+    monkeypatch.setattr(distributed, "submit_chunk", submit_chunk)
+    stats = distributed.run_worker(coordinator.url, "worker", poll_interval=0.01)
+
+    assert len(calls) == 4
+    assert coordinator.chunks[0].leases == 2
+    assert stats["successful"] == stats["attempted"] == 30
+    report = coordinator.report()
+    assert report["finished"] and report["successful"] == 30
+
+
+def test_worker_gives_up_and_leaves_the_chunk_pending(coordinator, monkeypatch):
+    def submit_chunk(job, answers):
+        raise RuntimeError("could not start the browser")
+
+    monkeypatch.setattr(distributed, "submit_chunk", submit_chunk)
+    stats = distributed.run_worker(coordinator.url, "worker", poll_interval=0.01, max_failures=2)
+
+    assert stats["chunks"] == 0
+    assert all(chunk.state == distributed.PENDING for chunk in coordinator.chunks)
+    assert not coordinator.report()["finished"]
@@ -0,0 +1,26 @@
+import driver_manager
+from driver_manager import DriverManager, RecyclePolicy
+
+
+class FakeDriver:
+    window_handles = ["main"]
+
+    def quit(self):
+        pass
+
+
+def test_memory_is_read_at_most_once_per_interval(monkeypatch):
+    readings = []
+    monkeypatch.setattr(driver_manager, "process_tree_rss_bytes", lambda pid: readings.append(pid) or 2**20)
+    clock = [0.0]
+    monkeypatch.setattr(driver_manager.time, "monotonic", lambda: clock[0])
+
+    policy = RecyclePolicy(max_submissions=None, prewarm=False, rss_check_interval=5.0)
+    with DriverManager(FakeDriver, policy) as drivers:
+        for _ in range(10):
+            drivers.use(lambda driver: True)
+        assert len(readings) == 1
+        clock[0] = 5.0
+        drivers.use(lambda driver: True)
+        assert len(readings) == 2
+        assert drivers.rss_mb == 1
@@ -0,0 +1,28 @@
+import urllib.request
+
+import pytest
+
+from form_answers import build_prefill_url
+from mock_form_server import FARMER_FORM_ID, MockFormServer, entry_id
+
+
+@pytest.fixture
+def server():
+    server = MockFormServer().start()
+    yield server
+    server.stop()
+
+
+def test_prefill_url_without_query_string(server):
+    entry = f"entry.{entry_id(FARMER_FORM_ID, 0, 0)}"
+    url = build_prefill_url(server.form_url(FARMER_FORM_ID), {entry: "Rural"})
+
+    assert url == f"{server.form_url(FARMER_FORM_ID)}?{entry}=Rural"
+    with urllib.request.urlopen(url) as response:
+        assert response.status == 200
+
+
+def test_prefill_url_with_query_string():
+    url = build_prefill_url("https://example.com/viewform?usp=pp_url", {"entry.1": "a b"})
+
+    assert url == "https://example.com/viewform?usp=pp_url&entry.1=a+b"